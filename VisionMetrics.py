@@ -1,12 +1,2343 @@
-import cv2
-import numpy as np
-from tkinter import Tk, filedialog, Button, Canvas, Label, Frame, Radiobutton, StringVar, Entry, messagebox, colorchooser, Checkbutton, IntVar, Listbox
-from matplotlib.colors import to_hex
-from PIL import Image, ImageTk, ImageFont, ImageDraw
+import glob
+import hashlib
+import importlib
+import itertools
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from bisect import bisect_right
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+from tkinter import Tk, filedialog, Button, Canvas, Label, Frame, Radiobutton, StringVar, Entry, messagebox, colorchooser, Checkbutton, IntVar, OptionMenu, Scrollbar, Toplevel, Scale, TclError
 from math import atan2, degrees
+from urllib.parse import parse_qs, urlsplit
+
+
+class DeferredModule:
+    """Stand-in for a heavy module that is only imported when first used.
+
+    The first attribute access imports the module (waiting for it if
+    import_in_background is already importing it) and puts the real module in
+    this file's globals under alias, so later accesses cost nothing extra.
+    """
+
+    def __init__(self, name, alias):
+        self._name = name
+        self._alias = alias
+
+    def load(self):
+        module = importlib.import_module(self._name)
+        globals()[self._alias] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+
+# OpenCV, NumPy and Pillow take most of the start-up time; the window is built without them
+cv2 = DeferredModule("cv2", "cv2")
+np = DeferredModule("numpy", "np")
+Image = DeferredModule("PIL.Image", "Image")
+ImageTk = DeferredModule("PIL.ImageTk", "ImageTk")
+ImageFont = DeferredModule("PIL.ImageFont", "ImageFont")
+ImageDraw = DeferredModule("PIL.ImageDraw", "ImageDraw")
+ImageColor = DeferredModule("PIL.ImageColor", "ImageColor")
+DEFERRED_MODULES = ("np", "cv2", "Image", "ImageTk", "ImageFont", "ImageDraw", "ImageColor")
+
+
+def import_in_background():
+    """Import the deferred modules on a worker thread while the GUI is built and shown."""
+    def run():
+        for alias in DEFERRED_MODULES:
+            module = globals()[alias]
+            if isinstance(module, DeferredModule):
+                module.load()
+
+    threading.Thread(target=run, name="import_modules", daemon=True).start()
+
+MEASUREMENT_SET_VERSION = 1
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
+PYRAMID_MIN_SIZE = 512  # Stop halving once the longest side is below this
+SEQUENCE_PREFETCH = 3  # Images decoded ahead of and behind the current one
+SEQUENCE_CACHE_BYTES = 2 * 1024 ** 3
+VIDEO_BUFFER_FRAMES = 32  # Decoded frames kept in memory while scrubbing a video
+VIDEO_POLL_MS = 15  # How often a frame that is still decoding is checked for
+PRIORITY_INTERACTIVE = 0  # Worker pool work the operator is waiting for
+PRIORITY_BACKGROUND = 1  # Prefetching, export and other work nobody is waiting for yet
+SNAP_RADIUS = 12  # Screen pixels searched around a click for an edge
+SNAP_MIN_GRADIENT = 40  # Weakest Sobel magnitude accepted as an edge
+CIRCLE_FIT_MIN_CONDITION = 1e-9  # Smallest singular value, relative to the largest, of a usable circle fit
+DRAG_RADIUS = 8  # Screen pixels around an endpoint or vertex that grab it for dragging
+GRADIENT_TILE_SIZE = 256
+GRADIENT_CACHE_TILES = 256  # About 64 MB of int16 gradient tiles
+PROFILE_WIDTH = 5  # Default pixels averaged across a line for its intensity profile
+PROFILE_MIN_EDGE = 8  # Weakest slope, in grey levels per pixel, taken as an edge on a profile
+PROFILE_CACHE_SIZE = 256
+RULER_MIN_CORRELATION = 0.5  # Weakest autocorrelation peak, relative to lag 0, taken as the tick period
+CALIBRATION_DETECT_SIZE = 1600  # Longest side of the pyramid level searched for a checkerboard
+REMAP_GRID_STEP = 8  # Undistortion tables hold one entry every this many pixels
+REMAP_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "VisionMetrics")
+DETECT_TILE_SIZE = 1024
+DETECT_TILE_OVERLAP = 96  # Largest circle radius found; features up to this size are never cut by a seam
+DETECT_MIN_SIZE = 8  # Smallest circle diameter or contour side, in pixels
+DETECT_MIN_LENGTH = 40  # Shortest line segment kept, in pixels
+ALIGN_SEARCH_SIZE = 1024  # Longest side of the pyramid level searched for the fiducial
+ALIGN_MIN_TEMPLATE = 16  # Smallest fiducial side, in pixels of the level it is matched on
+ALIGN_MIN_SCORE = 0.5  # Weakest normalised correlation accepted as a match
+ALIGN_ORB_FEATURES = 500
+ALIGN_MIN_INLIERS = 8
+ALIGN_ANGLE_STEP = 0.004  # Radians (about 0.25°) either side of the feature rotation in the score parabola
+ALIGN_ROTATION_SIGMAS = 3  # Standard errors a fitted fiducial rotation must exceed to be applied
+LOUPE_SIZE = 160  # Side of the loupe inset in screen pixels
+LOUPE_MAGNIFICATION = 4  # Loupe zoom relative to the view
+LOUPE_OFFSET = 24  # Gap between the cursor and the loupe
+DISPLAY_DEFAULTS = {"window": 255, "level": 127.5, "gamma": 1.0, "clahe": 0.0}  # adjust_display with no effect
+COMPARE_CHECKER_SIZE = 64  # Side of the compare checkerboard squares in screen pixels
+STATS_BINS = 40  # Histogram bins of the statistics panel
+STATS_GROUPS = {"line": 1, "angle": 0, "polygon": 2, "polyline": 1}  # Group -> power of mm/pixel its values scale with
+TOLERANCE_PASS_COLOR = "green"
+TOLERANCE_FAIL_COLOR = "red"
+HISTORY_ROWS = 10  # Rows of the history list drawn at a time
+HISTORY_ROW_HEIGHT = 16
+HISTORY_GROUPS = ("line", "angle", "shape")  # Measurement lists in history order; also their canvas tag prefixes
+TILE_SIZE = 256  # Side of the tiles the browser viewer loads
+TILE_CACHE_BYTES = 256 * 1024 ** 2  # Encoded tiles kept in memory by the tile server
+TILE_JPEG_QUALITY = 90
+TILE_SERVER_PORT = 8765
+TILE_VIEWER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "VisionMetrics_viewer.html")
+HUD_FPS_WINDOW = 1.0  # Seconds of frames averaged for the HUD frame rate
+RECORDED_EVENTS = (
+    "<ButtonPress-1>", "<ButtonRelease-1>", "<ButtonPress-2>", "<ButtonRelease-2>",
+    "<ButtonPress-3>", "<MouseWheel>", "<Motion>",
+)
+INPUT_SESSION_VERSION = 1
+
+
+def line_distance(p1, p2, scale_factor=None):
+    """Return the pixel length of a line and its length in mm (None if uncalibrated)."""
+    pixel_distance = float(np.hypot(p2[0] - p1[0], p2[1] - p1[1]))
+    return pixel_distance, (pixel_distance * scale_factor if scale_factor else None)
+
+
+def angle_at_vertex(p1, p2, p3):
+    """Return the smaller angle in degrees at vertex p2 between p1 and p3."""
+    angle_rad = atan2(p3[1] - p2[1], p3[0] - p2[0]) - atan2(p1[1] - p2[1], p1[0] - p2[0])
+    angle_deg = abs(degrees(angle_rad))
+    if angle_deg > 180:
+        angle_deg = 360 - angle_deg
+    return angle_deg
+
+
+def save_measurement_set(path, lines, angles, scale_factor, line_color="blue", text_color="yellow", fiducial=None,
+                         shapes=()):
+    """Save lines, angles, shapes and calibration to a JSON measurement set.
+
+    fiducial is an optional (x0, y0, x1, y1) box used to align the set to other parts.
+    """
+    data = {
+        "version": MEASUREMENT_SET_VERSION,
+        "scale_factor": scale_factor,
+        "line_color": line_color,
+        "text_color": text_color,
+        "lines": [{"p1": list(start), "p2": list(end)} for start, end, _ in lines],
+        "angles": [{"p1": list(p1), "p2": list(p2), "p3": list(p3)} for p1, p2, p3, _ in angles],
+        "shapes": [{"kind": kind, "points": np.asarray(points, float).tolist()} for kind, points, _ in shapes],
+    }
+    if fiducial is not None:
+        data["fiducial"] = [float(v) for v in fiducial]
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+def load_measurement_set(path, scale_factor=None):
+    """Load a JSON measurement set and recompute its values.
+
+    Returns a dict with "lines" as (start, end, distance_mm), "angles" as
+    (p1, p2, p3, angle_deg) and "shapes" as (kind, points, metrics), the same
+    tuples MetrologyApp keeps. A scale_factor
+    passed in overrides the calibration stored in the file.
+    """
+    with open(path) as f:
+        data = json.load(f)
+    if data.get("version", 1) > MEASUREMENT_SET_VERSION:
+        raise ValueError(f"Unsupported measurement set version: {data['version']}")
+    if scale_factor is None:
+        scale_factor = data.get("scale_factor")
+    lines = []
+    for item in data.get("lines", []):
+        start, end = [float(v) for v in item["p1"]], [float(v) for v in item["p2"]]
+        lines.append((start, end, line_distance(start, end, scale_factor)[1]))
+    angles = []
+    for item in data.get("angles", []):
+        p1, p2, p3 = ([float(v) for v in item[key]] for key in ("p1", "p2", "p3"))
+        angles.append((p1, p2, p3, angle_at_vertex(p1, p2, p3)))
+    shapes = []
+    for item in data.get("shapes", []):
+        points = [[float(x), float(y)] for x, y in item["points"]]
+        shapes.append((item["kind"], points, shape_metrics(item["kind"], points)))
+    data.update(lines=lines, angles=angles, shapes=shapes, scale_factor=scale_factor)
+    return data
+
+
+def load_font(size=20, font_path="arial.ttf"):
+    """Load a TrueType font with degree symbol support, falling back to Pillow's default."""
+    try:
+        return ImageFont.truetype(font_path, size=size)
+    except OSError:
+        return ImageFont.load_default()
+
+
+def draw_angle_arc(draw, center, start, end, fill, thickness=1):
+    """Draw an arc representing the smaller angle with a Pillow ImageDraw."""
+    # Calculate angles in radians
+    start_angle = atan2(start[1] - center[1], start[0] - center[0])
+    end_angle = atan2(end[1] - center[1], end[0] - center[0])
+
+    # Normalize angles to range [0, 2π)
+    if start_angle < 0:
+        start_angle += 2 * np.pi
+    if end_angle < 0:
+        end_angle += 2 * np.pi
+
+    # Calculate the angle span and ensure it corresponds to the smaller arc
+    angle_span = end_angle - start_angle
+    if angle_span < 0:
+        angle_span += 2 * np.pi
+    if angle_span > np.pi:
+        start_angle, end_angle = end_angle, start_angle
+
+    # Set the radius of the arc
+    radius = int(min(
+        np.hypot(start[0] - center[0], start[1] - center[1]),
+        np.hypot(end[0] - center[0], end[1] - center[1])
+    ) * 0.25)
+
+    bbox = [
+        (center[0] - radius, center[1] - radius),
+        (center[0] + radius, center[1] + radius)
+    ]
+    draw.arc(bbox, start=np.degrees(start_angle), end=np.degrees(end_angle), fill=fill, width=thickness)
+
+
+def annotate_image(image, lines, angles, line_color="blue", text_color="yellow", font=None, shapes=(),
+                   scale_factor=None):
+    """Return a BGR copy of image with lines, angles, shapes and their values burned in."""
+    # Draw straight onto the BGR pixels with swapped colours, which saves two
+    # full-frame colour conversions on large images.
+    def bgr(color):
+        r, g, b = ImageColor.getrgb(color)
+        return b, g, r
+
+    line_fill, text_fill = bgr(line_color), bgr(text_color)
+    pil_image = Image.fromarray(np.ascontiguousarray(image))
+    draw = ImageDraw.Draw(pil_image)
+    if font is None:
+        font = load_font()
+
+    # Draw lines and distances
+    for start, end, distance in lines:
+        start_px = (int(start[0]), int(start[1]))
+        end_px = (int(end[0]), int(end[1]))
+        draw.line([start_px, end_px], fill=line_fill, width=2)
+        if distance:
+            midpoint = ((start_px[0] + end_px[0]) // 2, (start_px[1] + end_px[1]) // 2)
+            draw.text(midpoint, f"{distance:.2f} mm", fill=text_fill, font=font)
+
+    # Draw angles and arcs
+    for p1, p2, p3, angle in angles:
+        p1_px = (int(p1[0]), int(p1[1]))
+        p2_px = (int(p2[0]), int(p2[1]))
+        p3_px = (int(p3[0]), int(p3[1]))
+        draw.line([p2_px, p1_px], fill=line_fill, width=2)
+        draw.line([p2_px, p3_px], fill=line_fill, width=2)
+        draw_angle_arc(draw, p2_px, p1_px, p3_px, line_fill)
+
+        # Add the angle text with a degree symbol
+        text_position = (p2_px[0] + 20, p2_px[1] - 20)
+        draw.text(text_position, f"{angle:.2f}°", fill=text_fill, font=font)
+
+    # Draw polygons and polylines, each as a single path
+    for kind, points, metrics in shapes:
+        path = [tuple(p) for p in np.asarray(points, float).tolist()]
+        if kind == "polygon":
+            path.append(path[0])
+        draw.line(path, fill=line_fill, width=2, joint="curve")
+        centroid = (int(metrics["centroid"][0]), int(metrics["centroid"][1]))
+        draw.text(centroid, shape_label(kind, metrics, scale_factor), fill=text_fill, font=font)
+
+    return np.asarray(pil_image)
+
+
+def collect_images(source):
+    """Return the sorted image paths of a directory or glob pattern."""
+    if os.path.isdir(source):
+        paths = [os.path.join(source, name) for name in os.listdir(source)]
+    else:
+        paths = glob.glob(source)
+    return sorted(path for path in paths if path.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def build_pyramid(image, min_size=PYRAMID_MIN_SIZE):
+    """Return [image, image/2, image/4, ...] down to a level below min_size."""
+    pyramid = [image]
+    while max(pyramid[-1].shape[:2]) > min_size:
+        pyramid.append(cv2.pyrDown(pyramid[-1]))
+    return pyramid
+
+
+def decode_pyramid(path):
+    """Decode an image file and build its preview pyramid. Returns None if it cannot be read."""
+    image = cv2.imread(path)
+    if image is None:
+        return None
+    return build_pyramid(image)
+
+
+def pyramid_level(pyramid, zoom):
+    """Return the coarsest pyramid level that still has at least one pixel per screen pixel at zoom.
+
+    Level pixel j corresponds to full-resolution coordinate j * 2 ** level.
+    """
+    level = 0
+    while level + 1 < len(pyramid) and zoom * 2 ** (level + 1) <= 1:
+        level += 1
+    return level
+
+
+def render_viewport(pyramid, zoom, offset_x, offset_y, view_width, view_height, interpolation=None,
+                    coordinate_map=None):
+    """Render only the part of an image that is visible on the canvas.
+
+    The image is shown at zoom with its top-left corner at (offset_x, offset_y)
+    in canvas pixels. Pixels are sampled from the coarsest pyramid level that
+    still has at least one pixel per screen pixel, so the cost depends on the
+    view size rather than the image size. Returns (pixels, x, y) with the BGR
+    pixels to draw at canvas position (x, y), or None if nothing is visible.
+
+    coordinate_map is an optional (map_x, map_y, step) table giving, every
+    step pixels of the displayed image, the source pixel to show there, as
+    built by CameraModel.remap_table. It is used to undistort on the fly.
+    """
+    if interpolation is None:
+        interpolation = cv2.INTER_LINEAR
+    height, width = pyramid[0].shape[:2]
+    x0 = max(0, int(np.floor(offset_x)))
+    y0 = max(0, int(np.floor(offset_y)))
+    x1 = min(view_width, int(np.ceil(offset_x + width * zoom)))
+    y1 = min(view_height, int(np.ceil(offset_y + height * zoom)))
+    if x1 <= x0 or y1 <= y0:
+        return None
+
+    level = pyramid_level(pyramid, zoom)
+    source = pyramid[level]
+    scale = zoom * 2 ** level  # Screen pixels per level pixel
+    if coordinate_map is not None:
+        return _remap_viewport(source, level, coordinate_map, zoom, offset_x, offset_y, x0, y0, x1, y1, interpolation)
+
+    # Image coordinates are pixel centres, as for measurement points: canvas
+    # position c shows image coordinate (c - offset) / zoom. Crop the visible
+    # region of the level with a small margin for interpolation.
+    src_x = max(0.0, (x0 - offset_x) / scale)
+    src_y = max(0.0, (y0 - offset_y) / scale)
+    crop_x = max(0, int(src_x) - 1)
+    crop_y = max(0, int(src_y) - 1)
+    crop_x1 = min(source.shape[1], int(np.ceil(src_x + (x1 - x0) / scale)) + 2)
+    crop_y1 = min(source.shape[0], int(np.ceil(src_y + (y1 - y0) / scale)) + 2)
+    crop = source[crop_y:crop_y1, crop_x:crop_x1]
+
+    matrix = np.array([
+        [1 / scale, 0, (x0 - offset_x) / scale - crop_x],
+        [0, 1 / scale, (y0 - offset_y) / scale - crop_y],
+    ])
+    pixels = cv2.warpAffine(
+        crop, matrix, (x1 - x0, y1 - y0),
+        flags=interpolation | cv2.WARP_INVERSE_MAP, borderMode=cv2.BORDER_REPLICATE
+    )
+    return pixels, x0, y0
+
+
+def render_loupe(pyramid, x, y, zoom, size=LOUPE_SIZE, stretch=False, coordinate_map=None):
+    """Render a size x size view at zoom centred on image coordinate (x, y).
+
+    Only the pixels under the loupe are sampled, through render_viewport, so
+    the cost does not depend on the image size. With stretch, the grey
+    levels between the 1st and 99th percentile of the crop are stretched to
+    the full range. Returns BGR pixels, grey where the loupe is off the image.
+    """
+    centre = size // 2
+    interpolation = cv2.INTER_NEAREST if zoom >= 2 else cv2.INTER_LINEAR  # Show the pixel grid when magnified
+    view = render_viewport(pyramid, zoom, centre - x * zoom, centre - y * zoom, size, size, interpolation, coordinate_map)
+    pixels = np.full((size, size) + pyramid[0].shape[2:], 128, np.uint8)
+    if view is None:
+        return pixels
+    crop, x0, y0 = view
+    if stretch:
+        low, high = np.percentile(crop, (1, 99))
+        if high > low:
+            alpha = 255.0 / (high - low)
+            crop = cv2.convertScaleAbs(crop, alpha=alpha, beta=-low * alpha)
+    pixels[y0:y0 + crop.shape[0], x0:x0 + crop.shape[1]] = crop
+    return pixels
+
+
+@lru_cache(maxsize=64)
+def display_lut(window, level, gamma):
+    """Return the 256-entry uint8 LUT for a window/level and gamma display adjustment.
+
+    Grey levels from level - window / 2 to level + window / 2 are stretched
+    to the full range and then raised to 1 / gamma.
+    """
+    values = np.clip((np.arange(256) - (level - window / 2.0)) / max(window, 1e-6), 0.0, 1.0)
+    return np.round(255 * values ** (1.0 / gamma)).astype(np.uint8)
+
+
+@lru_cache(maxsize=4)
+def _clahe(clip_limit):
+    return cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=(8, 8))
+
+
+def adjust_display(pixels, window=255, level=127.5, gamma=1.0, clahe=0.0):
+    """Apply display adjustments to rendered viewport pixels.
+
+    Only ever applied to the few screen-sized pixels of the view; measurement
+    and export keep the source pixels. clahe is the CLAHE clip limit, 0 for
+    none; it equalises the brightness of the view, not the whole image.
+    """
+    if clahe:
+        if pixels.ndim == 3:
+            # YCrCb is several times cheaper to convert than Lab and equalises the same way
+            luma, cr, cb = cv2.split(cv2.cvtColor(pixels, cv2.COLOR_BGR2YCrCb))
+            pixels = cv2.cvtColor(cv2.merge((_clahe(clahe).apply(luma), cr, cb)), cv2.COLOR_YCrCb2BGR)
+        else:
+            pixels = _clahe(clahe).apply(pixels)
+    if (window, level, gamma) != (255, 127.5, 1.0):
+        pixels = cv2.LUT(pixels, display_lut(window, level, gamma))
+    return pixels
+
+
+def blend_views(view, compare_view, mode, mix=0.5, checker_size=COMPARE_CHECKER_SIZE):
+    """Combine two render_viewport results of the same view for comparing two images.
+
+    mode is "alpha" (mix is the weight of the second image), "difference",
+    "checkerboard" (squares of checker_size screen pixels from each image) or
+    "split" (the second image right of mix times the view width). Only the
+    screen-sized views are combined; where the second image is not visible
+    the first is shown as is. Returns (pixels, x, y) like render_viewport.
+    """
+    if view is None or compare_view is None:
+        return view
+    pixels, x, y = view
+    other, other_x, other_y = compare_view
+    x0, y0 = max(x, other_x), max(y, other_y)
+    x1 = min(x + pixels.shape[1], other_x + other.shape[1])
+    y1 = min(y + pixels.shape[0], other_y + other.shape[0])
+    if x1 <= x0 or y1 <= y0:
+        return view
+    pixels = pixels.copy()
+    first = pixels[y0 - y:y1 - y, x0 - x:x1 - x]
+    second = other[y0 - other_y:y1 - other_y, x0 - other_x:x1 - other_x]
+    if mode == "alpha":
+        first[...] = cv2.addWeighted(first, 1.0 - mix, second, mix, 0)
+    elif mode == "difference":
+        first[...] = cv2.absdiff(first, second)
+    elif mode == "checkerboard":
+        # Squares are fixed to the canvas, so they don't crawl while panning
+        cells = ((np.arange(y0, y1) // checker_size)[:, None] + (np.arange(x0, x1) // checker_size)[None, :]) & 1
+        cv2.copyTo(second, cells.astype(np.uint8), first)
+    elif mode == "split":
+        split = int(round(x + mix * pixels.shape[1])) - x0
+        if split < first.shape[1]:
+            first[:, max(0, split):] = second[:, max(0, split):]
+    return pixels, x, y
+
+
+def _remap_viewport(source, level, coordinate_map, zoom, offset_x, offset_y, x0, y0, x1, y1, interpolation):
+    """render_viewport through a coarse coordinate table: only the visible pixels are remapped."""
+    map_x, map_y, step = coordinate_map
+    # Position of every output pixel in the table, then the source pixel it shows
+    grid_x, grid_y = np.meshgrid(
+        ((np.arange(x0, x1) - offset_x) / (zoom * step)).astype(np.float32),
+        ((np.arange(y0, y1) - offset_y) / (zoom * step)).astype(np.float32),
+    )
+    level_scale = 1.0 / 2 ** level
+    source_x = cv2.remap(map_x, grid_x, grid_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE) * level_scale
+    source_y = cv2.remap(map_y, grid_x, grid_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE) * level_scale
+
+    # remap only accepts sources under 32767 pixels a side, so crop to what is sampled
+    crop_x = int(np.clip(np.floor(source_x.min()) - 1, 0, source.shape[1] - 1))
+    crop_y = int(np.clip(np.floor(source_y.min()) - 1, 0, source.shape[0] - 1))
+    crop_x1 = int(np.clip(np.ceil(source_x.max()) + 2, crop_x + 1, source.shape[1]))
+    crop_y1 = int(np.clip(np.ceil(source_y.max()) + 2, crop_y + 1, source.shape[0]))
+    source_x -= crop_x
+    source_y -= crop_y
+    pixels = cv2.remap(source[crop_y:crop_y1, crop_x:crop_x1], source_x, source_y, interpolation, borderMode=cv2.BORDER_CONSTANT)
+    return pixels, x0, y0
+
+
+class CameraModel:
+    """Camera intrinsics and distortion coefficients used to undistort images and points.
+
+    Undistorted (displayed) coordinates use the same camera matrix as the raw
+    image, so scale and centre stay put and only the distortion is removed.
+    """
+
+    def __init__(self, camera_matrix, dist_coeffs, image_size=None):
+        self.camera_matrix = np.asarray(camera_matrix, np.float64).reshape(3, 3)
+        self.dist_coeffs = np.asarray(dist_coeffs, np.float64).ravel()
+        self.image_size = tuple(image_size) if image_size else None  # (width, height) it was calibrated at
+        self._tables = {}
+
+    @classmethod
+    def load(cls, path):
+        """Load a model from JSON (camera_matrix, dist_coeffs, image_size) or an OpenCV YAML/XML calibration file."""
+        if path.lower().endswith(".json"):
+            with open(path) as f:
+                data = json.load(f)
+            return cls(data["camera_matrix"], data["dist_coeffs"], data.get("image_size"))
+        storage = cv2.FileStorage(path, cv2.FILE_STORAGE_READ)
+        if not storage.isOpened():
+            raise ValueError(f"Cannot read camera model {path}")
+        try:
+            camera_matrix = storage.getNode("camera_matrix").mat()
+            dist_coeffs = storage.getNode("distortion_coefficients").mat()
+            width, height = storage.getNode("image_width").real(), storage.getNode("image_height").real()
+        finally:
+            storage.release()
+        if camera_matrix is None or dist_coeffs is None:
+            raise ValueError(f"{path} has no camera_matrix and distortion_coefficients")
+        return cls(camera_matrix, dist_coeffs, (int(width), int(height)) if width and height else None)
+
+    def matrix_for(self, width, height):
+        """Camera matrix scaled to an image of width x height, if calibrated at another resolution."""
+        if self.image_size is None or self.image_size == (width, height):
+            return self.camera_matrix
+        scale = np.diag([width / self.image_size[0], height / self.image_size[1], 1.0])
+        return scale @ self.camera_matrix
+
+    def remap_table(self, width, height, step=REMAP_GRID_STEP):
+        """Return (map_x, map_y, step): the raw pixel behind every step-th undistorted pixel.
+
+        Built with cv2.initUndistortRectifyMap once per resolution and cached in
+        memory and on disk. Distortion fields are smooth, so a table every 8
+        pixels interpolates to well under a hundredth of a pixel while being 64
+        times smaller than a full-resolution map.
+        """
+        key = (width, height, step)
+        table = self._tables.get(key)
+        if table is not None:
+            return table
+        camera_matrix = self.matrix_for(width, height)
+        digest = hashlib.sha1(camera_matrix.tobytes() + self.dist_coeffs.tobytes()).hexdigest()[:16]
+        cache_path = os.path.join(REMAP_CACHE_DIR, f"undistort_{digest}_{width}x{height}_{step}.npz")
+        try:
+            with np.load(cache_path) as cached:
+                table = (cached["map_x"], cached["map_y"], step)
+        except (OSError, KeyError, ValueError):
+            # Table entry (u, v) is undistorted pixel (u * step, v * step)
+            table_matrix = np.diag([1.0 / step, 1.0 / step, 1.0]) @ camera_matrix
+            size = (width // step + 2, height // step + 2)
+            map_x, map_y = cv2.initUndistortRectifyMap(camera_matrix, self.dist_coeffs, None, table_matrix, size, cv2.CV_32FC1)
+            table = (map_x, map_y, step)
+            try:
+                os.makedirs(REMAP_CACHE_DIR, exist_ok=True)
+                np.savez(cache_path, map_x=map_x, map_y=map_y)
+            except OSError:
+                pass  # The cache is only an optimisation
+        self._tables[key] = table
+        return table
+
+    def to_raw(self, points, width, height):
+        """Map undistorted image points to raw image points through the distortion model."""
+        camera_matrix = self.matrix_for(width, height)
+        points = np.asarray(points, np.float64).reshape(-1, 2)
+        normalized = (points - camera_matrix[:2, 2]) / np.diag(camera_matrix)[:2]
+        object_points = np.column_stack([normalized, np.ones(len(points))])
+        raw, _ = cv2.projectPoints(object_points, np.zeros(3), np.zeros(3), camera_matrix, self.dist_coeffs)
+        return raw.reshape(-1, 2)
+
+    def to_undistorted(self, points, width, height):
+        """Map raw image points to undistorted image points."""
+        camera_matrix = self.matrix_for(width, height)
+        points = np.asarray(points, np.float64).reshape(-1, 2)
+        undistorted = cv2.undistortPoints(points.reshape(-1, 1, 2), camera_matrix, self.dist_coeffs, P=camera_matrix).reshape(-1, 2)
+        # undistortPoints stops early and can be hundredths of a pixel off in
+        # the corners; polish with a few steps against the forward model
+        for _ in range(3):
+            undistorted += points - self.to_raw(undistorted, width, height)
+        return undistorted
+
+    def undistort_image(self, image):
+        """Undistort a whole image at full resolution, for export."""
+        height, width = image.shape[:2]
+        camera_matrix = self.matrix_for(width, height)
+        return cv2.undistort(image, camera_matrix, self.dist_coeffs, None, camera_matrix)
+
+
+def transform_measurements(lines, angles, transform, scale_factor=None):
+    """Map every point of lines and angles through transform and recompute their values.
+
+    transform takes an (n, 2) array of points and returns the mapped (n, 2) array.
+    """
+    if not lines and not angles:
+        return [], []
+    points = np.array([p for start, end, _ in lines for p in (start, end)]
+                      + [p for p1, p2, p3, _ in angles for p in (p1, p2, p3)], np.float64).reshape(-1, 2)
+    mapped = np.asarray(transform(points), np.float64).reshape(-1, 2).tolist()
+    new_lines = []
+    for i in range(len(lines)):
+        start, end = mapped[2 * i], mapped[2 * i + 1]
+        new_lines.append((start, end, line_distance(start, end, scale_factor)[1]))
+    new_angles = []
+    base = 2 * len(lines)
+    for i in range(len(angles)):
+        p1, p2, p3 = mapped[base + 3 * i:base + 3 * i + 3]
+        new_angles.append((p1, p2, p3, angle_at_vertex(p1, p2, p3)))
+    return new_lines, new_angles
+
+
+def shape_metrics(kind, points):
+    """Compute the metrics of a "polygon" or "polyline" from its (n, 2) vertices, in pixels.
+
+    Returns a dict with "length" (the perimeter of a polygon), "centroid",
+    "circle" (centre x, centre y, radius of the least-squares circle, left
+    out when the vertices do not define one) and, for polygons, "area";
+    "ellipse" ((cx, cy), (major, minor), angle) is added when there is a
+    circle and at least five vertices. Everything is computed on
+    whole arrays, so shapes with thousands of vertices cost next to nothing.
+    """
+    points = np.asarray(points, np.float64).reshape(-1, 2)
+    x, y = points[:, 0], points[:, 1]
+    closed = kind == "polygon"
+    if closed:
+        segments = np.roll(points, -1, axis=0) - points
+    else:
+        segments = np.diff(points, axis=0)
+    segment_lengths = np.hypot(segments[:, 0], segments[:, 1])
+    metrics = {"length": float(segment_lengths.sum())}
+
+    if closed:
+        # Shoelace formula
+        cross = x * np.roll(y, -1) - np.roll(x, -1) * y
+        signed_area = cross.sum() / 2.0
+        metrics["area"] = abs(float(signed_area))
+        if abs(signed_area) > 1e-12:
+            centroid = [float(((x + np.roll(x, -1)) * cross).sum() / (6 * signed_area)),
+                        float(((y + np.roll(y, -1)) * cross).sum() / (6 * signed_area))]
+        else:
+            centroid = points.mean(axis=0).tolist()
+    elif metrics["length"] > 0:
+        midpoints = (points[:-1] + points[1:]) / 2
+        centroid = (midpoints * segment_lengths[:, None]).sum(axis=0) / metrics["length"]
+        centroid = centroid.tolist()
+    else:
+        centroid = points.mean(axis=0).tolist()
+    metrics["centroid"] = centroid
+
+    circle = fit_circle(points)
+    if circle is not None:
+        metrics["circle"] = circle
+        # Collinear vertices, which also have no circle, would give a meaningless ellipse
+        if len(points) >= 5:
+            (ex, ey), (axis_a, axis_b), angle = cv2.fitEllipse(points.astype(np.float32))
+            metrics["ellipse"] = [[ex, ey], [max(axis_a, axis_b), min(axis_a, axis_b)], angle]
+    return metrics
+
+
+def fit_circle(points):
+    """Return [centre x, centre y, radius] of the least-squares circle through (n, 2) points.
+
+    Returns None for fewer than three points or a degenerate fit, such as
+    collinear or coincident points, where any radius would be meaningless.
+    """
+    if len(points) < 3:
+        return None
+    # Algebraic circle fit around the mean for numerical stability
+    mean = points.mean(axis=0)
+    u, v = points[:, 0] - mean[0], points[:, 1] - mean[1]
+    (a, b, c), _, rank, singular = np.linalg.lstsq(np.column_stack([u, v, np.ones_like(u)]), u * u + v * v, rcond=None)
+    if rank < 3 or singular[-1] < CIRCLE_FIT_MIN_CONDITION * singular[0]:
+        return None
+    cx, cy = a / 2, b / 2
+    radius2 = c + cx * cx + cy * cy
+    if not np.isfinite(radius2) or radius2 <= 0:
+        return None
+    return [float(cx + mean[0]), float(cy + mean[1]), float(np.sqrt(radius2))]
+
+
+def transform_shapes(shapes, transform):
+    """Map every vertex of shapes through transform, as transform_measurements does for lines and angles."""
+    if not shapes:
+        return []
+    counts = [len(points) for _, points, _ in shapes]
+    mapped = np.asarray(transform(np.concatenate([np.asarray(points, np.float64).reshape(-1, 2)
+                                                  for _, points, _ in shapes])), np.float64).reshape(-1, 2)
+    new_shapes = []
+    for (kind, _, _), start, count in zip(shapes, np.cumsum([0] + counts[:-1]), counts):
+        points = mapped[start:start + count]
+        new_shapes.append((kind, points.tolist(), shape_metrics(kind, points)))
+    return new_shapes
+
+
+def shape_label(kind, metrics, scale_factor=None):
+    """Short text of a shape's main value: the area of a polygon, the length of a polyline."""
+    if kind == "polygon":
+        if scale_factor:
+            return f"{metrics['area'] * scale_factor ** 2:.2f} mm²"
+        return f"{metrics['area']:.0f} px²"
+    if scale_factor:
+        return f"{metrics['length'] * scale_factor:.2f} mm"
+    return f"{metrics['length']:.1f} px"
+
+
+class RunningStats:
+    """Count, mean, standard deviation, extremes and histogram of a stream of values.
+
+    add() and remove() are O(1) (Welford's algorithm). remove() takes back the
+    most recently added value, which is all undo needs; min and max are kept
+    per step so they come back exactly. The histogram has fixed bins that are
+    only rebuilt, doubling their range, when a value falls outside them.
+    """
+
+    def __init__(self, bins=STATS_BINS):
+        self.bins = bins
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self._values = []
+        self._minima = []
+        self._maxima = []
+        self.edges = None
+        self.counts = None
+
+    @classmethod
+    def from_values(cls, values, bins=STATS_BINS):
+        """Build the accumulator for a whole array at once."""
+        stats = cls(bins)
+        values = np.asarray(values, np.float64).ravel()
+        if len(values):
+            stats.count = len(values)
+            stats.mean = float(values.mean())
+            stats._m2 = float(((values - stats.mean) ** 2).sum())
+            stats._values = values.tolist()
+            stats._minima = np.minimum.accumulate(values).tolist()
+            stats._maxima = np.maximum.accumulate(values).tolist()
+            stats._rebin(stats._minima[-1], stats._maxima[-1])
+        return stats
+
+    def add(self, value):
+        value = float(value)
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        self._values.append(value)
+        self._minima.append(min(value, self._minima[-1]) if self._minima else value)
+        self._maxima.append(max(value, self._maxima[-1]) if self._maxima else value)
+        if self.edges is None or not self.edges[0] <= value <= self.edges[-1]:
+            self._rebin(self._minima[-1], self._maxima[-1])
+        else:
+            self.counts[self._bin(value)] += 1
+
+    def remove(self):
+        """Take back the last value added."""
+        if self.count <= 1:
+            self.__init__(self.bins)
+            return
+        value = self._values.pop()
+        self.counts[self._bin(value)] -= 1
+        self._minima.pop()
+        self._maxima.pop()
+        mean = (self.count * self.mean - value) / (self.count - 1)
+        self._m2 = max(self._m2 - (value - self.mean) * (value - mean), 0.0)
+        self.mean = mean
+        self.count -= 1
+
+    @property
+    def std(self):
+        """Sample standard deviation, 0 below two values."""
+        return float(np.sqrt(self._m2 / (self.count - 1))) if self.count > 1 else 0.0
+
+    @property
+    def minimum(self):
+        return self._minima[-1] if self._minima else None
+
+    @property
+    def maximum(self):
+        return self._maxima[-1] if self._maxima else None
+
+    def capability(self, lower, upper):
+        """Return (Cp, Cpk) against the tolerance limits, or None without a spread to judge."""
+        std = self.std
+        if std <= 0:
+            return None
+        return (upper - lower) / (6 * std), min(upper - self.mean, self.mean - lower) / (3 * std)
+
+    def _bin(self, value):
+        low, high = self.edges[0], self.edges[-1]
+        return min(int((value - low) / (high - low) * self.bins), self.bins - 1)
+
+    def _rebin(self, low, high):
+        pad = (high - low) / 2 or max(abs(high) * 0.01, 1e-6)
+        self.edges = np.linspace(low - pad, high + pad, self.bins + 1)
+        values = np.asarray(self._values, np.float64)
+        index = np.minimum(((values - self.edges[0]) / (self.edges[-1] - self.edges[0]) * self.bins).astype(int),
+                           self.bins - 1)
+        self.counts = np.bincount(index, minlength=self.bins)
+
+
+def measurement_values(lines, angles, shapes=()):
+    """Return the values of every STATS_GROUPS group as arrays, in pixel units for lengths and areas."""
+    points = np.array([(*start[:2], *end[:2]) for start, end, _ in lines], np.float64).reshape(-1, 4)
+    return {
+        "line": np.hypot(points[:, 2] - points[:, 0], points[:, 3] - points[:, 1]),
+        "angle": np.array([angle for *_, angle in angles], np.float64),
+        "polygon": np.array([metrics["area"] for kind, _, metrics in shapes if kind == "polygon"], np.float64),
+        "polyline": np.array([metrics["length"] for kind, _, metrics in shapes if kind == "polyline"], np.float64),
+    }
+
+
+class DecodedImageCache:
+    """Thread-safe LRU cache of decoded image pyramids, bounded by total bytes."""
+
+    def __init__(self, max_bytes=SEQUENCE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def get(self, key):
+        with self._lock:
+            pyramid = self._items.get(key)
+            if pyramid is not None:
+                self._items.move_to_end(key)
+            return pyramid
+
+    def put(self, key, pyramid):
+        size = sum(level.nbytes for level in pyramid)
+        with self._lock:
+            if key in self._items:
+                self._bytes -= sum(level.nbytes for level in self._items.pop(key))
+            self._items[key] = pyramid
+            self._bytes += size
+            # Always keep the newest entry, even if it alone exceeds the budget
+            while self._bytes > self.max_bytes and len(self._items) > 1:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= sum(level.nbytes for level in evicted)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+
+class WorkerPool:
+    """One pool of worker threads for all heavy work, started in priority order.
+
+    Interactive work the operator is waiting for (PRIORITY_INTERACTIVE) always
+    starts before background work such as prefetching and export; within a
+    priority, work runs first come, first served. configure() sets the worker
+    count and OpenCV's own thread count together, so the app can be kept to
+    what a shared station can spare. queue_depth(), busy and utilisation()
+    feed the performance HUD, and queue and busy counts are traced as
+    counters while a trace is recorded.
+    """
+
+    def __init__(self, workers=None, perf=None):
+        self.perf = perf
+        self.workers = 0
+        self.opencv_threads = None  # None leaves OpenCV's default
+        self.busy = 0
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._busy_integral = 0.0  # Worker-seconds spent busy
+        self._busy_changed = time.perf_counter()
+        self._sample = (self._busy_changed, 0.0)
+        self.configure(workers)
+
+    def configure(self, workers=None, opencv_threads=None):
+        """Run with workers threads (default: one per core) and, if given, set cv2.setNumThreads(opencv_threads)."""
+        workers = max(1, workers or os.cpu_count() or 1)
+        with self._lock:
+            for i in range(self.workers, workers):
+                threading.Thread(target=self._run, name=f"worker-{i}", daemon=True).start()
+            for _ in range(workers, self.workers):
+                self._queue.put((-1, next(self._sequence), None, None))  # Stops the first idle worker
+            self.workers = workers
+        if opencv_threads is not None:
+            cv2.setNumThreads(opencv_threads)
+            self.opencv_threads = opencv_threads
+
+    def submit(self, work, priority=PRIORITY_INTERACTIVE):
+        """Queue work() and return a Future of its result."""
+        future = Future()
+        self._queue.put((priority, next(self._sequence), work, future))
+        self._trace_counters()
+        return future
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def utilisation(self):
+        """Share of worker time spent busy since the last call."""
+        now = time.perf_counter()
+        with self._lock:
+            integral = self._busy_integral + self.busy * (now - self._busy_changed)
+        last_time, last_integral = self._sample
+        self._sample = (now, integral)
+        if now <= last_time:
+            return 0.0
+        return min(1.0, (integral - last_integral) / ((now - last_time) * self.workers))
+
+    def _set_busy(self, change):
+        with self._lock:
+            now = time.perf_counter()
+            self._busy_integral += self.busy * (now - self._busy_changed)
+            self._busy_changed = now
+            self.busy += change
+        self._trace_counters()
+
+    def _trace_counters(self):
+        if self.perf is not None and self.perf.tracing:
+            self.perf.add_counter("workers", {"queued": self._queue.qsize(), "busy": self.busy})
+
+    def _run(self):
+        while True:
+            _, _, work, future = self._queue.get()
+            if work is None:
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            self._set_busy(1)
+            try:
+                future.set_result(work())
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                self._set_busy(-1)
+
+
+class ImagePrefetcher:
+    """Decode the images around the current position of a sequence as background work on a WorkerPool."""
+
+    def __init__(self, paths, cache, pool, radius=SEQUENCE_PREFETCH, perf=None):
+        self.paths = paths
+        self.cache = cache
+        self.pool = pool
+        self.radius = radius
+        self.perf = perf
+        self._index = 0
+        self._moves = 0  # Counts set_index calls, so a pass knows when the window moved under it
+        self._queued = False  # A prefetch pass is queued or running
+        self._decoding = None
+        self._decoded = threading.Condition()
+        self._stopped = False
+
+    def set_index(self, index):
+        """Move the prefetch window to index, nearest images first."""
+        with self._decoded:
+            self._index = index
+            self._moves += 1
+            if self._queued:
+                return  # The running pass starts again from the new position
+            self._queued = True
+        self.pool.submit(self._run, PRIORITY_BACKGROUND)
+
+    def fetch(self, index):
+        """Return the pyramid for paths[index], decoding it now if the prefetcher has not."""
+        path = self.paths[index]
+        with self._decoded:
+            # Don't decode twice if the background thread is already on it
+            while self._decoding == path:
+                self._decoded.wait()
+        pyramid = self.cache.get(path)
+        if pyramid is None:
+            pyramid = self._decode(path)
+        return pyramid
+
+    def _decode(self, path):
+        if self.perf is not None and self.perf.tracing:
+            with self.perf.span("decode", "decode", path=path):
+                pyramid = decode_pyramid(path)
+        else:
+            pyramid = decode_pyramid(path)
+        if pyramid is not None:
+            self.cache.put(path, pyramid)
+        return pyramid
+
+    def stop(self):
+        self._stopped = True
+
+    def _neighbours(self, index):
+        yield index
+        for distance in range(1, self.radius + 1):
+            for neighbour in (index + distance, index - distance):
+                if 0 <= neighbour < len(self.paths):
+                    yield neighbour
+
+    def _run(self):
+        while True:
+            with self._decoded:
+                if self._stopped:
+                    self._queued = False
+                    return
+                index, moves = self._index, self._moves
+            for neighbour in self._neighbours(index):
+                if self._stopped or self._moves != moves:
+                    break  # The window moved, start again from the new position
+                path = self.paths[neighbour]
+                if path in self.cache:
+                    continue
+                with self._decoded:
+                    self._decoding = path
+                try:
+                    self._decode(path)
+                finally:
+                    with self._decoded:
+                        self._decoding = None
+                        self._decoded.notify_all()
+            with self._decoded:
+                if self._moves == moves:
+                    self._queued = False
+                    return
+
+
+def sequence_pattern(path):
+    """Turn one file of a numbered image sequence (img_0007.png) into a VideoCapture pattern (img_%04d.png).
+
+    Returns path unchanged if it is not a numbered image.
+    """
+    root, extension = os.path.splitext(path)
+    digits = len(root) - len(root.rstrip("0123456789"))
+    if extension.lower() not in IMAGE_EXTENSIONS or not digits:
+        return path
+    return f"{root[:-digits]}%0{digits}d{extension}"
+
+
+class VideoFrameSource:
+    """Decode the frames of a video file or numbered image sequence as work on a WorkerPool.
+
+    Frames are kept as pyramids in a ring buffer of at most capacity frames.
+    get() never blocks: it returns a buffered frame or None, and moves the
+    decoder to that frame so it can be shown on a later call. The decoder
+    reads forward from the requested frame, seeking only when the request
+    jumps away from where it is.
+    """
+
+    def __init__(self, path, pool, capacity=VIDEO_BUFFER_FRAMES, perf=None):
+        self.path = path
+        self.pool = pool
+        self.capture = cv2.VideoCapture(path)
+        if not self.capture.isOpened():
+            raise ValueError(f"Could not open {path}")
+        self.frame_count = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        if self.frame_count <= 0:
+            self.capture.release()
+            raise ValueError(f"Could not determine the frame count of {path}")
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or 0.0
+        self.capacity = capacity
+        self.perf = perf
+        self.frames = {}  # Frame index -> pyramid
+        self._index = 0
+        self._position = 0  # Frame the next capture.read() returns
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._queued = False  # Decoding is queued or running; only one task ever uses the capture
+        self._schedule()
+
+    def get(self, index):
+        """Return frame index as a pyramid if it is buffered, else None, and decode from index on."""
+        with self._lock:
+            self._index = index
+            frame = self.frames.get(index)
+        self._schedule()
+        return frame
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            if self._queued:
+                return  # The decoding task releases the capture when it sees the stop
+        self.capture.release()
+
+    def _schedule(self):
+        """Queue the decoding task if frames are wanted and it is not already queued or running."""
+        with self._lock:
+            if self._queued or self._stopped or self._wanted() is None:
+                return
+            self._queued = True
+        self.pool.submit(self._run, PRIORITY_INTERACTIVE)
+
+    def _wanted(self):
+        """Next frame to decode: the first missing one from the current index on (call with the lock held)."""
+        for index in range(self._index, min(self._index + self.capacity // 2, self.frame_count)):
+            if index not in self.frames:
+                return index
+        return None
+
+    def _run(self):
+        while True:
+            with self._lock:
+                index = None if self._stopped else self._wanted()
+                if index is None:
+                    self._queued = False
+                    break
+            if index != self._position:
+                self.capture.set(cv2.CAP_PROP_POS_FRAMES, index)
+            if self.perf is not None and self.perf.tracing:
+                with self.perf.span("decode_frame", "decode", index=index):
+                    ok, frame = self.capture.read()
+            else:
+                ok, frame = self.capture.read()
+            self._position = index + 1
+            with self._lock:
+                if not ok:
+                    # Containers often report more frames than they hold
+                    self.frame_count = index
+                    continue
+                self.frames[index] = build_pyramid(frame)
+                # Drop the frames furthest from the current one
+                while len(self.frames) > self.capacity:
+                    del self.frames[max(self.frames, key=lambda i: abs(i - self._index))]
+        if self._stopped:
+            self.capture.release()
+
+
+def sample_line_profile(image, p1, p2, width=1, transform=None):
+    """Return grey levels sampled every pixel along p1 -> p2, averaged over width pixels across the line.
+
+    All samples are taken in one bilinear cv2.remap over a crop around the line.
+    transform optionally maps the (n, 2) sample points into image pixels,
+    e.g. CameraModel.to_raw for a line measured in undistorted coordinates.
+    """
+    p1, p2 = np.asarray(p1, float), np.asarray(p2, float)
+    length = float(np.hypot(*(p2 - p1)))
+    count = max(2, int(np.ceil(length)) + 1)
+    direction = (p2 - p1) / max(length, 1e-9)
+    normal = np.array([-direction[1], direction[0]])
+    along = np.linspace(0.0, 1.0, count)[None, :, None] * (p2 - p1)
+    across = (np.arange(width) - (width - 1) / 2.0)[:, None, None] * normal
+    coords = p1 + along + across  # (width, count, 2)
+    if transform is not None:
+        coords = np.asarray(transform(coords.reshape(-1, 2)), np.float64).reshape(coords.shape)
+
+    # Crop first: remap only accepts sources smaller than 32767 pixels a side
+    margin = 2
+    x0 = max(0, int(np.floor(coords[..., 0].min())) - margin)
+    y0 = max(0, int(np.floor(coords[..., 1].min())) - margin)
+    x1 = min(image.shape[1], int(np.ceil(coords[..., 0].max())) + margin + 1)
+    y1 = min(image.shape[0], int(np.ceil(coords[..., 1].max())) + margin + 1)
+    crop = image[y0:y1, x0:x1]
+    if crop.ndim == 3:
+        crop = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+    map_x = (coords[..., 0] - x0).astype(np.float32)
+    map_y = (coords[..., 1] - y0).astype(np.float32)
+    samples = cv2.remap(crop, map_x, map_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+    return samples.astype(np.float32).mean(axis=0)
+
+
+def profile_edges(profile, min_step=PROFILE_MIN_EDGE):
+    """Find the edges in a line profile with sub-pixel precision.
+
+    Edges are local maxima of the smoothed profile's slope that rise or fall
+    by at least min_step grey levels per sample. Returns (positions,
+    strengths): positions in samples from the start of the profile and the
+    signed slope there, positive from dark to bright.
+    """
+    profile = np.asarray(profile, np.float64)
+    if len(profile) < 3:
+        return np.empty(0), np.empty(0)
+    smoothed = np.convolve(np.pad(profile, 2, mode="edge"), np.array([1, 4, 6, 4, 1]) / 16, mode="valid")
+    slope = np.gradient(smoothed)
+    magnitude = np.abs(slope)
+    inner = magnitude[1:-1]
+    peaks = np.flatnonzero((inner >= magnitude[:-2]) & (inner > magnitude[2:]) & (inner >= min_step)) + 1
+    before, peak, after = magnitude[peaks - 1], magnitude[peaks], magnitude[peaks + 1]
+    denominator = before - 2 * peak + after
+    offset = 0.5 * (before - after) / np.where(denominator < 0, denominator, -np.inf)
+    return peaks + offset, slope[peaks]
+
+
+def edge_to_edge(p1, p2, profile, min_step=PROFILE_MIN_EDGE):
+    """Return the first and last edge along a profile sampled from p1 to p2 as image points, or None."""
+    positions, _ = profile_edges(profile, min_step)
+    if len(positions) < 2:
+        return None
+    p1, p2 = np.asarray(p1, float), np.asarray(p2, float)
+    step = (p2 - p1) / (len(profile) - 1)
+    return (p1 + positions[0] * step).tolist(), (p1 + positions[-1] * step).tolist()
+
+
+def fit_scale(pixel_distances, mm_distances):
+    """Least-squares mm/pixel from pairs of known distances. Returns (scale, RMS residual in mm)."""
+    pixel_distances = np.asarray(pixel_distances, float)
+    mm_distances = np.asarray(mm_distances, float)
+    scale = float(np.dot(pixel_distances, mm_distances) / np.dot(pixel_distances, pixel_distances))
+    residual = float(np.sqrt(np.mean((pixel_distances * scale - mm_distances) ** 2)))
+    return scale, residual
+
+
+def detect_checkerboard_scale(pyramid, pattern_size, square_mm):
+    """Find a checkerboard with pattern_size inner corners and fit mm/pixel from all its corner pairs.
+
+    Corners are found on a downscaled pyramid level, then refined with
+    cornerSubPix on a full-resolution crop around the board. Returns a dict
+    with scale, residual_mm and corners, or None if no board was found.
+    """
+    level = 0
+    while level + 1 < len(pyramid) and max(pyramid[level].shape[:2]) > CALIBRATION_DETECT_SIZE:
+        level += 1
+    small = pyramid[level]
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+    flags = cv2.CALIB_CB_ADAPTIVE_THRESH | cv2.CALIB_CB_NORMALIZE_IMAGE | cv2.CALIB_CB_FAST_CHECK
+    found, corners = cv2.findChessboardCorners(gray, pattern_size, flags=flags)
+    if not found:
+        return None
+    corners = corners.reshape(-1, 2) * 2 ** level
+
+    # Refine at full resolution, converting only the board's bounding box
+    image = pyramid[0]
+    square_px = np.median(np.hypot(*np.diff(corners.reshape(pattern_size[1], pattern_size[0], 2), axis=1).reshape(-1, 2).T))
+    window = int(np.clip(square_px * 0.25, 3, 25))
+    x0 = max(0, int(corners[:, 0].min()) - 2 * window)
+    y0 = max(0, int(corners[:, 1].min()) - 2 * window)
+    x1 = min(image.shape[1], int(corners[:, 0].max()) + 2 * window)
+    y1 = min(image.shape[0], int(corners[:, 1].max()) + 2 * window)
+    crop = image[y0:y1, x0:x1]
+    crop = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+    refined = (corners - (x0, y0)).astype(np.float32).reshape(-1, 1, 2)
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.01)
+    refined = cv2.cornerSubPix(crop, refined, (window, window), (-1, -1), criteria)
+    corners = refined.reshape(-1, 2) + (x0, y0)
+
+    # Every pair of corners has a known distance in squares
+    cols, rows = pattern_size
+    grid = np.stack(np.meshgrid(np.arange(cols), np.arange(rows)), axis=-1).reshape(-1, 2)
+    first, second = np.triu_indices(len(corners), k=1)
+    pixel_distances = np.hypot(*(corners[first] - corners[second]).T)
+    mm_distances = np.hypot(*(grid[first] - grid[second]).T) * square_mm
+    scale, residual = fit_scale(pixel_distances, mm_distances)
+    return {"scale": scale, "residual_mm": residual, "corners": corners, "pairs": len(first)}
+
+
+def detect_ruler_scale(image, p1, p2, tick_mm, width=9):
+    """Find evenly spaced ruler ticks along p1 -> p2 and fit mm/pixel to their positions.
+
+    Returns a dict with scale, residual_mm and ticks (image points), or None
+    if no regular tick pattern is found.
+    """
+    profile = sample_line_profile(image, p1, p2, width)
+    if len(profile) < 16:
+        return None
+    # Remove the background and make the ticks the peaks, whichever their polarity
+    background = cv2.blur(profile.reshape(1, -1), (31, 1), borderType=cv2.BORDER_REFLECT).ravel()
+    signal = profile - background
+    if -signal.min() > signal.max():
+        signal = -signal
+
+    # Tick period from the first strong peak of the autocorrelation; multiples
+    # of the period score almost as high, so the highest peak is not used
+    centred = signal - signal.mean()
+    correlation = np.correlate(centred, centred, mode="full")[len(centred) - 1:]
+    half = len(correlation) // 2
+    inner = correlation[1:half - 1]
+    is_peak = (inner > correlation[:half - 2]) & (inner >= correlation[2:half]) \
+        & (inner > RULER_MIN_CORRELATION * correlation[0])
+    if not is_peak.any():
+        return None
+    lag = int(np.argmax(is_peak)) + 1
+    left, centre, right = correlation[lag - 1:lag + 2]
+    curvature = left - 2 * centre + right
+    period = lag + (0.5 * (left - right) / curvature if curvature < 0 else 0.0)
+    if period < 2:
+        return None
+
+    # Local maxima at least half a period apart, refined with a parabola
+    is_peak = (signal[1:-1] > signal[:-2]) & (signal[1:-1] >= signal[2:]) & (signal[1:-1] > 0.3 * signal.max())
+    candidates = np.flatnonzero(is_peak) + 1
+    peaks = []
+    for index in candidates[np.argsort(-signal[candidates])]:
+        if all(abs(index - peak) >= period / 2 for peak in peaks):
+            peaks.append(index)
+    peaks = np.sort(np.array(peaks))
+    if len(peaks) < 3:
+        return None
+    left, centre, right = signal[peaks - 1], signal[peaks], signal[peaks + 1]
+    curvature = left - 2 * centre + right
+    positions = peaks + np.where(curvature < 0, 0.5 * (left - right) / np.where(curvature < 0, curvature, 1), 0)
+
+    # Number each tick from the gap to its neighbour, which allows for missing
+    # ticks without the period error adding up along the ruler; then fit
+    # position = offset + spacing * number
+    numbers = np.concatenate([[0], np.cumsum(np.maximum(1, np.rint(np.diff(positions) / period)))])
+    spacing, offset = np.polyfit(numbers, positions, 1)
+    residual_px = positions - (offset + spacing * numbers)
+    # Profile samples are spread evenly over the line, slightly more than 1 pixel apart
+    length = float(np.hypot(p2[0] - p1[0], p2[1] - p1[1]))
+    pixels_per_sample = length / (len(profile) - 1)
+    scale = float(tick_mm / (spacing * pixels_per_sample))
+    direction = (np.asarray(p2, float) - np.asarray(p1, float)) / max(length, 1e-9)
+    ticks = np.asarray(p1, float) + positions[:, None] * pixels_per_sample * direction
+    return {
+        "scale": scale, "residual_mm": float(np.sqrt(np.mean((residual_px * pixels_per_sample * scale) ** 2))),
+        "ticks": ticks,
+    }
+
+
+class EdgeSnapper:
+    """Move points onto the strongest nearby edge with sub-pixel precision.
+
+    Sobel gradients are computed per tile of a pyramid level the first time a
+    search touches it and kept in an LRU cache, so a snap costs a few small
+    array operations whatever the image size. The search runs on the level
+    shown at the current zoom and is then refined at full resolution.
+    """
+
+    def __init__(self, pyramid, max_tiles=GRADIENT_CACHE_TILES):
+        self.pyramid = pyramid
+        self.max_tiles = max_tiles
+        self._tiles = OrderedDict()  # (level, tile row, tile column) -> (gx, gy)
+
+    def _tile(self, level, ty, tx):
+        key = (level, ty, tx)
+        tile = self._tiles.get(key)
+        if tile is not None:
+            self._tiles.move_to_end(key)
+            return tile
+        source = self.pyramid[level]
+        size = GRADIENT_TILE_SIZE
+        y0, x0 = ty * size, tx * size
+        y1, x1 = min(y0 + size, source.shape[0]), min(x0 + size, source.shape[1])
+        # One pixel of context so tile borders get the same gradients as the interior
+        by0, bx0 = max(0, y0 - 1), max(0, x0 - 1)
+        patch = source[by0:min(y1 + 1, source.shape[0]), bx0:min(x1 + 1, source.shape[1])]
+        gray = cv2.cvtColor(patch, cv2.COLOR_BGR2GRAY) if patch.ndim == 3 else patch
+        crop = (slice(y0 - by0, y1 - by0), slice(x0 - bx0, x1 - bx0))
+        tile = (cv2.Sobel(gray, cv2.CV_16S, 1, 0, ksize=3)[crop], cv2.Sobel(gray, cv2.CV_16S, 0, 1, ksize=3)[crop])
+        self._tiles[key] = tile
+        if len(self._tiles) > self.max_tiles:
+            self._tiles.popitem(last=False)
+        return tile
+
+    def gradients(self, level, x0, y0, x1, y1):
+        """Return (gx, gy, x0, y0) for the region [x0, x1) x [y0, y1) of a level, clipped to the image."""
+        height, width = self.pyramid[level].shape[:2]
+        x0, y0 = max(0, x0), max(0, y0)
+        x1, y1 = min(width, x1), min(height, y1)
+        gx = np.zeros((max(0, y1 - y0), max(0, x1 - x0)), np.float32)
+        gy = np.zeros_like(gx)
+        size = GRADIENT_TILE_SIZE
+        for ty in range(y0 // size, (y1 - 1) // size + 1):
+            for tx in range(x0 // size, (x1 - 1) // size + 1):
+                tile_gx, tile_gy = self._tile(level, ty, tx)
+                ry0, ry1 = max(y0, ty * size), min(y1, (ty + 1) * size)
+                rx0, rx1 = max(x0, tx * size), min(x1, (tx + 1) * size)
+                src = (slice(ry0 - ty * size, ry1 - ty * size), slice(rx0 - tx * size, rx1 - tx * size))
+                dst = (slice(ry0 - y0, ry1 - y0), slice(rx0 - x0, rx1 - x0))
+                gx[dst] = tile_gx[src]
+                gy[dst] = tile_gy[src]
+        return gx, gy, x0, y0
+
+    def _strongest(self, level, x, y, radius, falloff):
+        """Return the (x, y) level pixel on the strongest weighted edge within radius, or None.
+
+        Only local maxima of the gradient magnitude across the edge count, so a
+        pixel on the rim of the search window that merely catches the tail of
+        an edge outside it is never taken.
+        """
+        r = int(np.ceil(radius)) + 1  # One pixel of context to test the rim of the window for maxima
+        gx, gy, ox, oy = self.gradients(level, int(round(x)) - r, int(round(y)) - r, int(round(x)) + r + 1, int(round(y)) + r + 1)
+        if min(gx.shape) < 3:
+            return None
+        magnitude = np.hypot(gx, gy)
+        rows, cols = np.indices(magnitude.shape)
+        # Non-maximum suppression along the gradient, quantised to the 8 neighbours
+        sector = np.rint(np.arctan2(gy, gx) / (np.pi / 4)) * (np.pi / 4)
+        dx, dy = np.rint(np.cos(sector)).astype(int), np.rint(np.sin(sector)).astype(int)
+        height, width = magnitude.shape
+        ahead = magnitude[np.clip(rows + dy, 0, height - 1), np.clip(cols + dx, 0, width - 1)]
+        behind = magnitude[np.clip(rows - dy, 0, height - 1), np.clip(cols - dx, 0, width - 1)]
+        inside = (rows > 0) & (rows < height - 1) & (cols > 0) & (cols < width - 1)
+        is_maximum = inside & (magnitude > behind) & (magnitude >= ahead)
+        distance2 = (cols + ox - x) ** 2 + (rows + oy - y) ** 2
+        # Favour edges close to the cursor over slightly stronger ones further away
+        score = np.where(is_maximum & (distance2 <= radius ** 2),
+                         magnitude * np.exp(-falloff * distance2 / radius ** 2), -1)
+        row, col = np.unravel_index(np.argmax(score), score.shape)
+        if score[row, col] <= 0:
+            return None
+        return col + ox, row + oy
+
+    def snap(self, point, zoom, radius=SNAP_RADIUS):
+        """Return point moved to the nearest strong edge within radius screen pixels, or None if there is none."""
+        level = pyramid_level(self.pyramid, zoom)
+        level_scale = 2 ** level
+        coarse = self._strongest(level, point[0] / level_scale, point[1] / level_scale, max(2.0, radius / (zoom * level_scale)), 1.0)
+        if coarse is None:
+            return None
+        x, y = coarse[0] * level_scale, coarse[1] * level_scale
+        if level > 0:
+            found = self._strongest(0, x, y, level_scale + 1.0, 0.0)
+            if found is None:
+                return None
+            x, y = found[0], found[1]
+
+        # Sub-pixel: fit a parabola to the gradient magnitude across the edge
+        gx, gy, ox, oy = self.gradients(0, x - 2, y - 2, x + 3, y + 3)
+        magnitude = np.hypot(gx, gy)
+        cx, cy = x - ox, y - oy
+        if magnitude[cy, cx] < SNAP_MIN_GRADIENT:
+            return None
+        normal = np.array([gx[cy, cx], gy[cy, cx]]) / magnitude[cy, cx]
+
+        def sample(px, py):
+            px = min(max(px, 0.0), magnitude.shape[1] - 1.001)
+            py = min(max(py, 0.0), magnitude.shape[0] - 1.001)
+            ix, iy = int(px), int(py)
+            fx, fy = px - ix, py - iy
+            return ((1 - fx) * (1 - fy) * magnitude[iy, ix] + fx * (1 - fy) * magnitude[iy, ix + 1]
+                    + (1 - fx) * fy * magnitude[iy + 1, ix] + fx * fy * magnitude[iy + 1, ix + 1])
+
+        before = sample(cx - normal[0], cy - normal[1])
+        after = sample(cx + normal[0], cy + normal[1])
+        curvature = before - 2 * magnitude[cy, cx] + after
+        if curvature >= 0:
+            return None  # Not a peak across the edge, so there is nothing to refine onto
+        offset = float(np.clip(0.5 * (before - after) / curvature, -0.5, 0.5))
+
+        # Only move across the edge; keep where along it the operator clicked
+        tangent = np.array([-normal[1], normal[0]])
+        along = float(np.clip(np.dot(np.subtract(point, (x, y)), tangent), -radius / zoom, radius / zoom))
+        return [float(x + offset * normal[0] + along * tangent[0]), float(y + offset * normal[1] + along * tangent[1])]
+
+
+def detection_tiles(x0, y0, x1, y1, size=DETECT_TILE_SIZE, overlap=DETECT_TILE_OVERLAP):
+    """Split an ROI into tiles for detection. Returns (crop, core) boxes as (x0, y0, x1, y1).
+
+    Crops overlap by overlap pixels so features on a seam are seen whole;
+    cores don't overlap, and a feature is kept only by the tile whose core
+    holds its centre.
+    """
+    tiles = []
+    for ty in range(y0, y1, size):
+        for tx in range(x0, x1, size):
+            core = (tx, ty, min(tx + size, x1), min(ty + size, y1))
+            crop = (max(x0, tx - overlap), max(y0, ty - overlap), min(x1, core[2] + overlap), min(y1, core[3] + overlap))
+            tiles.append((crop, core))
+    return tiles
+
+
+def contour_threshold(image, box, max_samples=1 << 20):
+    """Otsu threshold and polarity for contour detection, shared by every tile of an ROI.
+
+    Returns (threshold, invert) with invert set when the features are darker than the background.
+    """
+    x0, y0, x1, y1 = box
+    step = max(1, int(np.sqrt((x1 - x0) * (y1 - y0) / max_samples)))
+    sample = image[y0:y1:step, x0:x1:step]
+    if sample.ndim == 3:
+        sample = cv2.cvtColor(np.ascontiguousarray(sample), cv2.COLOR_BGR2GRAY)
+    threshold, _ = cv2.threshold(sample, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    # Features are whatever covers less of the ROI
+    return threshold, np.count_nonzero(sample > threshold) > sample.size / 2
+
+
+def detect_features(image, crop, core, kinds, threshold=None):
+    """Detect circles, line segments and/or contours in one tile of image.
+
+    kinds is a collection of "circles", "segments" and "contours"; threshold
+    is contour_threshold's result for the ROI. Returns a dict of (n, k)
+    arrays in image coordinates: circles as (cx, cy, r), segments as
+    (x1, y1, x2, y2) and contours as their minimum area rectangles
+    (cx, cy, w, h, angle). Features whose centre is outside core are dropped.
+    """
+    x0, y0, x1, y1 = crop
+    gray = image[y0:y1, x0:x1]
+    if gray.ndim == 3:
+        gray = cv2.cvtColor(gray, cv2.COLOR_BGR2GRAY)
+    found = {}
+
+    def in_core(cx, cy):
+        return (cx >= core[0]) & (cx < core[2]) & (cy >= core[1]) & (cy < core[3])
+
+    if "circles" in kinds:
+        circles = cv2.HoughCircles(
+            cv2.medianBlur(gray, 5), cv2.HOUGH_GRADIENT_ALT, dp=1, minDist=DETECT_MIN_SIZE,
+            param1=300, param2=0.85, minRadius=DETECT_MIN_SIZE // 2, maxRadius=DETECT_TILE_OVERLAP,
+        )
+        circles = np.zeros((0, 3)) if circles is None else circles.reshape(-1, 3).astype(np.float64)
+        circles[:, :2] += (x0, y0)
+        found["circles"] = circles[in_core(circles[:, 0], circles[:, 1])]
+
+    if "segments" in kinds:
+        segments = cv2.createLineSegmentDetector().detect(gray)[0]
+        segments = np.zeros((0, 4)) if segments is None else segments.reshape(-1, 4).astype(np.float64)
+        segments = segments[np.hypot(segments[:, 2] - segments[:, 0], segments[:, 3] - segments[:, 1]) >= DETECT_MIN_LENGTH]
+        segments += (x0, y0, x0, y0)
+        found["segments"] = segments[in_core((segments[:, 0] + segments[:, 2]) / 2, (segments[:, 1] + segments[:, 3]) / 2)]
+
+    if "contours" in kinds:
+        level, invert = threshold if threshold is not None else contour_threshold(gray, (0, 0, x1 - x0, y1 - y0))
+        _, mask = cv2.threshold(gray, level, 255, cv2.THRESH_BINARY_INV if invert else cv2.THRESH_BINARY)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        rects = []
+        for contour in contours:
+            bx, by, bw, bh = cv2.boundingRect(contour)
+            # Contours cut by the crop are partial; the tile that sees them whole keeps them
+            if bx == 0 or by == 0 or bx + bw == x1 - x0 or by + bh == y1 - y0:
+                continue
+            if cv2.contourArea(contour) < DETECT_MIN_SIZE ** 2:
+                continue
+            (cx, cy), (w, h), angle = cv2.minAreaRect(contour)
+            rects.append((cx + x0, cy + y0, w, h, angle))
+        rects = np.array(rects, np.float64).reshape(-1, 5)
+        found["contours"] = rects[in_core(rects[:, 0], rects[:, 1])]
+    return found
+
+
+def feature_measurements(found, scale_factor=None):
+    """Turn detect_features results into (lines, angles) in the tuples MetrologyApp keeps.
+
+    Circles give a horizontal diameter, segments their length and their
+    inclination to the horizontal, and contours the width and height of
+    their minimum area rectangle.
+    """
+    lines, angles = [], []
+
+    def add_line(start, end):
+        lines.append((start, end, line_distance(start, end, scale_factor)[1]))
+
+    for cx, cy, r in np.asarray(found.get("circles", [])).tolist():
+        add_line([cx - r, cy], [cx + r, cy])
+    for x1, y1, x2, y2 in np.asarray(found.get("segments", [])).tolist():
+        if x2 < x1:
+            x1, y1, x2, y2 = x2, y2, x1, y1
+        add_line([x1, y1], [x2, y2])
+        end, start, reference = [x2, y2], [x1, y1], [x1 + float(np.hypot(x2 - x1, y2 - y1)), y1]
+        angles.append((end, start, reference, angle_at_vertex(end, start, reference)))
+    for cx, cy, w, h, angle in np.asarray(found.get("contours", [])).tolist():
+        theta = np.radians(angle)
+        for half, (ax, ay) in ((w / 2, (np.cos(theta), np.sin(theta))), (h / 2, (-np.sin(theta), np.cos(theta)))):
+            add_line([cx - half * ax, cy - half * ay], [cx + half * ax, cy + half * ay])
+    return lines, angles
+
+
+def circle_spacings(centres, chunk=1024):
+    """Return unique (i, j) index pairs joining every circle centre to its nearest neighbour."""
+    centres = np.asarray(centres, np.float64).reshape(-1, 2)
+    if len(centres) < 2:
+        return []
+    pairs = set()
+    for start in range(0, len(centres), chunk):
+        block = centres[start:start + chunk]
+        distances = np.hypot(block[:, None, 0] - centres[None, :, 0], block[:, None, 1] - centres[None, :, 1])
+        distances[np.arange(len(block)), np.arange(start, start + len(block))] = np.inf
+        for i, j in enumerate(distances.argmin(axis=1), start):
+            pairs.add((min(i, j), max(i, j)))
+    return sorted(pairs)
+
+
+def fiducial_templates(pyramid, box):
+    """Crop the fiducial box (x0, y0, x1, y1) from every pyramid level as greyscale templates."""
+    x0, y0, x1, y1 = (int(round(v)) for v in box)
+    templates = []
+    for level, image in enumerate(pyramid):
+        crop = image[y0 >> level:y1 >> level, x0 >> level:x1 >> level]
+        if min(crop.shape[:2]) < ALIGN_MIN_TEMPLATE:
+            break
+        templates.append(cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop.copy())
+    return templates
+
+
+def _match_peak(image, template):
+    """Return the sub-pixel top-left position of template's best match in image and its score."""
+    response = cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED)
+    _, score, _, (x, y) = cv2.minMaxLoc(response)
+
+    def offset(before, peak, after):
+        denominator = before - 2 * peak + after
+        return 0.5 * (before - after) / denominator if denominator < 0 else 0.0
+
+    dx = offset(response[y, x - 1], score, response[y, x + 1]) if 0 < x < response.shape[1] - 1 else 0.0
+    dy = offset(response[y - 1, x], score, response[y + 1, x]) if 0 < y < response.shape[0] - 1 else 0.0
+    return x + dx, y + dy, score
+
+
+def register_fiducial(templates, box, pyramid, search=ALIGN_SEARCH_SIZE):
+    """Find the fiducial of templates (cropped at box in the reference image) in pyramid.
+
+    A coarse template match over a small pyramid level finds the fiducial
+    anywhere in the image; a full-resolution match in a window around it
+    refines the shift, and ORB features matched with RANSAC add a rotation
+    about the fiducial when there are enough of them and it is significantly
+    non-zero. Returns a dict with the 2x3 "matrix" mapping reference to new
+    image coordinates, the match "score" and the ORB "inliers" (0 for a pure
+    shift), or None if the fiducial was not found.
+    """
+    x0, y0 = box[0], box[1]
+    level = 0
+    while level + 1 < min(len(templates), len(pyramid)) and max(pyramid[level].shape[:2]) > search:
+        level += 1
+    image = pyramid[level]
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    template = templates[level]
+    if template.shape[0] > image.shape[0] or template.shape[1] > image.shape[1]:
+        return None
+    mx, my, score = _match_peak(image, template)
+    if score < ALIGN_MIN_SCORE:
+        return None
+
+    # Refine at full resolution in a window a few coarse pixels around the coarse match
+    template = templates[0]
+    th, tw = template.shape[:2]
+    margin = 2 ** (level + 1) + 2
+    wx0 = int(max(0, np.floor(mx * 2 ** level) - margin))
+    wy0 = int(max(0, np.floor(my * 2 ** level) - margin))
+    wx1 = int(min(pyramid[0].shape[1], wx0 + tw + 2 * margin))
+    wy1 = int(min(pyramid[0].shape[0], wy0 + th + 2 * margin))
+    window = pyramid[0][wy0:wy1, wx0:wx1]
+    if window.ndim == 3:
+        window = cv2.cvtColor(window, cv2.COLOR_BGR2GRAY)
+    if window.shape[0] < th or window.shape[1] < tw:
+        return None
+    fx, fy, score = _match_peak(window, template)
+    matrix = np.array([[1.0, 0.0, wx0 + fx - x0], [0.0, 1.0, wy0 + fy - y0]])
+    inliers = 0
+
+    # Rotation from ORB features of the template and the matched area
+    orb = cv2.ORB_create(ALIGN_ORB_FEATURES)
+    kp1, des1 = orb.detectAndCompute(template, None)
+    kp2, des2 = orb.detectAndCompute(window, None)
+    if des1 is not None and des2 is not None and len(kp1) >= ALIGN_MIN_INLIERS and len(kp2) >= ALIGN_MIN_INLIERS:
+        matches = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True).match(des1, des2)
+        if len(matches) >= ALIGN_MIN_INLIERS:
+            src = np.float32([kp1[m.queryIdx].pt for m in matches]) + np.float32([x0, y0])
+            dst = np.float32([kp2[m.trainIdx].pt for m in matches]) + np.float32([wx0, wy0])
+            affine, mask = cv2.estimateAffinePartial2D(src, dst, method=cv2.RANSAC, ransacReprojThreshold=2.0)
+            # Trust the features only if they agree with the template match at the fiducial's centre
+            centre = np.array([x0 + (tw - 1) / 2, y0 + (th - 1) / 2])
+            if affine is not None and int(mask.sum()) >= ALIGN_MIN_INLIERS \
+                    and np.hypot(*(affine @ (*centre, 1) - matrix @ (*centre, 1))) < margin:
+                inlier = mask.ravel().astype(bool)
+                angle = _significant_rotation(src[inlier], dst[inlier])
+                if angle is not None:
+                    angle = _refine_rotation(window, template, angle)
+                    found = _rotated_match(window, template, angle)
+                    if found is not None:
+                        # Rotate about the fiducial's centre, placed by the sub-pixel match of the rotated
+                        # template: it pins the shift far better than a handful of features
+                        rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+                        matrix = np.hstack([rotation, (found[:2] + (wx0, wy0) - rotation @ centre)[:, None]])
+                        inliers = int(inlier.sum())
+    return {"matrix": matrix, "score": float(score), "inliers": inliers}
+
+
+def _refine_rotation(window, template, angle, step=ALIGN_ANGLE_STEP):
+    """Refine a feature-based rotation with a parabola through the match scores of the rotated template."""
+    scores = [_rotated_match(window, template, angle + delta) for delta in (-step, 0.0, step)]
+    if any(score is None for score in scores):
+        return angle
+    before, peak, after = (score[2] for score in scores)
+    curvature = before - 2 * peak + after
+    if curvature >= 0:
+        return angle
+    return angle + step * float(np.clip(0.5 * (before - after) / curvature, -1.0, 1.0))
+
+
+def _rotated_match(window, template, angle):
+    """Return (x, y, score): where template's centre lies in window once rotated by angle, or None.
+
+    The corners the rotation brings in from outside the template are trimmed off before matching.
+    """
+    th, tw = template.shape[:2]
+    pivot = ((tw - 1) / 2, (th - 1) / 2)
+    rotation = cv2.getRotationMatrix2D(pivot, -np.degrees(angle), 1.0)  # OpenCV angles turn the other way
+    rotated = cv2.warpAffine(template, rotation, (tw, th), flags=cv2.INTER_CUBIC)
+    trim = int(np.ceil(max(th, tw) * abs(np.sin(angle)))) + 1
+    rotated = rotated[trim:th - trim, trim:tw - trim]
+    if min(rotated.shape[:2]) < ALIGN_MIN_TEMPLATE:
+        return None
+    x, y, score = _match_peak(window, rotated)
+    if score < ALIGN_MIN_SCORE:
+        return None
+    return np.array([x - trim + pivot[0], y - trim + pivot[1], score])
+
+
+def _significant_rotation(src, dst):
+    """Return the rigid rotation angle from matched points src -> dst, or None if it is not significantly non-zero.
+
+    Parts are imaged at a fixed scale, so only rotation is fitted (least
+    squares). Its standard error follows from the residuals of the fit; a
+    rotation within ALIGN_ROTATION_SIGMAS of zero is feature noise, and
+    applying it would move points far from the fiducial by whole pixels.
+    """
+    src = np.asarray(src, np.float64)
+    dst = np.asarray(dst, np.float64)
+    p, q = src - src.mean(axis=0), dst - dst.mean(axis=0)
+    angle = np.arctan2((p[:, 0] * q[:, 1] - p[:, 1] * q[:, 0]).sum(), (p * q).sum())
+    rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+    residual = q - p @ rotation.T
+    # Three parameters are fitted: the shift in x and y and the rotation
+    sigma = np.sqrt((residual ** 2).sum() / max(1, 2 * len(p) - 3))
+    spread = np.sqrt((p ** 2).sum())
+    if spread == 0 or abs(angle) <= ALIGN_ROTATION_SIGMAS * sigma / spread:
+        return None
+    return float(angle)
+
+
+EXPORT_FIELDS = ["image", "type", "index", "x1", "y1", "x2", "y2", "x3", "y3", "value", "unit", "scale_mm_per_px"]
+EXPORT_FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".parquet": "parquet"}
+EXPORT_CHUNK_ROWS = 65536
+
+
+def measurement_blocks(lines, angles, scale_factor=None, image="", shapes=()):
+    """Convert lines, angles and shapes into column blocks for MeasurementWriter.
+
+    Each block holds one measurement type as arrays: "index" (n,), "points"
+    (n, 2), (n, 4) or (n, 6) and "value" (n,), plus the constants shared by
+    its rows. Values are computed for the whole array at once. A shape gives
+    one row per metric, placed at its centroid or at the centre of its fit.
+    """
+    blocks = []
+    if lines:
+        points = np.array([(start[0], start[1], end[0], end[1]) for start, end, _ in lines], dtype=float)
+        value = np.hypot(points[:, 2] - points[:, 0], points[:, 3] - points[:, 1])
+        if scale_factor:
+            value *= scale_factor
+        blocks.append({
+            "image": image, "type": "line", "unit": "mm" if scale_factor else "px", "scale": scale_factor,
+            "index": np.arange(len(points)), "points": points, "value": value,
+        })
+    if angles:
+        points = np.array([(*p1[:2], *p2[:2], *p3[:2]) for p1, p2, p3, _ in angles], dtype=float)
+        value = np.abs(np.degrees(
+            np.arctan2(points[:, 5] - points[:, 3], points[:, 4] - points[:, 2])
+            - np.arctan2(points[:, 1] - points[:, 3], points[:, 0] - points[:, 2])
+        ))
+        value = np.where(value > 180, 360 - value, value)
+        blocks.append({
+            "image": image, "type": "angle", "unit": "deg", "scale": scale_factor,
+            "index": np.arange(len(points)), "points": points, "value": value,
+        })
+
+    length_unit = "mm" if scale_factor else "px"
+    length_scale = scale_factor or 1.0
+    for kind in ("polygon", "polyline"):
+        indexed = list(enumerate(metrics for shape_kind, _, metrics in shapes if shape_kind == kind))
+        if not indexed:
+            continue
+        index = np.array([i for i, _ in indexed])
+        centroids = np.array([metrics["centroid"] for _, metrics in indexed], dtype=float).reshape(-1, 2)
+        lengths = np.array([metrics["length"] for _, metrics in indexed], dtype=float) * length_scale
+        rows = []
+        if kind == "polygon":
+            areas = np.array([metrics["area"] for _, metrics in indexed], dtype=float) * length_scale ** 2
+            rows.append(("polygon_area", length_unit + "2", index, centroids, areas))
+            rows.append(("polygon_perimeter", length_unit, index, centroids, lengths))
+        else:
+            rows.append(("polyline_length", length_unit, index, centroids, lengths))
+        fitted = [(i, metrics) for i, metrics in indexed if "circle" in metrics]
+        if fitted:
+            circles = np.array([metrics["circle"] for _, metrics in fitted], dtype=float)
+            rows.append((f"{kind}_circle_diameter", length_unit, np.array([i for i, _ in fitted]),
+                         circles[:, :2], circles[:, 2] * 2 * length_scale))
+        fitted = [(i, metrics) for i, metrics in indexed if "ellipse" in metrics]
+        if fitted:
+            centres = np.array([metrics["ellipse"][0] for _, metrics in fitted], dtype=float)
+            axes = np.array([metrics["ellipse"][1] for _, metrics in fitted], dtype=float) * length_scale
+            fitted_index = np.array([i for i, _ in fitted])
+            rows.append((f"{kind}_ellipse_major", length_unit, fitted_index, centres, axes[:, 0]))
+            rows.append((f"{kind}_ellipse_minor", length_unit, fitted_index, centres, axes[:, 1]))
+        for measurement_type, unit, row_index, points, value in rows:
+            blocks.append({
+                "image": image, "type": measurement_type, "unit": unit, "scale": scale_factor,
+                "index": row_index, "points": points, "value": value,
+            })
+    return blocks
+
+
+class MeasurementWriter:
+    """Stream measurement blocks to a CSV, JSON Lines or Parquet file.
+
+    Rows are formatted a chunk at a time with a single format operation per
+    chunk, so memory stays bounded by EXPORT_CHUNK_ROWS whatever the total.
+    """
+
+    def __init__(self, path, fmt=None):
+        if fmt is None:
+            fmt = EXPORT_FORMATS.get(path[path.rfind("."):].lower())
+        if fmt not in EXPORT_FORMATS.values():
+            raise ValueError(f"Unsupported export format for {path}, use one of {', '.join(EXPORT_FORMATS)}")
+        self.fmt = fmt
+        self.rows_written = 0
+        self._parquet = None
+        if fmt == "parquet":
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise ValueError("Parquet export requires pyarrow (pip install pyarrow)")
+            self._pa = pa
+            self._schema = pa.schema(
+                [("image", pa.string()), ("type", pa.string()), ("index", pa.int64())]
+                + [(name, pa.float64()) for name in EXPORT_FIELDS[3:10]]
+                + [("unit", pa.string()), ("scale_mm_per_px", pa.float64())]
+            )
+            self._parquet = pq.ParquetWriter(path, self._schema)
+        else:
+            self._file = open(path, "w", newline="", encoding="utf-8")
+            if fmt == "csv":
+                self._file.write(",".join(EXPORT_FIELDS) + "\n")
+
+    def _row_format(self, block):
+        """Build the %-format string for one row of a block, with its constants baked in."""
+        n_coords = block["points"].shape[1]
+        scale = block["scale"]
+        if self.fmt == "csv":
+            def text(value):
+                value = str(value)
+                if any(c in value for c in ',"\n'):
+                    value = '"' + value.replace('"', '""') + '"'
+                return value.replace("%", "%%")
+            coords = ",".join(["%.4f"] * n_coords + [""] * (6 - n_coords))
+            return (f"{text(block['image'])},{block['type']},%d,{coords},%.6f,"
+                    f"{block['unit']},{'' if scale is None else repr(float(scale))}\n")
+        coords = ", ".join(
+            f'"{name}": %.4f' if i < n_coords else f'"{name}": null'
+            for i, name in enumerate(EXPORT_FIELDS[3:9])
+        )
+        return ('{"image": ' + json.dumps(str(block["image"])).replace("%", "%%")
+                + f', "type": "{block["type"]}", "index": %d, {coords}, "value": %.6f, "unit": "{block["unit"]}", '
+                + f'"scale_mm_per_px": {json.dumps(scale)}}}\n')
+
+    def write(self, block):
+        """Append one block produced by measurement_blocks."""
+        n = len(block["index"])
+        if self._parquet is not None:
+            self._write_parquet(block, n)
+            self.rows_written += n
+            return
+        row_format = self._row_format(block)
+        numeric = np.column_stack([block["index"], block["points"], block["value"]])
+        for start in range(0, n, EXPORT_CHUNK_ROWS):
+            chunk = numeric[start:start + EXPORT_CHUNK_ROWS]
+            self._file.write((row_format * len(chunk)) % tuple(chunk.ravel().tolist()))
+        self.rows_written += n
+
+    def _write_parquet(self, block, n):
+        pa = self._pa
+        points = block["points"]
+        for start in range(0, n, EXPORT_CHUNK_ROWS):
+            stop = min(start + EXPORT_CHUNK_ROWS, n)
+            size = stop - start
+            columns = [
+                pa.array([str(block["image"])] * size, pa.string()),
+                pa.array([block["type"]] * size, pa.string()),
+                pa.array(block["index"][start:stop], pa.int64()),
+            ]
+            for i in range(6):
+                if i < points.shape[1]:
+                    columns.append(pa.array(points[start:stop, i], pa.float64()))
+                else:
+                    columns.append(pa.nulls(size, pa.float64()))
+            columns += [
+                pa.array(block["value"][start:stop], pa.float64()),
+                pa.array([block["unit"]] * size, pa.string()),
+                pa.array([block["scale"]] * size, pa.float64()),
+            ]
+            self._parquet.write_table(pa.Table.from_arrays(columns, schema=self._schema))
+
+    def close(self):
+        if self._parquet is not None:
+            self._parquet.close()
+        else:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def export_measurements(path, lines, angles, scale_factor=None, image="", fmt=None, shapes=()):
+    """Export lines, angles and shapes with their calibration to CSV, JSON Lines or Parquet. Returns the row count."""
+    with MeasurementWriter(path, fmt) as writer:
+        for block in measurement_blocks(lines, angles, scale_factor, image, shapes):
+            writer.write(block)
+    return writer.rows_written
+
+
+def overlay_json(lines, angles, shapes=(), scale_factor=None, line_color="blue", text_color="yellow", transform=None):
+    """Return the measurements as a compact JSON-ready dict for the browser viewer.
+
+    Lines are [x1, y1, x2, y2, label], angles [x1, y1, x2, y2, x3, y3, label]
+    with the vertex second, and shapes {"kind", "points", "label", "at"}.
+    transform optionally maps the (n, 2) points into the served image's
+    pixels, e.g. CameraModel.to_raw while measuring in undistorted coordinates.
+    """
+    counts = [2 * len(lines), 3 * len(angles)] + [len(points) + 1 for _, points, _ in shapes]
+    if not sum(counts):
+        points = np.empty((0, 2))
+    else:
+        points = np.concatenate(
+            [np.asarray([p for line in lines for p in line[:2]], np.float64).reshape(-1, 2),
+             np.asarray([p for angle in angles for p in angle[:3]], np.float64).reshape(-1, 2)]
+            + [np.vstack([np.asarray(points, np.float64).reshape(-1, 2), [metrics["centroid"]]])
+               for _, points, metrics in shapes]
+        )
+        if transform is not None:
+            points = np.asarray(transform(points), np.float64).reshape(-1, 2)
+    points = np.round(points, 2)
+    line_points = points[:counts[0]].reshape(-1, 4).tolist()
+    angle_points = points[counts[0]:counts[0] + counts[1]].reshape(-1, 6).tolist()
+    shape_points = np.split(points[counts[0] + counts[1]:], np.cumsum(counts[2:])[:-1]) if shapes else []
+    return {
+        "scale_factor": scale_factor, "line_color": line_color, "text_color": text_color,
+        "lines": [xy + [f"{distance:.2f} mm" if distance is not None else ""]
+                  for xy, (_, _, distance) in zip(line_points, lines)],
+        "angles": [xy + [f"{angle:.2f}°"] for xy, (*_, angle) in zip(angle_points, angles)],
+        "shapes": [{"kind": kind, "points": path[:-1].tolist(), "at": path[-1].tolist(),
+                    "label": shape_label(kind, metrics, scale_factor)}
+                   for path, (kind, _, metrics) in zip(shape_points, shapes)],
+    }
+
+
+class TileServer:
+    """Serve the current image as pyramid tiles and its measurements as JSON over HTTP.
+
+    Reviewers open url in a browser and pan and zoom the image in
+    VisionMetrics_viewer.html, with no install and no external services. Tiles
+    are cut from the pyramid the app already decoded, JPEG-encoded on the
+    worker pool at background priority and kept in a byte-bounded LRU, so
+    every reviewer shares one decode and one encode per tile; concurrent
+    requests for a tile that is still being encoded wait for it rather than
+    encoding it again. Every response carries an ETag, and a matching
+    If-None-Match is answered with 304 before any tile is touched.
+    """
+
+    def __init__(self, pool, host="127.0.0.1", port=TILE_SERVER_PORT, cache_bytes=TILE_CACHE_BYTES, perf=None):
+        self.pool = pool
+        self.cache_bytes = cache_bytes
+        self.perf = perf
+        self._token = os.urandom(4).hex()  # Keeps ETags from an earlier server from matching
+        self._image = (0, None, "")  # (version, pyramid, name), swapped as one
+        self._measurements = (0, None)  # (version, overlay_json arguments)
+        self._overlay = (None, None)  # (version, encoded body) of the last overlay served
+        self._overlay_lock = threading.Lock()  # One encode per overlay version, however many reviewers ask
+        self._tiles = OrderedDict()  # (image version, level, tx, ty) -> JPEG bytes
+        self._tile_bytes = 0
+        self._encoding = {}  # Tile key -> Event set once it is cached
+        self._lock = threading.Lock()
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # Only needed once sharing starts
+        handler = type("TileRequestHandler", (_TileRequests, BaseHTTPRequestHandler), {})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._server.tiles = self
+        with open(TILE_VIEWER_PATH, "rb") as f:
+            self.viewer = f.read()
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        if host in ("0.0.0.0", "::"):
+            host = socket.gethostname()  # Reachable from the LAN
+        elif host == "127.0.0.1":
+            host = "localhost"
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        """Serve on a background thread."""
+        threading.Thread(target=self.serve_forever, name="tile_server", daemon=True).start()
+
+    def serve_forever(self):
+        """Serve on this thread until stop() is called."""
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def set_image(self, pyramid, name=""):
+        """Serve pyramid from now on; tiles of the previous image are dropped."""
+        with self._lock:
+            self._image = (self._image[0] + 1, pyramid, name)
+            self._tiles.clear()
+            self._tile_bytes = 0
+
+    def set_measurements(self, lines, angles, shapes=(), scale_factor=None, line_color="blue", text_color="yellow",
+                         transform=None):
+        """Serve these measurements as the overlay; they are only encoded once a browser asks for them."""
+        arguments = (list(lines), list(angles), list(shapes), scale_factor, line_color, text_color, transform)
+        with self._lock:
+            self._measurements = (self._measurements[0] + 1, arguments)
+
+    def etag(self, *key):
+        return '"' + "-".join(str(part) for part in (self._token,) + key) + '"'
+
+    def info(self):
+        """Return the image size, tile size and level sizes for the viewer, or None if no image is loaded."""
+        version, pyramid, name = self._image
+        if pyramid is None:
+            return None
+        height, width = pyramid[0].shape[:2]
+        return {
+            "name": name, "version": version, "width": width, "height": height, "tile_size": TILE_SIZE,
+            "levels": [[level.shape[1], level.shape[0]] for level in pyramid],
+        }
+
+    def overlay_version(self):
+        return self._measurements[0]
+
+    def overlay(self):
+        """Return (version, JSON bytes) of the current measurements, encoding them on first request."""
+        with self._overlay_lock:
+            version, arguments = self._measurements
+            encoded_version, body = self._overlay
+            if encoded_version != version:
+                body = self.pool.submit(
+                    lambda: json.dumps(overlay_json(*(arguments or ([], [])))).encode(), PRIORITY_BACKGROUND
+                ).result()
+                self._overlay = (version, body)
+            return version, body
+
+    def tile(self, version, level, tx, ty):
+        """Return the JPEG bytes of a tile of image version, or None if it does not exist."""
+        key = (version, level, tx, ty)
+        with self._lock:
+            body = self._tiles.get(key)
+            if body is not None:
+                self._tiles.move_to_end(key)
+                return body
+            encoding = self._encoding.get(key)
+            if encoding is None:
+                self._encoding[key] = threading.Event()
+        if encoding is not None:
+            # Another reviewer asked first; share their encode
+            encoding.wait()
+            with self._lock:
+                body = self._tiles.get(key)
+            if body is not None:
+                return body
+            return self.tile(version, level, tx, ty)
+
+        body = None
+        try:
+            body = self.pool.submit(lambda: self._encode_tile(*key), PRIORITY_BACKGROUND).result()
+        finally:
+            with self._lock:
+                if body is not None and self._image[0] == version:
+                    self._tiles[key] = body
+                    self._tile_bytes += len(body)
+                    while self._tile_bytes > self.cache_bytes and len(self._tiles) > 1:
+                        _, evicted = self._tiles.popitem(last=False)
+                        self._tile_bytes -= len(evicted)
+                self._encoding.pop(key).set()
+        return body
+
+    def _encode_tile(self, version, level, tx, ty):
+        image_version, pyramid, _ = self._image
+        if image_version != version or pyramid is None or not 0 <= level < len(pyramid) or tx < 0 or ty < 0:
+            return None
+        crop = pyramid[level][ty * TILE_SIZE:(ty + 1) * TILE_SIZE, tx * TILE_SIZE:(tx + 1) * TILE_SIZE]
+        if not crop.size:
+            return None
+        if self.perf is not None and self.perf.tracing:
+            with self.perf.span("encode_tile", "server", level=level, tx=tx, ty=ty):
+                ok, encoded = cv2.imencode(".jpg", crop, [cv2.IMWRITE_JPEG_QUALITY, TILE_JPEG_QUALITY])
+        else:
+            ok, encoded = cv2.imencode(".jpg", crop, [cv2.IMWRITE_JPEG_QUALITY, TILE_JPEG_QUALITY])
+        return encoded.tobytes() if ok else None
+
+
+class _TileRequests:
+    """Answer the viewer's requests for a TileServer: /, /info.json, /overlay.json and /tiles/<level>/<x>/<y>.jpg.
+
+    Mixed into http.server's BaseHTTPRequestHandler when the server is created.
+    """
+
+    server_version = "VisionMetrics"
+
+    def do_GET(self):
+        tiles = self.server.tiles
+        path = urlsplit(self.path).path
+        if path in ("/", "/index.html"):
+            self.reply(tiles.viewer, "text/html; charset=utf-8", tiles.etag("viewer"))
+        elif path == "/info.json":
+            info = tiles.info()
+            if info is None:
+                self.send_error(503, "No image loaded")
+            else:
+                self.reply(json.dumps(info).encode(), "application/json", tiles.etag("info", info["version"]))
+        elif path == "/overlay.json":
+            if self.not_modified(tiles.etag("overlay", tiles.overlay_version())):
+                return
+            version, body = tiles.overlay()
+            self.reply(body, "application/json", tiles.etag("overlay", version))
+        elif path.startswith("/tiles/") and path.endswith(".jpg"):
+            try:
+                level, tx, ty = (int(part) for part in path[len("/tiles/"):-len(".jpg")].split("/"))
+                version = int(parse_qs(urlsplit(self.path).query).get("v", ["0"])[0])
+            except ValueError:
+                self.send_error(404)
+                return
+            etag = tiles.etag("tile", version, level, tx, ty)
+            if self.not_modified(etag):
+                return
+            body = tiles.tile(version, level, tx, ty)
+            if body is None:
+                self.send_error(404)
+            else:
+                self.reply(body, "image/jpeg", etag)
+        else:
+            self.send_error(404)
+
+    def not_modified(self, etag):
+        """Answer 304 and return True if the browser already holds etag."""
+        if etag not in (self.headers.get("If-None-Match") or "").split(", "):
+            return False
+        self.send_response(304)
+        self.send_header("ETag", etag)
+        self.end_headers()
+        return True
+
+    def reply(self, body, content_type, etag):
+        if self.not_modified(etag):
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")  # Revalidate with If-None-Match every time
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # One line per tile would drown the console
+
+
+class PerfMonitor:
+    """Per-call timings of the hot paths, per-frame canvas statistics and trace recording.
+
+    Nothing is recorded while both timing and tracing are off; instrumented
+    methods then cost a single attribute check.
+    """
+
+    def __init__(self):
+        self.enabled = False  # Live timings and HUD
+        self.tracing = False  # Chrome trace recording
+        self.active = False  # Either of the above
+        self.trace_events = []
+        self.thread_names = {}
+        self._trace_start = 0.0
+        self.stats = {}  # Name -> [calls, total seconds, last seconds, max seconds]
+        self.frame_ends = deque()
+        self.last_frame_ms = 0.0
+        self.canvas_items = 0
+        self.photo_bytes = 0  # Size of the current PhotoImage
+        self.photo_bytes_total = 0  # Everything allocated for PhotoImages since enabled
+        self._frame_depth = 0
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        self.active = self.enabled or self.tracing
+        self.reset()
+
+    def start_trace(self):
+        """Start recording spans from all threads for a Chrome trace."""
+        self.trace_events = []
+        self.thread_names = {}
+        self._trace_start = time.perf_counter()
+        self.tracing = True
+        self.active = True
+
+    def stop_trace(self):
+        self.tracing = False
+        self.active = self.enabled
+
+    def add_span(self, name, category, start, end, args=None):
+        """Record a complete span; safe to call from any thread."""
+        thread = threading.current_thread()
+        self.thread_names.setdefault(thread.ident, thread.name)
+        event = {
+            "name": name, "cat": category, "ph": "X", "pid": os.getpid(), "tid": thread.ident,
+            "ts": (start - self._trace_start) * 1e6, "dur": (end - start) * 1e6,
+        }
+        if args:
+            event["args"] = args
+        self.trace_events.append(event)
+
+    def add_counter(self, name, values):
+        """Record counter values, such as a queue depth, at this moment; safe to call from any thread."""
+        self.trace_events.append({
+            "name": name, "ph": "C", "pid": os.getpid(),
+            "ts": (time.perf_counter() - self._trace_start) * 1e6, "args": values,
+        })
+
+    @contextmanager
+    def span(self, name, category="app", **args):
+        """Record the enclosed block as a trace span while tracing."""
+        if not self.tracing:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, category, start, time.perf_counter(), args)
+
+    def write_trace(self, path):
+        """Write the recorded spans in Chrome Trace Event format (chrome://tracing, Perfetto)."""
+        pid = os.getpid()
+        metadata = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": "Vision Metrics"}}]
+        metadata += [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+            for tid, name in list(self.thread_names.items())
+        ]
+        # Copy first, worker threads may still be appending
+        events = list(self.trace_events)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f)
+        return len(events)
+
+    def reset(self):
+        self.stats.clear()
+        self.frame_ends.clear()
+        self.last_frame_ms = 0.0
+        self.photo_bytes_total = 0
+
+    def record(self, name, seconds):
+        entry = self.stats.get(name)
+        if entry is None:
+            self.stats[name] = [1, seconds, seconds, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = seconds
+            if seconds > entry[3]:
+                entry[3] = seconds
+
+    def record_photo(self, width, height):
+        # Tk photo images keep 4 bytes per pixel
+        self.photo_bytes = width * height * 4
+        self.photo_bytes_total += self.photo_bytes
+
+    def frame_done(self, seconds):
+        now = time.perf_counter()
+        self.last_frame_ms = seconds * 1000
+        self.frame_ends.append(now)
+        while self.frame_ends and self.frame_ends[0] < now - HUD_FPS_WINDOW:
+            self.frame_ends.popleft()
+
+    def fps(self):
+        return len(self.frame_ends) / HUD_FPS_WINDOW
+
+    def hud_text(self):
+        return (f"FPS {self.fps():.0f}  frame {self.last_frame_ms:.1f} ms  "
+                f"items {self.canvas_items}  photo {self.photo_bytes / 1024 ** 2:.1f} MB")
+
+    def summary(self):
+        """Return one line per instrumented call: count, mean, last and max in ms."""
+        lines = [f"{'call':<24}{'n':>7}{'mean':>9}{'last':>9}{'max':>9}"]
+        for name, (calls, total, last, longest) in sorted(self.stats.items(), key=lambda item: -item[1][1]):
+            lines.append(f"{name:<24}{calls:>7}{total / calls * 1000:>9.2f}{last * 1000:>9.2f}{longest * 1000:>9.2f}")
+        lines.append(f"PhotoImage bytes allocated: {self.photo_bytes_total / 1024 ** 2:.1f} MB")
+        return "\n".join(lines)
+
+
+def instrumented(name, category="app", frame=False):
+    """Time a MetrologyApp method in self.perf when timing or tracing is on.
+
+    With frame=True the outermost call of such methods counts as one rendered
+    frame and refreshes the on-canvas HUD.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            perf = self.perf
+            if not perf.active:
+                return method(self, *args, **kwargs)
+            if frame:
+                perf._frame_depth += 1
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                end = time.perf_counter()
+                if perf.tracing:
+                    perf.add_span(name, category, start, end)
+                if perf.enabled:
+                    perf.record(name, end - start)
+                if frame:
+                    perf._frame_depth -= 1
+                    if perf._frame_depth == 0 and perf.enabled:
+                        perf.frame_done(end - start)
+                        self.update_hud()
+        return wrapper
+    return decorator
+
+
+class InputRecorder:
+    """Log the canvas input events of a session with timestamps for later replay.
+
+    Events are captured through a bind tag of their own ahead of the canvas
+    bindings, so recording doesn't depend on, or disturb, the app's handlers.
+    """
+
+    tag = "InputRecorder"
+
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.events = []
+        self.recording = False
+        self._start = 0.0
+        for sequence in RECORDED_EVENTS:
+            canvas.bind_class(self.tag, sequence, lambda e, s=sequence: self._log(s, e))
+        canvas.bindtags((self.tag,) + canvas.bindtags())
+
+    def start(self):
+        self.events = []
+        self._start = time.perf_counter()
+        self.recording = True
+
+    def stop(self):
+        self.recording = False
+
+    def _log(self, sequence, event):
+        if self.recording:
+            delta = event.delta if isinstance(event.delta, int) else 0
+            state = event.state if isinstance(event.state, int) else 0
+            self.events.append([round(time.perf_counter() - self._start, 6), sequence, event.x, event.y, delta, state])
+
+    def save(self, path, app):
+        """Write the events with the image and view they were recorded against."""
+        session = {
+            "version": INPUT_SESSION_VERSION,
+            "image": app.image_path,
+            "canvas": [self.canvas.winfo_width(), self.canvas.winfo_height()],
+            "view": {"zoom": app.zoom_level, "offset_x": app.offset_x, "offset_y": app.offset_y},
+            "mode": app.mode.get(),
+            "fields": ["t", "sequence", "x", "y", "delta", "state"],
+            "events": self.events,
+        }
+        with open(path, "w") as f:
+            json.dump(session, f)
+        return len(self.events)
+
 
 class MetrologyApp:
     def __init__(self, root):
+        import_in_background()
         self.root = root
         self.root.title("Vision Metrics")
 
@@ -38,19 +2369,71 @@ class MetrologyApp:
 
         # Image and measurement variables
         self.image = None
+        self.pyramid = None
+        self.edge_snapper = None
+        self.camera_model = None
+        self.image_path = ""
         self.image_tk = None
         self.scale_factor = None
         self.calibration_points = []
         self.measurement_points = []
+        self.roi_points = []  # Corners of the feature detection region
         self.lines = []
         self.angles = []
+        self.shapes = []  # (kind, points, metrics) polygons and polylines
         self.drawn_items = []
-        self.arcs = []  # New list to track drawn arcs
+        self.arcs = []  # Canvas segments of each drawn arc, rebuilt on every redraw
         self.arc_lines = []
         self.action_stack = []  # Stack to track actions for undo
         self.measurement_history = []
         self.is_dark_mode = False
 
+        # Image sequence browsing
+        self.sequence_paths = []
+        self.sequence_index = 0
+        self.sequence_cache = DecodedImageCache()
+        self.prefetcher = None
+        self.image_measurements = {}  # Image path -> (lines, angles, shapes, action_stack, frame) when not carrying over
+        self.video = None
+        self.video_index = None
+        self.video_pending = None  # Frame waiting for the decoder
+        self.video_polling = False
+        self.perf = PerfMonitor()
+        self.workers = WorkerPool(perf=self.perf)  # Every decode, detection and export runs here
+        self.tile_server = None  # Serves the image and measurements to browsers while sharing
+        self.profile_cache = OrderedDict()  # (start, end, width, undistorted) -> profile
+        self.profile_window = None
+        self.profile_line = None  # Index in self.lines of the line shown in the profile window
+        self.profile_key = None
+        self.stats = {group: RunningStats() for group in STATS_GROUPS}  # Kept in step with every add and undo
+        self.tolerances = {}  # Group -> (lower, upper) in mm (px if uncalibrated), degrees for angles
+        self.stats_window = None
+        self.stats_scheduled = False
+        self.history_rows = None  # (group, index) arrays of the sorted or filtered history, None for store order
+        self.history_offsets = [0] * (len(HISTORY_GROUPS) + 1)  # Row where each group starts in store order
+        self.history_dirty = True
+        self.history_top = 0  # First history row in view
+        self.history_selection = None  # (group, index) of the selected history row
+        self.history_scheduled = False
+        self.drag_handles = None  # (points, group, index, slot) arrays of every draggable point, built on demand
+        self.drag = None  # The point being dragged
+        self.viewport_cache = {}  # Last rendered view per slot and what it was rendered for
+        self.compare_pyramid = None  # Second image shown blended with the first in compare mode
+        self.compare_path = ""
+        self.compare_settings = {"mode": "off", "mix": 0.5}
+        self.display_adjustments = {}  # adjust_display arguments, empty for none
+        self.display_scheduled = False
+        self.loupe_photo = None
+        self.loupe_items = None  # Canvas items of the loupe inset while it is drawn
+        self.preview_items = None  # Persistent canvas items of the rubber-band preview
+        self.motion_position = None  # Latest cursor position, handled once per frame
+        self.motion_scheduled = False
+        self.loupe_position = None
+        self.background_results = queue.Queue()
+        self.background_pending = 0
+        self.fiducial = None  # Reference templates and box for aligning measurements to each part
+        self.measurement_frame = None  # 2x3 affine from the fiducial's image to the current measurements, None if identity
+
         # Setup GUI
         self.setup_gui()
 
@@ -64,102 +2447,958 @@ class MetrologyApp:
         self.canvas = Canvas(self.root, bg="gray", relief="sunken", bd=2)
         self.canvas.pack(side="right", padx=10, pady=10, expand=True, fill="both")
         self.canvas.bind("<Motion>", self.on_mouse_motion)
+        self.canvas.bind("<Leave>", self.on_mouse_leave)
+
+        # Video slider, packed below the canvas while a video is open
+        self.video_bar = Frame(self.root, bg="lightgray")
+        self.video_index_var = IntVar(value=0)
+        self.video_scale = Scale(
+            self.video_bar, from_=0, to=0, orient="horizontal", variable=self.video_index_var,
+            command=self.scrub_video, showvalue=0, bg="lightgray"
+        )
+        self.video_scale.pack(fill="x", padx=10, pady=5)
 
         # File Operations
         file_frame = Frame(self.sidebar, bg="lightgray", relief="groove", bd=1)
         file_frame.pack(fill="x", pady=5, padx=5)
         Label(file_frame, text="File Operations", font=("Arial", 12, "bold"), bg="lightgray").pack(pady=5)
         Button(file_frame, text="Load Image", command=self.load_image, width=20).pack(pady=2)
+        Button(file_frame, text="Open Folder", command=self.open_folder, width=20).pack(pady=2)
+        Button(file_frame, text="Previous Image", command=self.previous_image, width=20).pack(pady=2)
+        Button(file_frame, text="Next Image", command=self.next_image, width=20).pack(pady=2)
+        Button(file_frame, text="Open Video", command=self.open_video, width=20).pack(pady=2)
+        self.carry_over_var = IntVar(value=0)
+        Checkbutton(file_frame, text="Carry Over Measurements", variable=self.carry_over_var, bg="lightgray").pack(anchor="w")
+        self.sequence_label = Label(file_frame, text="", bg="lightgray")
+        self.sequence_label.pack()
+        Button(file_frame, text="Load Camera Model", command=self.load_camera_model, width=20).pack(pady=2)
+        self.undistort_var = IntVar(value=0)
+        Checkbutton(file_frame, text="Correct Distortion", variable=self.undistort_var, command=self.toggle_undistortion, bg="lightgray").pack(anchor="w")
         Button(file_frame, text="Save Image", command=self.save_image, width=20).pack(pady=2)
+        Button(file_frame, text="Save Measurements", command=self.save_measurements, width=20).pack(pady=2)
+        Button(file_frame, text="Load Measurements", command=self.load_measurements, width=20).pack(pady=2)
+        Button(file_frame, text="Export Measurements", command=self.export_measurements, width=20).pack(pady=2)
+        self.share_button = Button(file_frame, text="Share in Browser", command=self.toggle_sharing, width=20)
+        self.share_button.pack(pady=2)
+        self.share_lan_var = IntVar(value=0)
+        Checkbutton(file_frame, text="Share on LAN", variable=self.share_lan_var, bg="lightgray").pack(anchor="w")
 
         # Measurement Settings
         measurement_frame = Frame(self.sidebar, bg="lightgray", relief="groove", bd=1)
         measurement_frame.pack(fill="x", pady=5, padx=5)
         Label(measurement_frame, text="Measurement Mode", font=("Arial", 12, "bold"), bg="lightgray").pack(pady=5)
         self.mode = StringVar(value="line")
+        self.mode.trace_add("write", lambda *args: self.mode_changed())
+        self.update_cursor()
         Radiobutton(measurement_frame, text="Line", variable=self.mode, value="line", bg="lightgray").pack(anchor="w", padx=20)
         Radiobutton(measurement_frame, text="Angle", variable=self.mode, value="angle", bg="lightgray").pack(anchor="w", padx=20)
+        Radiobutton(measurement_frame, text="Polygon", variable=self.mode, value="polygon", bg="lightgray").pack(anchor="w", padx=20)
+        Radiobutton(measurement_frame, text="Polyline", variable=self.mode, value="polyline", bg="lightgray").pack(anchor="w", padx=20)
         Radiobutton(measurement_frame, text="Calibrate", variable=self.mode, value="calibrate", bg="lightgray").pack(anchor="w", padx=20)
+        Radiobutton(measurement_frame, text="Detect Features", variable=self.mode, value="detect", bg="lightgray").pack(anchor="w", padx=20)
+        Radiobutton(measurement_frame, text="Set Fiducial", variable=self.mode, value="fiducial", bg="lightgray").pack(anchor="w", padx=20)
+        self.snap_var = IntVar(value=0)
+        Checkbutton(measurement_frame, text="Snap to Edges", variable=self.snap_var, bg="lightgray").pack(anchor="w", padx=20)
+
+        Button(measurement_frame, text="Auto Calibrate", command=self.auto_calibrate, width=20).pack(pady=2)
+        Button(measurement_frame, text="Align to Fiducial", command=self.align_to_fiducial, width=20).pack(pady=2)
+        Button(measurement_frame, text="Line Profile", command=lambda: self.show_profile(len(self.lines) - 1), width=20).pack(pady=2)
+        Button(measurement_frame, text="Statistics", command=self.show_stats, width=20).pack(pady=2)
+        Button(measurement_frame, text="Clear Measurements", command=self.clear_measurements, width=20).pack(pady=2)
+        Button(measurement_frame, text="Undo Last Action", command=self.undo_last_action, width=20).pack(pady=2)
+
+        # View Settings
+        view_frame = Frame(self.sidebar, bg="lightgray", relief="groove", bd=1)
+        view_frame.pack(fill="x", pady=5, padx=5)
+        Label(view_frame, text="View Settings", font=("Arial", 12, "bold"), bg="lightgray").pack(pady=5)
+        self.show_lines_var = IntVar(value=1)
+        self.show_points_var = IntVar(value=1)
+        self.show_angles_var = IntVar(value=1)
+        Checkbutton(view_frame, text="Show Lines", variable=self.show_lines_var, command=self.redraw_measurements, bg="lightgray").pack(anchor="w")
+        Checkbutton(view_frame, text="Show Points", variable=self.show_points_var, command=self.redraw_measurements, bg="lightgray").pack(anchor="w")
+        Checkbutton(view_frame, text="Show Angles", variable=self.show_angles_var, command=self.redraw_measurements, bg="lightgray").pack(anchor="w")
+        self.loupe_var = IntVar(value=0)
+        self.loupe_stretch_var = IntVar(value=0)
+        Checkbutton(view_frame, text="Loupe", variable=self.loupe_var, command=self.toggle_loupe, bg="lightgray").pack(anchor="w")
+        Checkbutton(view_frame, text="Stretch Loupe Contrast", variable=self.loupe_stretch_var, bg="lightgray").pack(anchor="w")
+
+        Label(view_frame, text="Zoom Level", bg="lightgray", font=("Arial", 10)).pack(pady=5)
+        self.zoom_label = Label(view_frame, text="Zoom: 100%", bg="lightgray")
+        self.zoom_label.pack()
+        Button(view_frame, text="Reset View", command=self.reset_view, width=20).pack(pady=5)
+        Button(view_frame, text="Toggle Dark Mode", command=self.toggle_dark_mode, width=20).pack(pady=5)
+        Button(view_frame, text="Adjust Display", command=self.adjust_display_dialog, width=20).pack(pady=2)
+        Button(view_frame, text="Compare Image", command=self.compare_dialog, width=20).pack(pady=2)
+        self.show_hud_var = IntVar(value=0)
+        Checkbutton(view_frame, text="Performance HUD", variable=self.show_hud_var, command=self.toggle_hud, bg="lightgray").pack(anchor="w")
+        Button(view_frame, text="Show Timings", command=self.show_timings, width=20).pack(pady=2)
+        Button(view_frame, text="Worker Threads", command=self.worker_threads_dialog, width=20).pack(pady=2)
+        self.trace_button = Button(view_frame, text="Start Trace", command=self.toggle_trace, width=20)
+        self.trace_button.pack(pady=2)
+        self.record_button = Button(view_frame, text="Record Input", command=self.toggle_input_recording, width=20)
+        self.record_button.pack(pady=2)
+
+        # Customization
+        customization_frame = Frame(self.sidebar, bg="lightgray", relief="groove", bd=1)
+        customization_frame.pack(fill="x", pady=5, padx=5)
+        Label(customization_frame, text="Customize Colours", font=("Arial", 12, "bold"), bg="lightgray").pack(pady=5)
+        Button(customization_frame, text="Select Line Colour", command=self.change_line_color, width=20).pack(pady=2)
+        Button(customization_frame, text="Select Text Colour", command=self.change_text_color, width=20).pack(pady=2)
+        Button(customization_frame, text="Select Point Colour", command=self.change_point_color, width=20).pack(pady=2)
+
+        # Measurement History
+        history_frame = Frame(self.sidebar, bg="lightgray", relief="groove", bd=1)
+        history_frame.pack(fill="x", pady=5, padx=5)
+        Label(history_frame, text="Measurement History", font=("Arial", 12, "bold"), bg="lightgray").pack(pady=5)
+        history_options = Frame(history_frame, bg="lightgray")
+        history_options.pack(fill="x", padx=5)
+        self.history_filter = StringVar(value="all")
+        self.history_sort = StringVar(value="order")
+        OptionMenu(history_options, self.history_filter, "all", "line", "angle", "polygon", "polyline",
+                   command=lambda _: self.measurements_changed()).pack(side="left")
+        OptionMenu(history_options, self.history_sort, "order", "value up", "value down",
+                   command=lambda _: self.measurements_changed()).pack(side="left")
+        history_range = Frame(history_frame, bg="lightgray")
+        history_range.pack(fill="x", padx=5)
+        Label(history_range, text="Value:", bg="lightgray").pack(side="left")
+        self.history_min_entry = Entry(history_range, width=8)
+        self.history_min_entry.pack(side="left", padx=2)
+        Label(history_range, text="to", bg="lightgray").pack(side="left")
+        self.history_max_entry = Entry(history_range, width=8)
+        self.history_max_entry.pack(side="left", padx=2)
+        for entry in (self.history_min_entry, self.history_max_entry):
+            entry.bind("<Return>", lambda e: self.measurements_changed())
+        self.history_count_label = Label(history_frame, text="", bg="lightgray")
+        self.history_count_label.pack()
+        # Only the visible rows exist as canvas items; scrolling just changes their text
+        history_body = Frame(history_frame, bg="lightgray")
+        history_body.pack(pady=5, padx=5, fill="x")
+        self.history_scrollbar = Scrollbar(history_body, orient="vertical", command=self.scroll_history)
+        self.history_scrollbar.pack(side="right", fill="y")
+        self.history_canvas = Canvas(
+            history_body, height=HISTORY_ROWS * HISTORY_ROW_HEIGHT, width=240, bg="white", highlightthickness=0
+        )
+        self.history_canvas.pack(side="left", fill="x", expand=True)
+        self.history_row_items = []
+        for slot in range(HISTORY_ROWS):
+            y = slot * HISTORY_ROW_HEIGHT
+            background = self.history_canvas.create_rectangle(0, y, 1000, y + HISTORY_ROW_HEIGHT, fill="", outline="")
+            text = self.history_canvas.create_text(3, y + HISTORY_ROW_HEIGHT // 2, text="", anchor="w", font=("Arial", 9))
+            self.history_row_items.append((background, text))
+        self.history_canvas.bind("<Button-1>", self.select_history_row)
+        self.history_canvas.bind("<MouseWheel>", lambda e: self.scroll_history("scroll", -1 if e.delta > 0 else 1, "units"))
+
+        # Canvas bindings
+        self.canvas.bind("<MouseWheel>", self.on_zoom)
+        self.canvas.bind("<ButtonPress-2>", self.start_pan)
+        self.canvas.bind("<B2-Motion>", self.do_pan)
+        self.canvas.bind("<ButtonRelease-2>", self.stop_pan)
+        self.canvas.bind("<Button-1>", self.on_click)
+        self.canvas.bind("<Double-Button-1>", self.finish_shape)
+        self.canvas.bind("<B1-Motion>", self.drag_point)
+        self.canvas.bind("<ButtonRelease-1>", self.end_drag)
+        self.canvas.bind("<Button-3>", self.on_right_click)
+        self.canvas.bind("<Configure>", lambda e: self.display_image())
+        # Keys go to the canvas, so typing in the sidebar entries doesn't step images or finish shapes
+        self.canvas.bind("<Button-1>", lambda e: self.canvas.focus_set(), add="+")
+        self.canvas.bind("<Right>", lambda e: self.next_image())
+        self.canvas.bind("<Left>", lambda e: self.previous_image())
+        self.canvas.bind("<Return>", self.finish_shape)
+        self.canvas.focus_set()
+        self.input_recorder = InputRecorder(self.canvas)
+
+    def load_image(self):
+        """Load an image and display it on the canvas."""
+        file_path = filedialog.askopenfilename(filetypes=[("Image Files", "*.jpg;*.png;*.jpeg;*.bmp")])
+        if file_path:
+            self.open_image(file_path)
+
+    @instrumented("load_image", "decode")
+    def open_image(self, file_path):
+        """Decode an image file, build its pyramid and display it."""
+        pyramid = decode_pyramid(file_path)
+        if pyramid is None:
+            messagebox.showerror("Error", f"Could not read image {file_path}")
+            return
+        self.close_video()
+        self.set_image(pyramid, file_path)
+        self.reset_view_state()
+        self.scale_factor = None  # Reset calibration
+        self.display_image()
+
+    def open_folder(self):
+        """Browse the images of a folder with Previous/Next, prefetching the neighbours."""
+        folder = filedialog.askdirectory()
+        if not folder:
+            return
+        paths = collect_images(folder)
+        if not paths:
+            messagebox.showinfo("Open Folder", "No images found in this folder.")
+            return
+        self.close_video()
+        if self.prefetcher is not None:
+            self.prefetcher.stop()
+        self.sequence_cache.clear()
+        self.image_measurements.clear()
+        self.sequence_paths = paths
+        self.prefetcher = ImagePrefetcher(paths, self.sequence_cache, self.workers, perf=self.perf)
+        self.image_path = ""
+        self.reset_view_state()
+        self.show_sequence_image(0)
+
+    def next_image(self):
+        if self.video is not None:
+            self.show_video_frame((self.video_pending if self.video_pending is not None else self.video_index) + 1)
+        elif self.sequence_paths and self.sequence_index + 1 < len(self.sequence_paths):
+            self.show_sequence_image(self.sequence_index + 1)
+
+    def previous_image(self):
+        if self.video is not None:
+            self.show_video_frame((self.video_pending if self.video_pending is not None else self.video_index) - 1)
+        elif self.sequence_paths and self.sequence_index > 0:
+            self.show_sequence_image(self.sequence_index - 1)
+
+    def show_sequence_image(self, index):
+        """Show image index of the open folder, keeping the current view."""
+        pyramid = self.prefetcher.fetch(index)
+        self.prefetcher.set_index(index)
+        if pyramid is None:
+            messagebox.showerror("Error", f"Could not read image {self.sequence_paths[index]}")
+            return
+
+        self.sequence_index = index
+        self.sequence_label.config(text=f"{index + 1}/{len(self.sequence_paths)}: {os.path.basename(self.sequence_paths[index])}")
+        self.show_part(pyramid, self.sequence_paths[index])
+
+    def show_part(self, pyramid, path):
+        """Show the next image of a folder or video, keeping the current view."""
+        # Keep each image's measurements unless they should carry over to the next part
+        if not self.carry_over_var.get():
+            if self.image_path:
+                self.image_measurements[self.image_path] = (
+                    self.lines, self.angles, self.shapes, self.action_stack, self.measurement_frame
+                )
+            self.lines, self.angles, self.shapes, self.action_stack, self.measurement_frame = self.image_measurements.get(
+                path, ([], [], [], [], None)
+            )
+            self.measurement_points = []
+            self.rebuild_stats()
+
+        self.set_image(pyramid, path)
+        self.display_image()
+        if self.carry_over_var.get() and self.fiducial is not None and (self.lines or self.angles or self.shapes):
+            self.align_to_fiducial()
+
+    def open_video(self):
+        """Open a video file or numbered image sequence and scrub through it with the slider."""
+        file_path = filedialog.askopenfilename(filetypes=[
+            ("Videos", "*.mp4;*.avi;*.mov;*.mkv;*.m4v"),
+            ("Numbered image sequences", "*.png;*.jpg;*.jpeg;*.bmp;*.tif;*.tiff"),
+        ])
+        if not file_path:
+            return
+        try:
+            video = VideoFrameSource(sequence_pattern(file_path), self.workers, perf=self.perf)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        self.close_video()
+        if self.prefetcher is not None:
+            self.prefetcher.stop()
+            self.prefetcher = None
+        self.sequence_paths = []
+        self.image_measurements.clear()
+        self.video = video
+        self.video_index = None
+        self.image_path = ""
+        self.reset_view_state()
+        self.video_scale.config(to=video.frame_count - 1)
+        self.video_index_var.set(0)
+        self.video_bar.pack(side="bottom", fill="x", before=self.canvas)
+        self.show_video_frame(0)
+
+    def close_video(self):
+        """Stop decoding the open video and hide the slider."""
+        if self.video is None:
+            return
+        self.video.stop()
+        self.video = None
+        self.video_pending = None
+        self.video_bar.pack_forget()
+        self.sequence_label.config(text="")
+
+    def show_video_frame(self, index):
+        """Show frame index of the open video, or wait for the decoder without blocking if it isn't ready."""
+        index = max(0, min(index, self.video.frame_count - 1))
+        if index == (self.video_pending if self.video_pending is not None else self.video_index):
+            return
+        pyramid = self.video.get(index)
+        self.video_pending = index
+        self.sequence_label.config(text=f"Frame {index + 1}/{self.video.frame_count}")
+        if pyramid is None:
+            if not self.video_polling:
+                self.video_polling = True
+                self.root.after(VIDEO_POLL_MS, self.poll_video_frame)
+            return
+        self.video_pending = None
+        self.video_index = index
+        self.video_index_var.set(index)
+        self.show_part(pyramid, f"{self.video.path}#{index}")
+
+    def poll_video_frame(self):
+        """Show the last requested frame once the decoder has it; only the newest request is kept."""
+        self.video_polling = False
+        if self.video is not None and self.video_pending is not None:
+            index, self.video_pending = self.video_pending, None
+            self.show_video_frame(index)
+
+    def scrub_video(self, value):
+        if self.video is not None:
+            self.show_video_frame(int(float(value)))
+
+    def set_image(self, pyramid, path):
+        """Make pyramid the current image and drop everything derived from the previous one."""
+        self.pyramid = pyramid
+        self.image = pyramid[0]
+        self.image_path = path
+        self.edge_snapper = None
+        self.profile_cache.clear()
+        self.profile_key = None
+        self.viewport_cache.pop("image", None)
+        if self.tile_server is not None:
+            self.tile_server.set_image(pyramid, os.path.basename(path))
+
+    def reset_view_state(self):
+        """Reset zoom and pan without redrawing."""
+        self.zoom_level = 1.0
+        self.offset_x = 0
+        self.offset_y = 0
+        self.zoom_label.config(text="Zoom: 100%")
+
+    def add_tooltip(self, x, y, text):
+        """Display a tooltip at the specified location with the given text."""
+        self.tooltip = self.canvas.create_text(
+            x + 10, y + 10,  # Offset tooltip for better visibility
+            text=text, fill="yellow", font=("Arial", 10), tags="tooltip", anchor="nw"
+        )
+        # Automatically hide the tooltip after 2 seconds
+        self.canvas.after(1000, lambda: self.canvas.delete("tooltip"))
+
+    @instrumented("display_image", "render", frame=True)
+    def display_image(self):
+        """Display the visible part of the image on the canvas."""
+        if self.image is not None:
+            coordinate_map = None
+            if self.undistorting():
+                height, width = self.image.shape[:2]
+                coordinate_map = self.camera_model.remap_table(width, height)
+            view = self.cached_viewport("image", self.pyramid, coordinate_map)
+            if self.compare_pyramid is not None and self.compare_settings["mode"] != "off":
+                # The distortion table only fits a compare image of the same size
+                same_size = self.compare_pyramid[0].shape[:2] == self.image.shape[:2]
+                compare_view = self.cached_viewport("compare", self.compare_pyramid, coordinate_map if same_size else None)
+                with self.perf.span("blend_views", "render"):
+                    view = blend_views(view, compare_view, self.compare_settings["mode"], self.compare_settings["mix"])
+
+            # Clear canvas and redraw image
+            self.canvas.delete("all")
+            self.loupe_items = None
+            self.preview_items = None
+            if view is not None:
+                pixels, x, y = view
+                if self.display_adjustments:
+                    with self.perf.span("adjust_display", "render"):
+                        pixels = adjust_display(pixels, **self.display_adjustments)
+                # Convert to RGB and create Tk-compatible image
+                with self.perf.span("photo_image", "render"):
+                    image_rgb = cv2.cvtColor(pixels, cv2.COLOR_BGR2RGB)
+                    self.image_tk = ImageTk.PhotoImage(Image.fromarray(image_rgb))
+                if self.perf.enabled:
+                    self.perf.record_photo(pixels.shape[1], pixels.shape[0])
+                self.canvas.create_image(x, y, anchor="nw", image=self.image_tk, tags="image")
+            self.redraw_measurements()
+
+    def cached_viewport(self, slot, pyramid, coordinate_map):
+        """Render the visible part of pyramid, reusing the last render in slot if the view hasn't moved.
+
+        Display adjustments and compare blending then only redo their own cheap step.
+        """
+        key = (self.zoom_level, self.offset_x, self.offset_y, self.canvas.winfo_width(), self.canvas.winfo_height())
+        cached = self.viewport_cache.get(slot)
+        if cached is not None and cached["pyramid"] is pyramid and cached["map"] is coordinate_map and cached["key"] == key:
+            return cached["view"]
+        with self.perf.span("render_viewport", "render", slot=slot):
+            view = render_viewport(
+                pyramid, self.zoom_level, self.offset_x, self.offset_y,
+                self.canvas.winfo_width(), self.canvas.winfo_height(), coordinate_map=coordinate_map
+            )
+        self.viewport_cache[slot] = {"pyramid": pyramid, "map": coordinate_map, "key": key, "view": view}
+        return view
+
+    def schedule_display(self):
+        """Redraw once the pending events are handled, however many changes asked for it."""
+        if not self.display_scheduled:
+            self.display_scheduled = True
+            self.root.after_idle(self.scheduled_display)
+
+    def scheduled_display(self):
+        self.display_scheduled = False
+        self.display_image()
+
+    def adjust_display_dialog(self):
+        """Open sliders for window/level, gamma and CLAHE of the displayed image."""
+        top = Toplevel(self.root)
+        top.title("Adjust Display")
+        current = dict(DISPLAY_DEFAULTS, **self.display_adjustments)
+        sliders = {}
+
+        def apply():
+            values = {name: float(slider.get()) for name, slider in sliders.items()}
+            self.display_adjustments = {} if values == DISPLAY_DEFAULTS else values
+            self.schedule_display()
+
+        for name, text, low, high, resolution in (
+            ("window", "Window", 1, 255, 1),
+            ("level", "Level", 0, 255, 0.5),
+            ("gamma", "Gamma", 0.2, 3.0, 0.05),
+            ("clahe", "CLAHE clip limit (0 = off)", 0, 8, 0.5),
+        ):
+            Label(top, text=text).pack(anchor="w", padx=10)
+            sliders[name] = Scale(top, from_=low, to=high, resolution=resolution, orient="horizontal", length=260,
+                                  command=lambda value: apply())
+            sliders[name].set(current[name])
+            sliders[name].pack(padx=10)
+
+        def reset():
+            for name, value in DISPLAY_DEFAULTS.items():
+                sliders[name].set(value)
+            apply()
+
+        Button(top, text="Reset", command=reset).pack(pady=10)
+
+    def compare_dialog(self):
+        """Open the controls for comparing the image with a second one, e.g. a golden part."""
+        top = Toplevel(self.root)
+        top.title("Compare Image")
+        mode = StringVar(top, value=self.compare_settings["mode"])
+        path_label = Label(top, text=os.path.basename(self.compare_path) or "No compare image loaded")
+
+        def apply():
+            self.compare_settings = {"mode": mode.get(), "mix": float(mix.get())}
+            self.schedule_display()
+
+        def load():
+            file_path = filedialog.askopenfilename(parent=top, filetypes=[("Image Files", "*.jpg;*.png;*.jpeg;*.bmp;*.tif;*.tiff")])
+            if not file_path:
+                return
+            path_label.config(text=f"Loading {os.path.basename(file_path)}...")
+
+            def loaded(pyramid):
+                self.set_compare_image(pyramid, file_path)
+                if top.winfo_exists():
+                    path_label.config(text=os.path.basename(self.compare_path) or "No compare image loaded")
+                    mode.set(self.compare_settings["mode"])
+
+            self.run_in_background("decode_compare", lambda: decode_pyramid(file_path), loaded)
+
+        Button(top, text="Load Compare Image", command=load).pack(pady=5)
+        path_label.pack(padx=10)
+        for value, text in (("off", "Off"), ("alpha", "Blend"), ("difference", "Difference"),
+                            ("checkerboard", "Checkerboard"), ("split", "Split View")):
+            Radiobutton(top, text=text, variable=mode, value=value, command=apply).pack(anchor="w", padx=10)
+        Label(top, text="Blend / split position").pack(anchor="w", padx=10)
+        mix = Scale(top, from_=0, to=1, resolution=0.01, orient="horizontal", length=240, command=lambda value: apply())
+        mix.set(self.compare_settings["mix"])
+        mix.pack(padx=10, pady=5)
+
+    def set_compare_image(self, pyramid, path):
+        """Use a decoded pyramid as the compare image."""
+        if pyramid is None:
+            messagebox.showerror("Error", f"Could not read image {path}")
+            return
+        self.compare_pyramid = pyramid
+        self.compare_path = path
+        if self.compare_settings["mode"] == "off":
+            self.compare_settings = dict(self.compare_settings, mode="alpha")
+        self.display_image()
+
+    def undistorting(self):
+        """True when the view and measurements are in undistorted coordinates."""
+        return self.camera_model is not None and self.undistort_var.get() and self.image is not None
+
+    def load_camera_model(self):
+        """Load camera intrinsics and distortion coefficients for distortion correction."""
+        file_path = filedialog.askopenfilename(filetypes=[("Camera models", "*.json;*.yml;*.yaml;*.xml")])
+        if not file_path:
+            return
+        try:
+            camera_model = CameraModel.load(file_path)
+        except (OSError, ValueError, KeyError) as e:
+            messagebox.showerror("Error", f"Could not load camera model: {e}")
+            return
+        # Measurements made with the old model go back to raw coordinates first
+        was_undistorting = self.undistorting()
+        if was_undistorting:
+            self.map_measurements(self.camera_model.to_raw)
+        self.camera_model = camera_model
+        if was_undistorting:
+            self.map_measurements(self.camera_model.to_undistorted)
+        else:
+            self.undistort_var.set(1)
+            self.toggle_undistortion()
+            return
+        self.display_image()
+
+    def toggle_undistortion(self):
+        """Switch view and measurements between raw and undistorted coordinates."""
+        if self.camera_model is None:
+            self.undistort_var.set(0)
+            messagebox.showinfo("Correct Distortion", "Load a camera model first.")
+            return
+        if self.image is not None:
+            self.map_measurements(self.camera_model.to_undistorted if self.undistort_var.get() else self.camera_model.to_raw)
+        self.display_image()
+
+    def map_measurements(self, camera_transform):
+        """Map all measurements through a CameraModel point transform and recompute their values."""
+        height, width = self.image.shape[:2]
+
+        def transform(points):
+            return camera_transform(points, width, height)
+
+        self.lines, self.angles = transform_measurements(self.lines, self.angles, transform, self.scale_factor)
+        self.shapes = transform_shapes(self.shapes, transform)
+        self.measurement_points = []
+        self.calibration_points = []
+        self.rebuild_stats()
+
+    def on_right_click(self, event):
+        """Show the intensity profile of the line under the cursor."""
+        for item in self.canvas.find_overlapping(event.x - 3, event.y - 3, event.x + 3, event.y + 3):
+            for tag in self.canvas.gettags(item):
+                if tag.startswith("line_"):
+                    self.show_profile(int(tag[5:]))
+                    return
+
+    def line_profile(self, i, width):
+        """Return the intensity profile of line i, from the cache unless the line moved."""
+        start, end, _ = self.lines[i]
+        undistorting = bool(self.undistorting())
+        key = (tuple(start), tuple(end), width, undistorting)
+        profile = self.profile_cache.get(key)
+        if profile is not None:
+            self.profile_cache.move_to_end(key)
+            return key, profile
+        transform = None
+        if undistorting:
+            height, width_px = self.image.shape[:2]
+            transform = lambda points: self.camera_model.to_raw(points, width_px, height)
+        with self.perf.span("line_profile", "event"):
+            profile = sample_line_profile(self.image, start, end, width, transform)
+        self.profile_cache[key] = profile
+        while len(self.profile_cache) > PROFILE_CACHE_SIZE:
+            self.profile_cache.popitem(last=False)
+        return key, profile
+
+    def show_profile(self, i):
+        """Open the profile window for line i, or point the open one at it."""
+        if self.image is None or not 0 <= i < len(self.lines):
+            messagebox.showinfo("Line Profile", "Measure a line first, then right-click it to see its profile.")
+            return
+        self.profile_line = i
+        self.profile_key = None
+        if self.profile_window is None:
+            top = Toplevel(self.root)
+            top.title("Line Profile")
+            top.protocol("WM_DELETE_WINDOW", self.close_profile_window)
+            plot = Canvas(top, width=520, height=260, bg="white")
+            plot.pack(padx=5, pady=5)
+            info = Label(top, text="")
+            info.pack()
+            options = Frame(top)
+            options.pack(pady=5)
+            Label(options, text="Width (px):").pack(side="left")
+            width_entry = Entry(options, width=5)
+            width_entry.insert(0, str(PROFILE_WIDTH))
+            width_entry.pack(side="left", padx=5)
+            width_entry.bind("<Return>", lambda e: self.update_profile_window(force=True))
+            Button(options, text="Snap Ends to Edges", command=self.snap_line_to_profile_edges).pack(side="left", padx=5)
+            self.profile_window = {"top": top, "plot": plot, "info": info, "width": width_entry}
+        self.update_profile_window()
+
+    def close_profile_window(self):
+        self.profile_window["top"].destroy()
+        self.profile_window = None
+        self.profile_line = None
+
+    def profile_width(self):
+        try:
+            return max(1, int(self.profile_window["width"].get()))
+        except ValueError:
+            return PROFILE_WIDTH
+
+    def update_profile_window(self, force=False):
+        """Replot the profile window when its line has moved since it was last drawn."""
+        if self.profile_window is None or self.image is None:
+            return
+        if self.profile_line is None or self.profile_line >= len(self.lines):
+            self.close_profile_window()
+            return
+        key, profile = self.line_profile(self.profile_line, self.profile_width())
+        if key == self.profile_key and not force:
+            return
+        self.profile_key = key
+        start, end, _ = self.lines[self.profile_line]
+        positions, _ = profile_edges(profile)
+
+        plot = self.profile_window["plot"]
+        plot.delete("all")
+        width, height, margin = int(plot["width"]), int(plot["height"]), 10
+        xs = np.linspace(margin, width - margin, len(profile))
+        ys = height - margin - profile / 255.0 * (height - 2 * margin)
+        plot.create_line(*np.column_stack([xs, ys]).ravel().tolist(), fill="black")
+        for position in positions:
+            x = margin + position / (len(profile) - 1) * (width - 2 * margin)
+            plot.create_line(x, margin, x, height - margin, fill="red", dash=(3, 3))
+
+        text = f"Line {self.profile_line + 1}: {len(profile)} samples, {len(positions)} edges"
+        edges = edge_to_edge(start, end, profile)
+        if edges is not None:
+            pixel_distance, distance_mm = line_distance(edges[0], edges[1], self.scale_factor)
+            text += f"\nEdge to edge: {pixel_distance:.3f} px"
+            if distance_mm is not None:
+                text += f" ({distance_mm:.4f} mm)"
+        self.profile_window["info"].config(text=text)
+
+    def snap_line_to_profile_edges(self):
+        """Move the ends of the profiled line onto the first and last edges of its profile."""
+        i = self.profile_line
+        _, profile = self.line_profile(i, self.profile_width())
+        start, end, _ = self.lines[i]
+        edges = edge_to_edge(start, end, profile)
+        if edges is None:
+            messagebox.showinfo("Line Profile", "Fewer than two edges found along this line.")
+            return
+        self.action_stack.append({
+                                    'type': 'line_edit',
+                                    'index': i,
+                                    'line': self.lines[i]
+                                })
+        self.lines[i] = (edges[0], edges[1], line_distance(edges[0], edges[1], self.scale_factor)[1])
+        self.rebuild_stats()
+        self.redraw_measurements()
+
+    def show_stats(self):
+        """Open the statistics panel: running statistics, capability and histogram per measurement group."""
+        if self.stats_window is not None:
+            self.stats_window["top"].lift()
+            return
+        top = Toplevel(self.root)
+        top.title("Statistics")
+        top.protocol("WM_DELETE_WINDOW", self.close_stats_window)
+        group_var = StringVar(value="line")
+        groups = Frame(top)
+        groups.pack(pady=5)
+        for group, text in (("line", "Lines"), ("angle", "Angles"), ("polygon", "Polygon Areas"), ("polyline", "Polyline Lengths")):
+            Radiobutton(groups, text=text, variable=group_var, value=group, command=self.show_stats_group).pack(side="left")
+        info = Label(top, text="", justify="left", font=("Courier", 10))
+        info.pack(padx=5, anchor="w")
+        plot = Canvas(top, width=400, height=180, bg="white")
+        plot.pack(padx=5, pady=5)
+        tolerance = Frame(top)
+        tolerance.pack(pady=5)
+        Label(tolerance, text="Lower:").pack(side="left")
+        lower_entry = Entry(tolerance, width=8)
+        lower_entry.pack(side="left", padx=2)
+        Label(tolerance, text="Upper:").pack(side="left")
+        upper_entry = Entry(tolerance, width=8)
+        upper_entry.pack(side="left", padx=2)
+        Button(tolerance, text="Set Tolerance", command=self.set_tolerance).pack(side="left", padx=5)
+        Button(tolerance, text="Clear", command=lambda: self.set_tolerance(clear=True)).pack(side="left")
+        self.stats_window = {"top": top, "group": group_var, "info": info, "plot": plot,
+                             "lower": lower_entry, "upper": upper_entry}
+        self.show_stats_group()
+
+    def close_stats_window(self):
+        self.stats_window["top"].destroy()
+        self.stats_window = None
+
+    def show_stats_group(self):
+        """Fill the tolerance entries of the selected group and redraw the panel."""
+        window = self.stats_window
+        lower, upper = self.tolerances.get(window["group"].get(), ("", ""))
+        for entry, value in ((window["lower"], lower), (window["upper"], upper)):
+            entry.delete(0, "end")
+            entry.insert(0, str(value))
+        self.update_stats_window()
+
+    def set_tolerance(self, clear=False):
+        """Set or clear the selected group's tolerance and recolour the overlay against it."""
+        group = self.stats_window["group"].get()
+        if clear:
+            self.tolerances.pop(group, None)
+            self.show_stats_group()
+        else:
+            try:
+                lower, upper = float(self.stats_window["lower"].get()), float(self.stats_window["upper"].get())
+                if lower >= upper:
+                    raise ValueError
+            except ValueError:
+                messagebox.showerror("Error", "Enter numeric lower and upper limits, lower below upper.")
+                return
+            self.tolerances[group] = (lower, upper)
+            self.update_stats_window()
+        self.redraw_measurements()
+
+    def display_scale(self, group):
+        """Factor from a group's pixel values to the units shown: mm, mm² or degrees."""
+        return self.scale_factor ** STATS_GROUPS[group] if self.scale_factor else 1.0
+
+    def stats_unit(self, group):
+        if group == "angle":
+            return "°"
+        unit = "mm" if self.scale_factor else "px"
+        return unit + "²" if group == "polygon" else unit
+
+    def tolerance_color(self, group, value):
+        """Overlay colour of a measurement whose pixel value is value: pass/fail against a tolerance if set."""
+        tolerance = self.tolerances.get(group)
+        if tolerance is None:
+            return self.line_color
+        value *= self.display_scale(group)
+        return TOLERANCE_PASS_COLOR if tolerance[0] <= value <= tolerance[1] else TOLERANCE_FAIL_COLOR
+
+    def add_stats(self, lines=(), angles=(), shapes=()):
+        """Feed new measurements to the running statistics."""
+        for start, end, _ in lines:
+            self.stats["line"].add(np.hypot(end[0] - start[0], end[1] - start[1]))
+        for *_, angle_value in angles:
+            self.stats["angle"].add(angle_value)
+        for kind, _, metrics in shapes:
+            self.stats[kind].add(metrics["area"] if kind == "polygon" else metrics["length"])
+        self.measurements_changed()
+
+    def rebuild_stats(self):
+        """Recompute the running statistics from all measurements, after they were moved or replaced."""
+        self.stats = {
+            group: RunningStats.from_values(values)
+            for group, values in measurement_values(self.lines, self.angles, self.shapes).items()
+        }
+        self.measurements_changed()
+
+    def schedule_stats(self):
+        """Update the statistics panel once the pending events are handled."""
+        if self.stats_window is not None and not self.stats_scheduled:
+            self.stats_scheduled = True
+            self.root.after_idle(self.scheduled_stats)
+
+    def scheduled_stats(self):
+        self.stats_scheduled = False
+        self.update_stats_window()
+
+    def update_stats_window(self):
+        """Show the selected group's statistics and plot its histogram from the binned counts."""
+        if self.stats_window is None:
+            return
+        group = self.stats_window["group"].get()
+        stats, scale, unit = self.stats[group], self.display_scale(group), self.stats_unit(group)
+        tolerance = self.tolerances.get(group)
+        text = f"n = {stats.count}"
+        if stats.count:
+            text += (f"\nmean = {stats.mean * scale:.4f} {unit}\nstd  = {stats.std * scale:.4f} {unit}"
+                     f"\nmin  = {stats.minimum * scale:.4f} {unit}\nmax  = {stats.maximum * scale:.4f} {unit}")
+        if tolerance is not None:
+            capability = stats.capability(tolerance[0] / scale, tolerance[1] / scale)
+            if capability is not None:
+                text += f"\nCp   = {capability[0]:.3f}\nCpk  = {capability[1]:.3f}"
+        self.stats_window["info"].config(text=text)
+
+        plot = self.stats_window["plot"]
+        plot.delete("all")
+        if not stats.count:
+            return
+        width, height, margin = int(plot["width"]), int(plot["height"]), 10
+        edges = stats.edges * scale
+        low, high = edges[0], edges[-1]
+        if tolerance is not None:
+            low, high = min(low, tolerance[0]), max(high, tolerance[1])
+        span = high - low
+
+        def x_of(value):
+            return margin + (value - low) / span * (width - 2 * margin)
 
-        Button(measurement_frame, text="Clear Measurements", command=self.clear_measurements, width=20).pack(pady=2)
-        Button(measurement_frame, text="Undo Last Action", command=self.undo_last_action, width=20).pack(pady=2)
+        top_count = stats.counts.max()
+        for left, right, count in zip(edges[:-1], edges[1:], stats.counts.tolist()):
+            if not count:
+                continue
+            color = "gray"
+            if tolerance is not None:
+                color = TOLERANCE_PASS_COLOR if tolerance[0] <= (left + right) / 2 <= tolerance[1] else TOLERANCE_FAIL_COLOR
+            plot.create_rectangle(
+                x_of(left), height - margin - count / top_count * (height - 2 * margin),
+                x_of(right), height - margin, fill=color, outline=""
+            )
+        if tolerance is not None:
+            for limit in tolerance:
+                plot.create_line(x_of(limit), margin, x_of(limit), height - margin, fill="black", dash=(3, 3))
+        plot.create_text(margin, height - 2, text=f"{low:.4g}", anchor="sw")
+        plot.create_text(width - margin, height - 2, text=f"{high:.4g} {unit}", anchor="se")
 
-        # View Settings
-        view_frame = Frame(self.sidebar, bg="lightgray", relief="groove", bd=1)
-        view_frame.pack(fill="x", pady=5, padx=5)
-        Label(view_frame, text="View Settings", font=("Arial", 12, "bold"), bg="lightgray").pack(pady=5)
-        self.show_lines_var = IntVar(value=1)
-        self.show_points_var = IntVar(value=1)
-        self.show_angles_var = IntVar(value=1)
-        Checkbutton(view_frame, text="Show Lines", variable=self.show_lines_var, command=self.redraw_measurements, bg="lightgray").pack(anchor="w")
-        Checkbutton(view_frame, text="Show Points", variable=self.show_points_var, command=self.redraw_measurements, bg="lightgray").pack(anchor="w")
-        Checkbutton(view_frame, text="Show Angles", variable=self.show_angles_var, command=self.redraw_measurements, bg="lightgray").pack(anchor="w")
+    def toggle_loupe(self):
+        """Turn the magnifier inset that follows the cursor on or off."""
+        if not self.loupe_var.get():
+            self.canvas.delete("loupe")
+            self.loupe_items = None
 
-        Label(view_frame, text="Zoom Level", bg="lightgray", font=("Arial", 10)).pack(pady=5)
-        self.zoom_label = Label(view_frame, text="Zoom: 100%", bg="lightgray")
-        self.zoom_label.pack()
-        Button(view_frame, text="Reset View", command=self.reset_view, width=20).pack(pady=5)
-        Button(view_frame, text="Toggle Dark Mode", command=self.toggle_dark_mode, width=20).pack(pady=5)
+    @instrumented("update_loupe", "event")
+    def update_loupe(self, x, y):
+        """Show the pixels under canvas position (x, y) magnified in an inset next to the cursor."""
+        coordinate_map = None
+        if self.undistorting():
+            height, width = self.image.shape[:2]
+            coordinate_map = self.camera_model.remap_table(width, height)
+        pixels = render_loupe(
+            self.pyramid, (x - self.offset_x) / self.zoom_level, (y - self.offset_y) / self.zoom_level,
+            self.zoom_level * LOUPE_MAGNIFICATION, LOUPE_SIZE, bool(self.loupe_stretch_var.get()), coordinate_map
+        )
+        image = Image.fromarray(cv2.cvtColor(pixels, cv2.COLOR_BGR2RGB))
+        if self.loupe_photo is None:
+            self.loupe_photo = ImageTk.PhotoImage(image)
+        else:
+            self.loupe_photo.paste(image)  # Update the existing Tk image in place
 
-        # Customization
-        customization_frame = Frame(self.sidebar, bg="lightgray", relief="groove", bd=1)
-        customization_frame.pack(fill="x", pady=5, padx=5)
-        Label(customization_frame, text="Customize Colours", font=("Arial", 12, "bold"), bg="lightgray").pack(pady=5)
-        Button(customization_frame, text="Select Line Colour", command=self.change_line_color, width=20).pack(pady=2)
-        Button(customization_frame, text="Select Text Colour", command=self.change_text_color, width=20).pack(pady=2)
-        Button(customization_frame, text="Select Point Colour", command=self.change_point_color, width=20).pack(pady=2)
+        # Keep the inset beside the cursor and inside the canvas
+        left = x + LOUPE_OFFSET
+        if left + LOUPE_SIZE > self.canvas.winfo_width():
+            left = x - LOUPE_OFFSET - LOUPE_SIZE
+        top = y + LOUPE_OFFSET
+        if top + LOUPE_SIZE > self.canvas.winfo_height():
+            top = y - LOUPE_OFFSET - LOUPE_SIZE
 
-        # Measurement History
-        history_frame = Frame(self.sidebar, bg="lightgray", relief="groove", bd=1)
-        history_frame.pack(fill="x", pady=5, padx=5)
-        Label(history_frame, text="Measurement History", font=("Arial", 12, "bold"), bg="lightgray").pack(pady=5)
-        self.history_listbox = Listbox(history_frame, height=10)
-        self.history_listbox.pack(pady=5, padx=5, fill="x")
+        if self.loupe_items is None:
+            centre = LOUPE_SIZE // 2
+            self.loupe_items = (
+                self.canvas.create_image(left, top, anchor="nw", image=self.loupe_photo, tags="loupe"),
+                self.canvas.create_rectangle(left, top, left + LOUPE_SIZE, top + LOUPE_SIZE, outline="white", tags="loupe"),
+                self.canvas.create_line(left + centre - 8, top + centre, left + centre + 9, top + centre, fill="red", tags="loupe"),
+                self.canvas.create_line(left + centre, top + centre - 8, left + centre, top + centre + 9, fill="red", tags="loupe"),
+            )
+        else:
+            self.canvas.move("loupe", left - self.loupe_position[0], top - self.loupe_position[1])
+            self.canvas.itemconfig("loupe", state="normal")
+        self.loupe_position = (left, top)
+        self.canvas.tag_raise("loupe")
 
-        # Canvas bindings
-        self.canvas.bind("<MouseWheel>", self.on_zoom)
-        self.canvas.bind("<ButtonPress-2>", self.start_pan)
-        self.canvas.bind("<B2-Motion>", self.do_pan)
-        self.canvas.bind("<ButtonRelease-2>", self.stop_pan)
-        self.canvas.bind("<Button-1>", self.on_click)
+    def hide_loupe(self):
+        if self.loupe_items is not None:
+            self.canvas.itemconfig("loupe", state="hidden")
 
-    def load_image(self):
-        """Load an image and display it on the canvas."""
-        file_path = filedialog.askopenfilename(filetypes=[("Image Files", "*.jpg;*.png;*.jpeg;*.bmp")])
-        if file_path:
-            self.image = cv2.imread(file_path)
-            self.zoom_level = 1.0
-            self.offset_x = 0
-            self.offset_y = 0
-            self.scale_factor = None  # Reset calibration
+    def toggle_hud(self):
+        """Turn instrumentation and the on-canvas HUD on or off."""
+        self.perf.set_enabled(bool(self.show_hud_var.get()))
+        if self.perf.enabled:
             self.display_image()
+        else:
+            self.canvas.delete("hud")
 
-    def add_tooltip(self, x, y, text):
-        """Display a tooltip at the specified location with the given text."""
-        self.tooltip = self.canvas.create_text(
-            x + 10, y + 10,  # Offset tooltip for better visibility
-            text=text, fill="yellow", font=("Arial", 10), tags="tooltip", anchor="nw"
+    def update_hud(self):
+        """Refresh the frame statistics overlay in the top-left corner of the canvas."""
+        self.canvas.delete("hud")
+        self.perf.canvas_items = len(self.canvas.find_all())
+        workers = (f"\nworkers {self.workers.busy}/{self.workers.workers}  queue {self.workers.queue_depth()}  "
+                   f"util {self.workers.utilisation():.0%}")
+        self.canvas.create_text(
+            10, 10, text=self.perf.hud_text() + workers, fill="lime", font=("Courier", 10),
+            anchor="nw", tags="hud"
         )
-        # Automatically hide the tooltip after 2 seconds
-        self.canvas.after(1000, lambda: self.canvas.delete("tooltip"))
 
-    def display_image(self):
-        """Display the image on the canvas."""
-        if self.image is not None:
-            height, width, _ = self.image.shape
-            new_width = int(width * self.zoom_level)
-            new_height = int(height * self.zoom_level)
-            resized_image = cv2.resize(self.image, (new_width, new_height))
+    def toggle_trace(self):
+        """Start recording a performance trace, or stop and save it as Chrome trace JSON."""
+        if not self.perf.tracing:
+            self.perf.start_trace()
+            self.trace_button.config(text="Stop and Save Trace")
+            return
+        self.perf.stop_trace()
+        self.trace_button.config(text="Start Trace")
+        save_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("Chrome trace", "*.json")])
+        if save_path:
+            count = self.perf.write_trace(save_path)
+            messagebox.showinfo("Trace", f"Saved {count} spans. Open the file in Perfetto or chrome://tracing.")
 
-            # Convert to RGB and create Tk-compatible image
-            image_rgb = cv2.cvtColor(resized_image, cv2.COLOR_BGR2RGB)
-            pil_image = Image.fromarray(image_rgb)
-            self.image_tk = ImageTk.PhotoImage(pil_image)
+    def toggle_input_recording(self):
+        """Record canvas input for VisionMetrics_replay.py, or stop and save the session."""
+        if not self.input_recorder.recording:
+            self.input_recorder.start()
+            self.record_button.config(text="Stop and Save Input")
+            return
+        self.input_recorder.stop()
+        self.record_button.config(text="Record Input")
+        save_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("Input sessions", "*.json")])
+        if save_path:
+            count = self.input_recorder.save(save_path, self)
+            messagebox.showinfo("Input Recording", f"Saved {count} events.")
 
-            # Clear canvas and redraw image
-            self.canvas.delete("all")
-            self.canvas.create_image(self.offset_x, self.offset_y, anchor="nw", image=self.image_tk, tags="image")
-            self.redraw_measurements()
+    def show_timings(self):
+        """Show the per-call timings collected while the HUD is on."""
+        if not self.perf.stats:
+            messagebox.showinfo("Timings", "No timings recorded. Enable the Performance HUD first.")
+            return
+        top = Toplevel(self.root)
+        top.title("Timings")
+        Label(top, text=self.perf.summary(), font=("Courier", 10), justify="left").pack(padx=10, pady=10)
+
+    def toggle_sharing(self):
+        """Start or stop serving the image and measurements to browsers, on this machine or the LAN."""
+        if self.tile_server is not None:
+            self.tile_server.stop()
+            self.tile_server = None
+            self.share_button.config(text="Share in Browser")
+            return
+        host = "0.0.0.0" if self.share_lan_var.get() else "127.0.0.1"
+        try:
+            self.tile_server = TileServer(self.workers, host, perf=self.perf)
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not start sharing: {e}")
+            return
+        if self.pyramid is not None:
+            self.tile_server.set_image(self.pyramid, os.path.basename(self.image_path))
+        self.share_measurements()
+        self.tile_server.start()
+        self.share_button.config(text="Stop Sharing")
+        messagebox.showinfo("Share in Browser", f"Reviewers can open {self.tile_server.url}")
+
+    def share_measurements(self):
+        """Hand the current measurements to the tile server, if sharing."""
+        if self.tile_server is None:
+            return
+        transform = None
+        if self.undistorting():
+            # Tiles show the raw image, so map the overlay back onto it
+            height, width = self.image.shape[:2]
+            transform = lambda points: self.camera_model.to_raw(points, width, height)
+        self.tile_server.set_measurements(
+            self.lines, self.angles, self.shapes, self.scale_factor, self.line_color, self.text_color, transform
+        )
+
+    def worker_threads_dialog(self):
+        """Set how many worker threads decode, detect and export, and how many threads OpenCV uses inside each call."""
+        top = Toplevel(self.root)
+        top.title("Worker Threads")
+        cores = os.cpu_count() or 1
+        Label(top, text="Worker threads").pack(anchor="w", padx=10)
+        workers = Scale(top, from_=1, to=2 * cores, orient="horizontal", length=240)
+        workers.set(self.workers.workers)
+        workers.pack(padx=10)
+        Label(top, text="OpenCV threads per call (0 = single-threaded)").pack(anchor="w", padx=10)
+        opencv_threads = Scale(top, from_=0, to=cores, orient="horizontal", length=240)
+        opencv_threads.set(cv2.getNumThreads() if self.workers.opencv_threads is None else self.workers.opencv_threads)
+        opencv_threads.pack(padx=10)
+
+        def apply():
+            self.workers.configure(int(workers.get()), int(opencv_threads.get()))
+            top.destroy()
+
+        Button(top, text="Apply", command=apply).pack(pady=10)
 
     def toggle_dark_mode(self):
         """Toggle between light and dark modes."""
@@ -187,28 +3426,20 @@ class MetrologyApp:
         self.canvas.configure(bg="black" if self.is_dark_mode else "gray")
 
     def reset_view(self):
-        self.zoom_level = 1.0
-        self.offset_x = 0
-        self.offset_y = 0
-        self.zoom_label.config(text="Zoom: 100%")  # Update the zoom label
+        self.reset_view_state()
         self.display_image()
 
-    def add_to_history(self, measurement):
-        """Add a measurement to the history listbox."""
-        if measurement["type"] == "point":
-            self.history_listbox.insert("end", f"Point: ({measurement['x']}, {measurement['y']})")
-        elif measurement["type"] == "line":
-            self.history_listbox.insert("end", f"Line: ({measurement['x1']}, {measurement['y1']}) -> ({measurement['x2']}, {measurement['y2']})")
-        elif measurement["type"] == "angle":
-            self.history_listbox.insert("end", f"Angle: ({measurement['points']}) -> {measurement['angle']}°")
-
+    @instrumented("redraw_measurements", "render", frame=True)
     def redraw_measurements(self):
         """Redraw all measurements."""
         self.canvas.delete("measurement")
+        self.arcs = []
 
-        # Redraw points if enabled
+        # Redraw points if enabled; the vertices of a shape being drawn are one path instead
+        drawing_shape = self.mode.get() in ("polygon", "polyline")
         if self.show_points_var.get():
-            for i, point in enumerate(self.calibration_points + self.measurement_points):
+            pending = [] if drawing_shape else self.measurement_points
+            for i, point in enumerate(self.calibration_points + pending + self.roi_points):
                 scaled_point = self.scale_and_offset_point(point)
                 self.canvas.create_oval(
                     scaled_point[0] - 3, scaled_point[1] - 3,
@@ -219,79 +3450,331 @@ class MetrologyApp:
         # Redraw lines if enabled
         if self.show_lines_var.get():
             for i, (start, end, distance) in enumerate(self.lines):
-                scaled_start = self.scale_and_offset_point(start)
-                scaled_end = self.scale_and_offset_point(end)
-                line_tag = f"line_{i}"
-                self.canvas.create_line(
-                    scaled_start[0], scaled_start[1],
-                    scaled_end[0], scaled_end[1],
-                    fill=self.line_color, width=2, tags=(line_tag, "measurement")
-                )
-                if distance is not None:  # Add distance text
-                    midpoint = (
-                        (scaled_start[0] + scaled_end[0]) // 2,
-                        (scaled_start[1] + scaled_end[1]) // 2
-                    )
-                    self.canvas.create_text(
-                        midpoint[0], midpoint[1],
-                        text=f"{distance:.2f} mm", fill=self.text_color,
-                        font=("Arial", 10), tags=(f"text_{line_tag}", "measurement")
-                    )
-                    # Attach distance to tooltip
-                    self.canvas.tag_bind(line_tag, "<Enter>", lambda e, d=distance: self.add_tooltip(e.x, e.y, f"Distance: {d:.2f} mm"))
+                self.draw_line_measurement(i, start, end, distance)
 
         # Redraw angles if enabled
         if self.show_angles_var.get():
             for i, (p1, p2, p3, angle_value) in enumerate(self.angles):
-                scaled_p1 = self.scale_and_offset_point(p1)
-                scaled_p2 = self.scale_and_offset_point(p2)
-                scaled_p3 = self.scale_and_offset_point(p3)
-
-                angle_tag = f"angle_{i}"
-                # Draw angle lines
-                self.canvas.create_line(
-                    scaled_p2[0], scaled_p2[1], scaled_p1[0], scaled_p1[1],
-                    fill=self.line_color, width=2, tags=(angle_tag, "measurement")
-                )
-                self.canvas.create_line(
-                    scaled_p2[0], scaled_p2[1], scaled_p3[0], scaled_p3[1],
-                    fill=self.line_color, width=2, tags=(angle_tag, "measurement")
-                )
-                # Draw the arc
-                self.draw_arc_with_segments(scaled_p2, scaled_p1, scaled_p3, radius=50)
-                # Attach angle to tooltip
-                self.canvas.tag_bind(angle_tag, "<Enter>", lambda e, a=angle_value: self.add_tooltip(e.x, e.y, f"Angle: {a:.2f}°"))
-
-                # Display angle value
-                self.canvas.create_text(
-                    scaled_p2[0], scaled_p2[1] - 20,
-                    text=f"{angle_value:.2f}°", fill=self.text_color,
-                    font=("Arial", 10), tags=(f"text_{angle_tag}", "measurement")
-                )
+                self.draw_angle_measurement(i, p1, p2, p3, angle_value)
+
+        # Redraw polygons and polylines with the lines
+        if self.show_lines_var.get():
+            for i, (kind, points, metrics) in enumerate(self.shapes):
+                self.draw_shape_measurement(i, kind, points, metrics)
+        if drawing_shape and self.measurement_points:
+            self.draw_pending_shape()
+        self.highlight_selection()
+        self.update_profile_window()
+
+    def draw_line_measurement(self, i, start, end, distance):
+        """Draw line i with its distance label."""
+        scaled_start = self.scale_and_offset_point(start)
+        scaled_end = self.scale_and_offset_point(end)
+        line_tag = f"line_{i}"
+        self.canvas.create_line(
+            scaled_start[0], scaled_start[1],
+            scaled_end[0], scaled_end[1],
+            fill=self.tolerance_color("line", np.hypot(end[0] - start[0], end[1] - start[1])),
+            width=2, tags=(line_tag, "measurement")
+        )
+        if distance is not None:  # Add distance text
+            midpoint = (
+                (scaled_start[0] + scaled_end[0]) // 2,
+                (scaled_start[1] + scaled_end[1]) // 2
+            )
+            self.canvas.create_text(
+                midpoint[0], midpoint[1],
+                text=f"{distance:.2f} mm", fill=self.text_color,
+                font=("Arial", 10), tags=(f"text_{line_tag}", "measurement")
+            )
+            # Attach distance to tooltip
+            self.canvas.tag_bind(line_tag, "<Enter>", lambda e, d=distance: self.add_tooltip(e.x, e.y, f"Distance: {d:.2f} mm"))
 
-    def add_to_history(self, measurement):
-        """Add a measurement to the history listbox."""
-        if measurement["type"] == "point":
-            self.history_listbox.insert("end", f"Point: ({measurement['x']:.2f}, {measurement['y']:.2f})")
-        elif measurement["type"] == "line":
-            self.history_listbox.insert(
-                "end", f"Line: ({measurement['x1']:.2f}, {measurement['y1']:.2f}) -> ({measurement['x2']:.2f}, {measurement['y2']:.2f})"
+    def draw_angle_measurement(self, i, p1, p2, p3, angle_value):
+        """Draw angle i with its arc and value label."""
+        scaled_p1 = self.scale_and_offset_point(p1)
+        scaled_p2 = self.scale_and_offset_point(p2)
+        scaled_p3 = self.scale_and_offset_point(p3)
+
+        angle_tag = f"angle_{i}"
+        color = self.tolerance_color("angle", angle_value)
+        # Draw angle lines
+        self.canvas.create_line(
+            scaled_p2[0], scaled_p2[1], scaled_p1[0], scaled_p1[1],
+            fill=color, width=2, tags=(angle_tag, "measurement")
+        )
+        self.canvas.create_line(
+            scaled_p2[0], scaled_p2[1], scaled_p3[0], scaled_p3[1],
+            fill=color, width=2, tags=(angle_tag, "measurement")
+        )
+        # Draw the arc
+        self.arcs.append(self.draw_arc_with_segments(scaled_p2, scaled_p1, scaled_p3, radius=50, tag=f"arc_{angle_tag}"))
+        # Attach angle to tooltip
+        self.canvas.tag_bind(angle_tag, "<Enter>", lambda e, a=angle_value: self.add_tooltip(e.x, e.y, f"Angle: {a:.2f}°"))
+
+        # Display angle value
+        self.canvas.create_text(
+            scaled_p2[0], scaled_p2[1] - 20,
+            text=f"{angle_value:.2f}°", fill=self.text_color,
+            font=("Arial", 10), tags=(f"text_{angle_tag}", "measurement")
+        )
+
+    def canvas_path(self, points):
+        """Return points mapped to canvas coordinates as the flat list create_line and create_polygon take."""
+        points = np.asarray(points, np.float64).reshape(-1, 2) * self.zoom_level + (self.offset_x, self.offset_y)
+        return points.ravel().tolist()
+
+    def draw_shape_measurement(self, i, kind, points, metrics):
+        """Draw shape i as a single canvas item, whatever its vertex count, with its value at the centroid."""
+        shape_tag = f"shape_{i}"
+        path = self.canvas_path(points)
+        if kind == "polygon":
+            self.canvas.create_polygon(
+                path, outline=self.tolerance_color(kind, metrics["area"]), fill="", width=2, tags=(shape_tag, "measurement")
             )
-        elif measurement["type"] == "angle":
-            self.history_listbox.insert(
-                "end", f"Angle: {measurement['angle']:.2f}° between {measurement['points']}"
+        else:
+            self.canvas.create_line(
+                path, fill=self.tolerance_color(kind, metrics["length"]), width=2, tags=(shape_tag, "measurement")
             )
+        label = shape_label(kind, metrics, self.scale_factor)
+        centroid = self.scale_and_offset_point(metrics["centroid"])
+        self.canvas.create_text(
+            centroid[0], centroid[1], text=label, fill=self.text_color,
+            font=("Arial", 10), tags=(f"text_{shape_tag}", "measurement")
+        )
+        # Attach the remaining metrics to the tooltip
+        details = [label, f"{len(points)} vertices"]
+        if kind == "polygon":
+            details.append(f"Perimeter: {shape_label('polyline', metrics, self.scale_factor)}")
+        if "circle" in metrics:
+            diameter = {"length": metrics["circle"][2] * 2}
+            details.append(f"Fitted circle: {shape_label('polyline', diameter, self.scale_factor)}")
+        tooltip = ", ".join(details)
+        self.canvas.tag_bind(shape_tag, "<Enter>", lambda e, t=tooltip: self.add_tooltip(e.x, e.y, t))
+
+    def draw_pending_shape(self):
+        """Draw the vertices placed so far of the polygon or polyline being drawn as one path."""
+        path = self.canvas_path(self.measurement_points)
+        if len(path) == 2:
+            path = path * 2
+        self.canvas.create_line(path, fill=self.point_color, width=1, dash=(4, 2), tags="measurement")
+        # Mark the first vertex, clicking it closes a polygon
+        x, y = path[:2]
+        self.canvas.create_oval(x - 4, y - 4, x + 4, y + 4, outline=self.point_color, width=2, tags="measurement")
+
+    def finish_shape(self, event=None):
+        """Finish the polygon or polyline being drawn and add it as a measurement."""
+        kind = self.mode.get()
+        if kind not in ("polygon", "polyline") or not self.measurement_points:
+            return
+        points = np.asarray(self.measurement_points, np.float64)
+        # Drop repeated vertices, as left by double clicks, and a polygon's closing vertex
+        keep = np.ones(len(points), bool)
+        keep[1:] = np.hypot(*np.diff(points, axis=0).T) > 1e-6
+        points = points[keep]
+        if kind == "polygon" and len(points) > 1 and np.hypot(*(points[-1] - points[0])) <= 1e-6:
+            points = points[:-1]
+        self.measurement_points = []
+        if len(points) < (3 if kind == "polygon" else 2):
+            messagebox.showerror("Error", f"A {kind} needs at least {3 if kind == 'polygon' else 2} distinct points.")
+            self.redraw_measurements()
+            return
+        with self.perf.span("shape_metrics", "event", vertices=len(points)):
+            metrics = shape_metrics(kind, points)
+        self.redraw_measurements()
+        self.add_measurements([], [], [(kind, points.tolist(), metrics)])
 
+    def measurements_changed(self):
+        """Refresh the history list and statistics once the pending events are handled."""
+        self.history_dirty = True
+        self.drag_handles = None
+        if self.history_selection is not None:
+            group, index = self.history_selection
+            if index >= len(self.history_group(group)):
+                self.history_selection = None
+        if not self.history_scheduled:
+            self.history_scheduled = True
+            self.root.after_idle(self.render_history)
+        self.schedule_stats()
+        self.share_measurements()
+
+    def history_group(self, group):
+        return (self.lines, self.angles, self.shapes)[HISTORY_GROUPS.index(group)]
+
+    def build_history_rows(self):
+        """Work out which measurements the history lists, in which order, from the filter and sort options.
+
+        Store order with no filter needs no arrays at all; rows are found by
+        bisecting the group offsets. Otherwise the rows are selected and sorted
+        once per change with NumPy.
+        """
+        counts = [len(self.lines), len(self.angles), len(self.shapes)]
+        self.history_offsets = np.cumsum([0] + counts).tolist()
+        kind, sort = self.history_filter.get(), self.history_sort.get()
+        value_range = []
+        for entry in (self.history_min_entry, self.history_max_entry):
+            try:
+                value_range.append(float(entry.get()))
+            except ValueError:
+                value_range.append(None)
+        self.history_dirty = False
+        if kind == "all" and sort == "order" and value_range == [None, None]:
+            self.history_rows = None
+            return
+
+        group = np.repeat(np.arange(len(HISTORY_GROUPS)), counts)
+        index = np.concatenate([np.arange(count) for count in counts])
+        keep = np.ones(len(group), bool)
+        if kind in ("line", "angle"):
+            keep &= group == HISTORY_GROUPS.index(kind)
+        elif kind in ("polygon", "polyline"):
+            keep &= np.concatenate([np.zeros(counts[0] + counts[1], bool),
+                                    np.array([shape_kind == kind for shape_kind, _, _ in self.shapes], bool)])
+        if sort != "order" or value_range != [None, None]:
+            values = self.history_values()
+            if value_range[0] is not None:
+                keep &= values >= value_range[0]
+            if value_range[1] is not None:
+                keep &= values <= value_range[1]
+            if sort != "order":
+                order = np.flatnonzero(keep)
+                order = order[np.argsort(values[order], kind="stable")]
+                keep = order[::-1] if sort == "value down" else order
+        self.history_rows = (group[keep], index[keep])
+
+    def history_values(self):
+        """Return the value of every measurement in store order, in the units shown."""
+        values = measurement_values(self.lines, self.angles)
+        shape_values = np.array([
+            (metrics["area"] if kind == "polygon" else metrics["length"]) * self.display_scale(kind)
+            for kind, _, metrics in self.shapes
+        ], np.float64)
+        return np.concatenate([values["line"] * self.display_scale("line"), values["angle"], shape_values])
+
+    def history_row_count(self):
+        return self.history_offsets[-1] if self.history_rows is None else len(self.history_rows[0])
+
+    def history_row(self, row):
+        """Return the (group, index) listed in history row row."""
+        if self.history_rows is None:
+            group = bisect_right(self.history_offsets, row) - 1
+            return HISTORY_GROUPS[group], row - self.history_offsets[group]
+        return HISTORY_GROUPS[self.history_rows[0][row]], int(self.history_rows[1][row])
+
+    def history_text(self, group, i):
+        """Format history row text for measurement i of group, only ever for the visible rows."""
+        if group == "line":
+            start, end, _ = self.lines[i]
+            pixel_distance, distance_mm = line_distance(start, end, self.scale_factor)
+            value = f"{distance_mm:.3f} mm" if distance_mm is not None else f"{pixel_distance:.1f} px"
+            return f"Line {i + 1}: {value}  ({start[0]:.1f}, {start[1]:.1f}) -> ({end[0]:.1f}, {end[1]:.1f})"
+        if group == "angle":
+            p1, p2, p3, angle_value = self.angles[i]
+            return f"Angle {i + 1}: {angle_value:.2f}°  at ({p2[0]:.1f}, {p2[1]:.1f})"
+        kind, points, metrics = self.shapes[i]
+        return f"{kind.title()} {i + 1}: {shape_label(kind, metrics, self.scale_factor)}  ({len(points)} vertices)"
+
+    def render_history(self):
+        """Fill the visible history rows, rebuilding the row order first if the measurements changed."""
+        self.history_scheduled = False
+        if self.history_dirty:
+            self.build_history_rows()
+        count = self.history_row_count()
+        self.history_top = max(0, min(self.history_top, count - HISTORY_ROWS))
+        for slot, (background, text) in enumerate(self.history_row_items):
+            row = self.history_top + slot
+            if row < count:
+                measurement = self.history_row(row)
+                self.history_canvas.itemconfig(text, text=self.history_text(*measurement))
+                self.history_canvas.itemconfig(background, fill="lightblue" if measurement == self.history_selection else "")
+            else:
+                self.history_canvas.itemconfig(text, text="")
+                self.history_canvas.itemconfig(background, fill="")
+        if count > HISTORY_ROWS:
+            self.history_scrollbar.set(self.history_top / count, (self.history_top + HISTORY_ROWS) / count)
+        else:
+            self.history_scrollbar.set(0, 1)
+        total = self.history_offsets[-1]
+        self.history_count_label.config(text=f"{count} of {total}" if count != total else f"{total} measurements")
+
+    def scroll_history(self, action, amount, unit=None):
+        """Scrollbar and mouse wheel callback of the history list."""
+        if action == "moveto":
+            self.history_top = int(float(amount) * self.history_row_count())
+        else:
+            self.history_top += int(amount) * (HISTORY_ROWS if unit == "pages" else 1)
+        self.render_history()
+
+    def select_history_row(self, event):
+        """Select the clicked history row and highlight its measurement on the canvas."""
+        row = self.history_top + event.y // HISTORY_ROW_HEIGHT
+        if row >= self.history_row_count():
+            return
+        measurement = self.history_row(row)
+        self.history_selection = None if measurement == self.history_selection else measurement
+        self.highlight_selection()
+        self.render_history()
+
+    def highlight_selection(self):
+        """Draw the measurement selected in the history thicker than the rest."""
+        self.canvas.itemconfig("selected", width=2)
+        self.canvas.dtag("selected", "selected")
+        if self.history_selection is not None:
+            group, index = self.history_selection
+            self.canvas.addtag_withtag("selected", f"{group}_{index}")
+            if group == "angle":
+                self.canvas.addtag_withtag("selected", f"arc_{group}_{index}")
+            self.canvas.itemconfig("selected", width=4)
+            self.canvas.tag_raise("selected")
+
+    def add_measurements(self, lines, angles, shapes=()):
+        """Append lines, angles and shapes in bulk as one undo step, drawing only the new items."""
+        if not lines and not angles and not shapes:
+            return
+        first_line, first_angle, first_shape = len(self.lines), len(self.angles), len(self.shapes)
+        self.lines.extend(lines)
+        self.angles.extend(angles)
+        self.shapes.extend(shapes)
+        self.add_stats(lines, angles, shapes)
+        self.action_stack.append({
+                                    'type': 'measurements',
+                                    'lines': len(lines),
+                                    'angles': len(angles),
+                                    'shapes': len(shapes)
+                                })
+        with self.perf.span("draw_measurements", "render", lines=len(lines), angles=len(angles), shapes=len(shapes)):
+            if self.show_lines_var.get():
+                for i in range(first_line, len(self.lines)):
+                    self.draw_line_measurement(i, *self.lines[i])
+                for i in range(first_shape, len(self.shapes)):
+                    self.draw_shape_measurement(i, *self.shapes[i])
+            if self.show_angles_var.get():
+                for i in range(first_angle, len(self.angles)):
+                    self.draw_angle_measurement(i, *self.angles[i])
+
+    @instrumented("on_click", "event")
     def on_click(self, event):
         """Handle clicks for adding points."""
         point = [(event.x - self.offset_x) / self.zoom_level, (event.y - self.offset_y) / self.zoom_level]
+        # Pressing on the end of a measurement grabs it instead of starting a new one
+        if self.mode.get() in ("line", "angle", "polygon", "polyline") and not self.measurement_points:
+            if self.start_drag(point):
+                return
+        if self.snap_var.get():
+            point = self.snap_point(point)
         if self.mode.get() == "calibrate":
             self.calibration_points.append(point)
             if len(self.calibration_points) == 2:
                 self.calibrate()
+        elif self.mode.get() in ("detect", "fiducial"):
+            self.roi_points.append(point)
+            if len(self.roi_points) == 2:
+                if self.mode.get() == "detect":
+                    self.detect_in_roi()
+                else:
+                    self.set_fiducial()
         elif self.mode.get() == "line" and len(self.measurement_points) < 2:
             self.measurement_points.append(point)
-            self.add_to_history({"type": "point", "x": point[0], "y": point[1]})
             self.action_stack.append({
                                         'type': 'point',
                                         'data': point
@@ -306,7 +3789,165 @@ class MetrologyApp:
                                     })
             if len(self.measurement_points) == 3:
                 self.measure_angle()
+        elif self.mode.get() in ("polygon", "polyline"):
+            # Clicking next to the first vertex closes a polygon
+            first = self.measurement_points[0] if self.measurement_points else None
+            if (self.mode.get() == "polygon" and len(self.measurement_points) >= 3
+                    and np.hypot(point[0] - first[0], point[1] - first[1]) * self.zoom_level <= SNAP_RADIUS / 2):
+                self.finish_shape()
+                return
+            self.measurement_points.append(point)
         self.redraw_measurements()
+        self.update_preview(event.x, event.y)
+
+    def build_drag_handles(self):
+        """Collect every line end, angle point and shape vertex into arrays for nearest-point search."""
+        points = [
+            np.array([(*start[:2], *end[:2]) for start, end, _ in self.lines], np.float64).reshape(-1, 2),
+            np.array([(*p1[:2], *p2[:2], *p3[:2]) for p1, p2, p3, _ in self.angles], np.float64).reshape(-1, 2),
+        ] + [np.asarray(shape_points, np.float64).reshape(-1, 2) for _, shape_points, _ in self.shapes]
+        sizes = [2] * len(self.lines) + [3] * len(self.angles) + [len(shape_points) for _, shape_points, _ in self.shapes]
+        groups = [0] * len(self.lines) + [1] * len(self.angles) + [2] * len(self.shapes)
+        indices = list(range(len(self.lines))) + list(range(len(self.angles))) + list(range(len(self.shapes)))
+        sizes = np.array(sizes, np.int64)
+        starts = np.cumsum(sizes) - sizes
+        self.drag_handles = (
+            np.concatenate(points),
+            np.repeat(np.array(groups, np.int64), sizes),
+            np.repeat(np.array(indices, np.int64), sizes),
+            np.arange(sizes.sum()) - np.repeat(starts, sizes),
+        )
+
+    def start_drag(self, point):
+        """Grab the measurement point nearest to point if one is within DRAG_RADIUS on screen."""
+        if self.drag_handles is None:
+            self.build_drag_handles()
+        points, groups, indices, slots = self.drag_handles
+        if not len(points):
+            return False
+        distances = np.hypot(points[:, 0] - point[0], points[:, 1] - point[1])
+        nearest = int(distances.argmin())
+        if distances[nearest] * self.zoom_level > DRAG_RADIUS:
+            return False
+        group, index = HISTORY_GROUPS[groups[nearest]], int(indices[nearest])
+        original = self.history_group(group)[index]
+        if group == "shape":
+            # Shape vertices are moved in place, keep the originals for undo
+            original = (original[0], [list(p) for p in original[1]], original[2])
+        self.drag = {"group": group, "index": index, "slot": int(slots[nearest]), "original": original, "moved": False}
+        return True
+
+    @instrumented("drag_point", "event")
+    def drag_point(self, event):
+        """Move the grabbed point to the cursor, updating only its own measurement."""
+        if self.drag is None:
+            return
+        self.drag["moved"] = True
+        point = [(event.x - self.offset_x) / self.zoom_level, (event.y - self.offset_y) / self.zoom_level]
+        self.move_drag_point(point)
+        if self.loupe_var.get():
+            self.update_loupe(event.x, event.y)
+
+    def end_drag(self, event):
+        """Drop the grabbed point, snapping it to an edge if enabled, as one undo step."""
+        drag = self.drag
+        if drag is None:
+            return
+        if drag["moved"] and self.snap_var.get():
+            point = [(event.x - self.offset_x) / self.zoom_level, (event.y - self.offset_y) / self.zoom_level]
+            self.move_drag_point(self.snap_point(point))
+        self.drag = None
+        if not drag["moved"]:
+            return
+        group = drag["group"]
+        self.action_stack.append({
+                                    'type': f'{group}_edit',
+                                    'index': drag["index"],
+                                    group: drag["original"]
+                                })
+        self.rebuild_stats()
+        self.update_profile_window()
+
+    def move_drag_point(self, point):
+        """Put the dragged point at point, recompute its measurement and move its canvas items."""
+        group, i, slot = self.drag["group"], self.drag["index"], self.drag["slot"]
+        if group == "line":
+            ends = list(self.lines[i][:2])
+            ends[slot] = point
+            self.lines[i] = (ends[0], ends[1], line_distance(ends[0], ends[1], self.scale_factor)[1])
+            self.update_line_items(i)
+        elif group == "angle":
+            vertices = list(self.angles[i][:3])
+            vertices[slot] = point
+            self.angles[i] = (*vertices, angle_at_vertex(*vertices))
+            self.update_angle_items(i)
+        else:
+            kind, points, _ = self.shapes[i]
+            points[slot] = point
+            self.shapes[i] = (kind, points, shape_metrics(kind, points))
+            self.update_shape_items(i)
+
+    def update_line_items(self, i):
+        """Move the canvas items of line i to where it is now."""
+        start, end, distance = self.lines[i]
+        scaled_start = self.scale_and_offset_point(start)
+        scaled_end = self.scale_and_offset_point(end)
+        line_tag = f"line_{i}"
+        self.canvas.coords(line_tag, *scaled_start, *scaled_end)
+        self.canvas.itemconfig(line_tag, fill=self.tolerance_color("line", np.hypot(end[0] - start[0], end[1] - start[1])))
+        if distance is not None:
+            self.canvas.coords(f"text_{line_tag}", (scaled_start[0] + scaled_end[0]) // 2, (scaled_start[1] + scaled_end[1]) // 2)
+            self.canvas.itemconfig(f"text_{line_tag}", text=f"{distance:.2f} mm")
+            self.canvas.tag_bind(line_tag, "<Enter>", lambda e, d=distance: self.add_tooltip(e.x, e.y, f"Distance: {d:.2f} mm"))
+
+    def update_angle_items(self, i):
+        """Move the canvas items of angle i, arc included, to where it is now."""
+        p1, p2, p3, angle_value = self.angles[i]
+        scaled_p1 = self.scale_and_offset_point(p1)
+        scaled_p2 = self.scale_and_offset_point(p2)
+        scaled_p3 = self.scale_and_offset_point(p3)
+        angle_tag = f"angle_{i}"
+        color = self.tolerance_color("angle", angle_value)
+        for item, scaled_end in zip(self.canvas.find_withtag(angle_tag), (scaled_p1, scaled_p3)):
+            self.canvas.coords(item, *scaled_p2, *scaled_end)
+            self.canvas.itemconfig(item, fill=color)
+        arc_points = self.arc_points(scaled_p2, scaled_p1, scaled_p3, radius=50)
+        for item, start, end in zip(self.canvas.find_withtag(f"arc_{angle_tag}"), arc_points, arc_points[1:]):
+            self.canvas.coords(item, *start, *end)
+        self.canvas.coords(f"text_{angle_tag}", scaled_p2[0], scaled_p2[1] - 20)
+        self.canvas.itemconfig(f"text_{angle_tag}", text=f"{angle_value:.2f}°")
+        self.canvas.tag_bind(angle_tag, "<Enter>", lambda e, a=angle_value: self.add_tooltip(e.x, e.y, f"Angle: {a:.2f}°"))
+
+    def update_shape_items(self, i):
+        """Move the canvas item and label of shape i to where it is now."""
+        kind, points, metrics = self.shapes[i]
+        shape_tag = f"shape_{i}"
+        self.canvas.coords(shape_tag, self.canvas_path(points))
+        value = metrics["area"] if kind == "polygon" else metrics["length"]
+        self.canvas.itemconfig(shape_tag, **{"outline" if kind == "polygon" else "fill": self.tolerance_color(kind, value)})
+        self.canvas.coords(f"text_{shape_tag}", *self.scale_and_offset_point(metrics["centroid"]))
+        self.canvas.itemconfig(f"text_{shape_tag}", text=shape_label(kind, metrics, self.scale_factor))
+
+    def snap_point(self, point, zoom=None):
+        """Move point onto the nearest edge when there is one within reach of the cursor.
+
+        zoom sets the search radius (SNAP_RADIUS screen pixels at that zoom); the view's zoom by default.
+        """
+        zoom = zoom or self.zoom_level
+        if self.image is None:
+            return point
+        if self.edge_snapper is None:
+            self.edge_snapper = EdgeSnapper(self.pyramid)
+        with self.perf.span("snap_point", "event"):
+            if self.undistorting():
+                # Edges are searched in the raw pixels, through the same model as the view
+                height, width = self.image.shape[:2]
+                snapped = self.edge_snapper.snap(self.camera_model.to_raw([point], width, height)[0], zoom)
+                if snapped is not None:
+                    snapped = self.camera_model.to_undistorted([snapped], width, height)[0].tolist()
+            else:
+                snapped = self.edge_snapper.snap(point, zoom)
+        return snapped if snapped is not None else point
 
     def calibrate(self):
         """Set the scale factor using two calibration points."""
@@ -327,26 +3968,312 @@ class MetrologyApp:
         def set_scale():
             try:
                 known_distance = float(calibration_entry.get())
-                self.scale_factor = known_distance / pixel_distance
-                self.calibration_points.clear()
                 self.action_stack.append({
                                             'type': 'calibration',
-                                            'previous_points': self.calibration_points[:],
+                                            'previous_points': [],
                                             'previous_scale': self.scale_factor
                                         })
+                self.scale_factor = known_distance / pixel_distance
+                self.calibration_points.clear()
                 top.destroy()
+                self.refresh_tolerances()
                 messagebox.showinfo("Calibration Success", f"Scale factor set to {self.scale_factor:.4f} mm/pixel.")
             except ValueError:
                 messagebox.showerror("Error", "Invalid input. Enter a numeric value.")
 
+        def detect_ticks():
+            try:
+                tick_mm = float(calibration_entry.get())
+            except ValueError:
+                messagebox.showerror("Error", "Enter the ruler's tick spacing in mm.")
+                return
+            points = [list(p1), list(p2)]
+            image = self.image  # The image the ticks were picked on, even if another one is opened meanwhile
+            self.calibration_points.clear()
+            top.destroy()
+            self.run_in_background(
+                "detect_ruler", lambda: detect_ruler_scale(image, points[0], points[1], tick_mm),
+                lambda result: self.apply_auto_calibration(result, "ruler ticks")
+            )
+
         Button(top, text="Set Scale", command=set_scale).pack(pady=10)
+        Label(top, text="or click both ends of a ruler and enter its tick spacing (in mm):").pack(padx=10)
+        Button(top, text="Detect Ruler Ticks", command=detect_ticks).pack(pady=10)
+
+    def auto_calibrate(self):
+        """Calibrate from a checkerboard target in the image."""
+        if self.image is None:
+            messagebox.showinfo("Auto Calibrate", "Load an image of the calibration target first.")
+            return
+        top = Toplevel(self.root)
+        top.title("Auto Calibrate")
+        Label(top, text="Inner corners (columns x rows):").pack(pady=5)
+        corners_entry = Entry(top)
+        corners_entry.insert(0, "9x6")
+        corners_entry.pack(pady=5)
+        Label(top, text="Square size (in mm):").pack(pady=5)
+        square_entry = Entry(top)
+        square_entry.pack(pady=5)
+
+        def detect():
+            try:
+                pattern_size = tuple(int(n) for n in corners_entry.get().lower().split("x"))
+                square_mm = float(square_entry.get())
+                if len(pattern_size) != 2:
+                    raise ValueError
+            except ValueError:
+                messagebox.showerror("Error", "Enter corners as columns x rows (e.g. 9x6) and a numeric square size.")
+                return
+            top.destroy()
+            pyramid = self.pyramid
+            self.run_in_background(
+                "detect_checkerboard", lambda: detect_checkerboard_scale(pyramid, pattern_size, square_mm),
+                lambda result: self.apply_auto_calibration(result, "checkerboard")
+            )
+
+        Button(top, text="Detect", command=detect).pack(pady=10)
+
+    def apply_auto_calibration(self, result, target):
+        """Use a scale fitted by detect_checkerboard_scale or detect_ruler_scale."""
+        if result is None:
+            messagebox.showerror("Auto Calibrate", f"No {target} found.")
+            return
+        self.action_stack.append({
+                                    'type': 'calibration',
+                                    'previous_points': [],
+                                    'previous_scale': self.scale_factor
+                                })
+        self.scale_factor = result["scale"]
+        self.refresh_tolerances()
+        messagebox.showinfo(
+            "Calibration Success",
+            f"Scale factor set to {self.scale_factor:.6f} mm/pixel from the {target} "
+            f"(RMS residual {result['residual_mm']:.4f} mm)."
+        )
+
+    def refresh_tolerances(self):
+        """Show statistics, history and pass/fail colours in the units of a new calibration."""
+        self.measurements_changed()
+        if self.tolerances:
+            self.redraw_measurements()
+
+    def detect_in_roi(self):
+        """Ask which features to detect in the region spanned by the two clicked corners."""
+        corners = [list(point) for point in self.roi_points]
+        self.roi_points.clear()
+        if self.image is None:
+            messagebox.showinfo("Detect Features", "Load an image first.")
+            return
+        top = Toplevel(self.root)
+        top.title("Detect Features")
+        options = {}
+        for kind, text, default in (
+            ("circles", "Circles (diameter)", 1),
+            ("spacing", "Circle spacing", 1),
+            ("segments", "Line segments (length and angle)", 1),
+            ("contours", "Contours (width and height)", 0),
+        ):
+            options[kind] = IntVar(top, value=default)
+            Checkbutton(top, text=text, variable=options[kind]).pack(anchor="w", padx=10)
+
+        def detect():
+            kinds = {kind for kind, var in options.items() if var.get()}
+            top.destroy()
+            if kinds:
+                self.start_detection(corners, kinds)
+
+        Button(top, text="Detect", command=detect).pack(pady=10)
+
+    def roi_box(self, corners):
+        """Return the raw image pixel box (x0, y0, x1, y1) spanned by two clicked corners."""
+        height, width = self.image.shape[:2]
+        (ax, ay), (bx, by) = corners
+        box = np.array([[ax, ay], [bx, ay], [ax, by], [bx, by]], np.float64)
+        if self.undistorting():
+            box = self.camera_model.to_raw(box, width, height)
+        x0, y0 = np.clip(np.floor(box.min(axis=0)).astype(int), 0, (width, height))
+        x1, y1 = np.clip(np.ceil(box.max(axis=0)).astype(int), 0, (width, height))
+        return int(x0), int(y0), int(x1), int(y1)
+
+    def start_detection(self, corners, kinds):
+        """Detect features inside the corners' bounding box, one tile per worker task.
+
+        Each tile's measurements are added and drawn as soon as it finishes;
+        circle spacings need every circle and are added after the last tile.
+        """
+        x0, y0, x1, y1 = self.roi_box(corners)
+        to_view = None
+        if self.undistorting():
+            # Detection runs on the raw pixels; results are mapped back into the view
+            height, width = self.image.shape[:2]
+            camera_model = self.camera_model
+            to_view = lambda points: camera_model.to_undistorted(points, width, height)
+        if x1 - x0 < DETECT_MIN_SIZE or y1 - y0 < DETECT_MIN_SIZE:
+            messagebox.showerror("Detect Features", "Drag out a larger region.")
+            return
+
+        image, scale_factor = self.image, self.scale_factor
+        tile_kinds = kinds | {"circles"} if "spacing" in kinds else kinds
+        threshold = contour_threshold(image, (x0, y0, x1, y1)) if "contours" in kinds else None
+        tiles = detection_tiles(x0, y0, x1, y1)
+        job = {
+            "pyramid": self.pyramid, "remaining": len(tiles), "circles": [], "spacing": "spacing" in kinds,
+            "circle_lines": "circles" in kinds, "scale": scale_factor, "to_view": to_view, "lines": 0, "angles": 0,
+        }
+
+        def work(crop, core):
+            found = detect_features(image, crop, core, tile_kinds, threshold)
+            circles = found.get("circles")
+            if not job["circle_lines"]:
+                found.pop("circles", None)
+            lines, angles = feature_measurements(found, scale_factor)
+            if to_view is not None:
+                lines, angles = transform_measurements(lines, angles, to_view, scale_factor)
+            return circles, lines, angles
+
+        for crop, core in tiles:
+            self.run_in_background(
+                "detect_tile", lambda crop=crop, core=core: work(crop, core),
+                lambda result: self.add_detections(job, result)
+            )
+
+    def add_detections(self, job, result):
+        """Add the measurements of one finished detection tile."""
+        if job["pyramid"] is not self.pyramid:
+            return  # The image changed while detection was running
+        circles, lines, angles = result
+        job["remaining"] -= 1
+        if circles is not None:
+            job["circles"].append(circles)
+        if not job["remaining"] and job["spacing"] and job["circles"]:
+            centres = np.concatenate(job["circles"])[:, :2].tolist()
+            spacings = []
+            for i, j in circle_spacings(centres):
+                spacings.append((centres[i], centres[j], line_distance(centres[i], centres[j], job["scale"])[1]))
+            if job["to_view"] is not None:
+                spacings, _ = transform_measurements(spacings, [], job["to_view"], job["scale"])
+            lines = lines + spacings
+        self.add_measurements(lines, angles)
+        job["lines"] += len(lines)
+        job["angles"] += len(angles)
+        if not job["remaining"]:
+            messagebox.showinfo("Detect Features", f"Added {job['lines']} lines and {job['angles']} angles.")
+
+    def set_fiducial(self):
+        """Use the region spanned by the two clicked corners as the reference fiducial."""
+        corners = [list(point) for point in self.roi_points]
+        self.roi_points.clear()
+        if self.image is None:
+            messagebox.showinfo("Set Fiducial", "Load an image first.")
+            return
+        box = self.roi_box(corners)
+        templates = fiducial_templates(self.pyramid, box)
+        if not templates:
+            messagebox.showerror("Set Fiducial", f"Drag out a region of at least {ALIGN_MIN_TEMPLATE} pixels a side.")
+            return
+        self.fiducial = {"templates": templates, "box": box}
+        self.measurement_frame = None
+        self.redraw_measurements()
+
+    def align_to_fiducial(self):
+        """Find the fiducial in the current image and move the measurements with it."""
+        if self.fiducial is None:
+            messagebox.showinfo("Align to Fiducial", "Select a fiducial region with Set Fiducial first.")
+            return
+        if self.image is None:
+            return
+        pyramid, fiducial = self.pyramid, self.fiducial
+        self.run_in_background(
+            "register_fiducial", lambda: register_fiducial(fiducial["templates"], fiducial["box"], pyramid),
+            lambda result: self.apply_alignment(result, pyramid)
+        )
+
+    def apply_alignment(self, result, pyramid):
+        """Transform all measurements by a register_fiducial result, then snap them to edges."""
+        if pyramid is not self.pyramid:
+            return  # The image changed while registering
+        if result is None:
+            messagebox.showerror("Align to Fiducial", "Fiducial not found in this image.")
+            return
+        # The measurements are in measurement_frame; only the change since then is applied
+        matrix = np.vstack([result["matrix"], (0, 0, 1)])
+        if self.measurement_frame is not None:
+            matrix = matrix @ np.linalg.inv(np.vstack([self.measurement_frame, (0, 0, 1)]))
+        height, width = self.image.shape[:2]
+
+        def transform(points):
+            if self.undistorting():
+                points = self.camera_model.to_raw(points, width, height)
+            points = cv2.transform(np.asarray(points, np.float64).reshape(-1, 1, 2), matrix[:2]).reshape(-1, 2)
+            if self.undistorting():
+                points = self.camera_model.to_undistorted(points, width, height)
+            return points
+
+        self.action_stack.append({
+                                    'type': 'alignment',
+                                    'lines': self.lines,
+                                    'angles': self.angles,
+                                    'shapes': self.shapes,
+                                    'frame': self.measurement_frame
+                                })
+        with self.perf.span("align_measurements", "event"):
+            lines, angles = transform_measurements(self.lines, self.angles, transform, self.scale_factor)
+            shapes = transform_shapes(self.shapes, transform)
+            if self.snap_var.get():
+                # Snap within a fixed image distance, whatever the zoom
+                def snap(points):
+                    return [self.snap_point(point, zoom=1.0) for point in points.tolist()]
+
+                lines, angles = transform_measurements(lines, angles, snap, self.scale_factor)
+                shapes = transform_shapes(shapes, snap)
+        self.lines, self.angles, self.shapes = lines, angles, shapes
+        self.measurement_frame = result["matrix"]
+        self.measurement_points = []
+        self.rebuild_stats()
+        self.redraw_measurements()
+
+    def run_in_background(self, name, work, on_done, priority=PRIORITY_INTERACTIVE):
+        """Run work() on the worker pool and call on_done(result) on the Tk thread when it finishes.
+
+        Use PRIORITY_BACKGROUND for work nobody is waiting for, so it yields to interactive work.
+        """
+        def run():
+            with self.perf.span(name, "worker"):
+                try:
+                    result = work()
+                except Exception as e:
+                    result = e
+            self.background_results.put((on_done, result))
+
+        self.workers.submit(run, priority)
+        self.background_pending += 1
+        if self.background_pending == 1:
+            self.root.after(20, self.poll_background_results)
+
+    def poll_background_results(self):
+        """Deliver finished background work to its callback, polling while any is pending."""
+        while True:
+            try:
+                on_done, result = self.background_results.get_nowait()
+            except queue.Empty:
+                break
+            self.background_pending -= 1
+            if isinstance(result, Exception):
+                messagebox.showerror("Error", str(result))
+            else:
+                on_done(result)
+        if self.perf.enabled:
+            self.update_hud()  # Keep the worker queue readout live while work drains
+        if self.background_pending:
+            self.root.after(20, self.poll_background_results)
 
     def color_to_hex(self, color):
         """Convert a color name or hex value to hex format (#RRGGBB)."""
         try:
-            return to_hex(color, keep_alpha=False)
-        except ValueError:
+            red, green, blue = self.root.winfo_rgb(color)  # 16 bits per channel
+        except TclError:
             raise ValueError(f"Invalid color: {color}")
+        return f"#{red >> 8:02x}{green >> 8:02x}{blue >> 8:02x}"
 
     def hex_to_bgr(self, hex_color):
         """Convert hex color (#RRGGBB) to BGR tuple for OpenCV."""
@@ -358,80 +4285,84 @@ class MetrologyApp:
     def save_image(self):
         save_path = filedialog.asksaveasfilename(defaultextension=".png", filetypes=[("PNG files", "*.png")])
         if save_path and self.image is not None:
-            # Create a copy of the image in RGB format for PIL
-            output_image = cv2.cvtColor(self.image.copy(), cv2.COLOR_BGR2RGB)
-            pil_image = Image.fromarray(output_image)
-            draw = ImageDraw.Draw(pil_image)
-
-            # Load a font with degree symbol support
-            font_path = "arial.ttf"  # Update this path to the correct font file location on your system
-            font = ImageFont.truetype(font_path, size=20)
-
-            # Draw lines and distances
-            for start, end, distance in self.lines:
-                start_px = (int(start[0]), int(start[1]))
-                end_px = (int(end[0]), int(end[1]))
-                draw.line([start_px, end_px], fill=self.line_color, width=2)
-                if distance:
-                    midpoint = ((start_px[0] + end_px[0]) // 2, (start_px[1] + end_px[1]) // 2)
-                    draw.text(midpoint, f"{distance:.2f} mm", fill=self.text_color, font=font)
-
-            # Draw angles and arcs
-            for p1, p2, p3, angle in self.angles:
-                p1_px = (int(p1[0]), int(p1[1]))
-                p2_px = (int(p2[0]), int(p2[1]))
-                p3_px = (int(p3[0]), int(p3[1]))
-                draw.line([p2_px, p1_px], fill=self.line_color, width=2)
-                draw.line([p2_px, p3_px], fill=self.line_color, width=2)
-
-                # Draw the arc representing the angle
-                self.draw_arc_on_image(pil_image, p2_px, p1_px, p3_px)
-
-                # Add the angle text with a degree symbol
-                text_position = (p2_px[0] + 20, p2_px[1] - 20)
-                draw.text(text_position, f"{angle:.2f}°", fill=self.text_color, font=font)
-
-            # Convert back to OpenCV format (BGR) and save
-            output_image = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
-            cv2.imwrite(save_path, output_image)
-
-    def draw_arc_on_image(self, image, center, start, end, thickness=1):
-        """Draw an arc representing the smaller angle on the image."""
-        # Calculate angles in radians
-        start_angle = atan2(start[1] - center[1], start[0] - center[0])
-        end_angle = atan2(end[1] - center[1], end[0] - center[0])
+            self.run_in_background(
+                "save_image", self.annotated_image_writer(save_path), lambda result: None, PRIORITY_BACKGROUND
+            )
 
-        # Normalize angles to range [0, 2π)
-        if start_angle < 0:
-            start_angle += 2 * np.pi
-        if end_angle < 0:
-            end_angle += 2 * np.pi
+    @instrumented("save_image", "export")
+    def write_annotated_image(self, save_path):
+        """Burn the measurements into a copy of the image and write it to save_path."""
+        self.annotated_image_writer(save_path)()
 
-        # Calculate the angle span and ensure it corresponds to the smaller arc
-        angle_span = end_angle - start_angle
-        if angle_span < 0:
-            angle_span += 2 * np.pi
-        if angle_span > np.pi:
-            start_angle, end_angle = end_angle, start_angle
-            angle_span = 2 * np.pi - angle_span
-
-        # Set the radius of the arc
-        radius = int(min(
-            np.linalg.norm(np.array(start) - np.array(center)),
-            np.linalg.norm(np.array(end) - np.array(center))
-        ) * 0.25)
-
-        # Convert angles to degrees for Pillow
-        start_angle_deg = np.degrees(start_angle)
-        end_angle_deg = np.degrees(end_angle)
-
-        # Draw the arc using Pillow's drawing functionality
-        draw = ImageDraw.Draw(image)
-        bbox = [
-            (center[0] - radius, center[1] - radius),
-            (center[0] + radius, center[1] + radius)
-        ]
-        draw.arc(bbox, start=start_angle_deg, end=end_angle_deg, fill=self.line_color, width=thickness)
+    def annotated_image_writer(self, save_path):
+        """Return a function that writes the current image and measurements to save_path from any thread."""
+        image, undistort = self.image, self.undistorting()
+        lines, angles, shapes = list(self.lines), list(self.angles), list(self.shapes)
+        line_color, text_color, scale_factor = self.line_color, self.text_color, self.scale_factor
+
+        def write():
+            source = self.camera_model.undistort_image(image) if undistort else image
+            output_image = annotate_image(
+                source, lines, angles, line_color, text_color, shapes=shapes, scale_factor=scale_factor
+            )
+            if not cv2.imwrite(save_path, output_image):
+                raise OSError(f"Could not write {save_path}")
+
+        return write
+
+    def save_measurements(self):
+        """Save the current lines, angles, shapes and calibration as a reusable measurement set."""
+        save_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("Measurement sets", "*.json")])
+        if save_path:
+            fiducial = None
+            if self.fiducial is not None:
+                # Store the fiducial where it is in the image the measurements belong to
+                x0, y0, x1, y1 = self.fiducial["box"]
+                corners = np.array([[x0, y0], [x1, y0], [x0, y1], [x1, y1]], np.float64)
+                if self.measurement_frame is not None:
+                    corners = cv2.transform(corners.reshape(-1, 1, 2), self.measurement_frame).reshape(-1, 2)
+                fiducial = (*corners.min(axis=0), *corners.max(axis=0))
+            save_measurement_set(
+                save_path, self.lines, self.angles, self.scale_factor, self.line_color, self.text_color, fiducial,
+                self.shapes
+            )
+
+    def export_measurements(self):
+        """Export all lines, angles and shapes with calibration metadata to CSV, JSON Lines or Parquet."""
+        save_path = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV files", "*.csv"), ("JSON Lines", "*.jsonl"), ("Parquet (requires pyarrow)", "*.parquet")]
+        )
+        if not save_path:
+            return
+        lines, angles, shapes = list(self.lines), list(self.angles), list(self.shapes)
+        scale_factor, image_path = self.scale_factor, self.image_path
+        self.run_in_background(
+            "export_measurements",
+            lambda: export_measurements(save_path, lines, angles, scale_factor, image_path, shapes=shapes),
+            lambda rows: messagebox.showinfo("Export", f"Exported {rows} measurements to {save_path}."),
+            PRIORITY_BACKGROUND
+        )
+
+    def load_measurements(self):
+        """Load a measurement set and replace the current measurements with it."""
+        file_path = filedialog.askopenfilename(filetypes=[("Measurement sets", "*.json")])
+        if not file_path:
+            return
+        try:
+            measurement_set = load_measurement_set(file_path)
+        except (OSError, ValueError, KeyError) as e:
+            messagebox.showerror("Error", f"Could not load measurement set: {e}")
+            return
+        self.scale_factor = measurement_set["scale_factor"]
+        self.lines = measurement_set["lines"]
+        self.angles = measurement_set["angles"]
+        self.shapes = measurement_set["shapes"]
+        self.rebuild_stats()
+        self.measurement_frame = None
+        self.measurement_points = []
+        self.action_stack.clear()
+        self.redraw_measurements()
 
     def change_line_color(self):
         """Change the line color."""
@@ -439,6 +4370,7 @@ class MetrologyApp:
         if color_code:
             self.line_color = color_code
             self.redraw_measurements()
+            self.share_measurements()
 
     def change_text_color(self):
         """Change the text color."""
@@ -446,6 +4378,7 @@ class MetrologyApp:
         if color_code:
             self.text_color = color_code
             self.redraw_measurements()
+            self.share_measurements()
 
     def change_point_color(self):
         """Change the point color."""
@@ -468,12 +4401,14 @@ class MetrologyApp:
             if action_type == 'line' and self.lines:
                 # Remove the last line
                 self.lines.pop()
+                self.stats["line"].remove()
                 if len(self.action_stack) >= 2:  # Ensure there are enough items to pop
                     self.action_stack.pop()
                     self.action_stack.pop()
             elif action_type == 'angle' and self.angles:
                 # Remove the last angle and its associated arcs
                 self.angles.pop()
+                self.stats["angle"].remove()
                 if self.arcs:
                     last_arc = self.arcs.pop()  # Get the last arc group
                     for segment in last_arc:
@@ -482,6 +4417,32 @@ class MetrologyApp:
                     self.action_stack.pop()
                     self.action_stack.pop()
                     self.action_stack.pop()
+            elif action_type == 'measurements':
+                # Remove a batch added by add_measurements
+                for _ in range(last_action['lines']):
+                    self.stats["line"].remove()
+                for _ in range(last_action['angles']):
+                    self.stats["angle"].remove()
+                for kind, _, _ in reversed(self.shapes[len(self.shapes) - last_action['shapes']:]):
+                    self.stats[kind].remove()
+                del self.lines[len(self.lines) - last_action['lines']:]
+                del self.angles[len(self.angles) - last_action['angles']:]
+                del self.shapes[len(self.shapes) - last_action['shapes']:]
+            elif action_type == 'alignment':
+                # Put the measurements back where they were before aligning
+                self.lines, self.angles, self.shapes = last_action['lines'], last_action['angles'], last_action['shapes']
+                self.measurement_frame = last_action['frame']
+                self.rebuild_stats()
+            elif action_type == 'line_edit':
+                # Put an edited line back
+                self.lines[last_action['index']] = last_action['line']
+                self.rebuild_stats()
+            elif action_type == 'angle_edit':
+                self.angles[last_action['index']] = last_action['angle']
+                self.rebuild_stats()
+            elif action_type == 'shape_edit':
+                self.shapes[last_action['index']] = last_action['shape']
+                self.rebuild_stats()
             elif action_type == 'calibration':
                 # Restore the previous calibration state
                 self.calibration_points = last_action.get('previous_points', [])
@@ -492,6 +4453,7 @@ class MetrologyApp:
             messagebox.showerror("Undo Error", f"An error occurred while undoing: {str(e)}")
 
         # Redraw the canvas to reflect the undone state
+        self.measurements_changed()
         self.redraw_measurements()
 
     def clear_measurements(self):
@@ -500,9 +4462,12 @@ class MetrologyApp:
         self.display_image()
         self.calibration_points.clear()
         self.measurement_points.clear()
+        self.roi_points.clear()
         self.lines.clear()
         self.angles.clear()
+        self.shapes.clear()
         self.drawn_items.clear()
+        self.rebuild_stats()
         self.redraw_measurements()
 
     def start_pan(self, event):
@@ -511,6 +4476,7 @@ class MetrologyApp:
         self.start_y = event.y
         self.canvas.config(cursor="fleur")  # Change cursor to a grabbing hand
 
+    @instrumented("do_pan", "event")
     def do_pan(self, event):
         """Handle panning."""
         if self.start_x is not None and self.start_y is not None:
@@ -526,8 +4492,9 @@ class MetrologyApp:
         """Stop panning and reset cursor."""
         self.start_x = None
         self.start_y = None
-        self.canvas.config(cursor="cross")  # Reset cursor to default
+        self.update_cursor()  # Reset cursor to the mode's
 
+    @instrumented("on_zoom", "event")
     def on_zoom(self, event):
         """Handle zooming."""
         scale = 1.1 if event.delta > 0 else 0.9
@@ -537,7 +4504,7 @@ class MetrologyApp:
         self.display_image()
     
     def measure_angle(self):
-        """Measure the angle between three points and draw an arc representing the angle."""
+        """Measure the angle between three points and draw it with its arc."""
         if len(self.measurement_points) < 3:
             messagebox.showerror("Error", "Please select three points to measure an angle.")
             return
@@ -556,28 +4523,38 @@ class MetrologyApp:
         # Save the angle
         angle = (p1.tolist(), p2.tolist(), p3.tolist(), angle_deg)
         self.angles.append(angle)
-        self.add_to_history({"type": "angle", "points": [p1.tolist(), p2.tolist(), p3.tolist()], "angle": angle_deg})
-
-        # Draw the arc
-        arc_segments = self.draw_arc_with_segments(
-            self.scale_and_offset_point(p2), self.scale_and_offset_point(p1),
-            self.scale_and_offset_point(p3), radius=50
-        )
+        self.add_stats(angles=[angle])
 
         # Record this action for undo
         self.action_stack.append({
             'type': 'angle',
             'angle': angle,
-            'arc': arc_segments,
             'points': [p1.tolist(), p2.tolist(), p3.tolist()]  # Points associated with this angle
         })
 
-        # Clear measurement points after adding the angle
+        # Clear measurement points after adding the angle; the redraw draws its arc
         self.measurement_points = []
         self.redraw_measurements()
 
-    def draw_arc_with_segments(self, center, start, end, radius=None):
-        """Draw an arc explicitly as small line segments between start and end points."""
+    @instrumented("draw_arc_with_segments", "render")
+    def draw_arc_with_segments(self, center, start, end, radius=None, tag=None):
+        """Draw an arc explicitly as small line segments between start and end points and return their items."""
+        arc_points = self.arc_points(center, start, end, radius)
+        arc_segments = []
+        for i in range(len(arc_points) - 1):
+            x1, y1 = arc_points[i]
+            x2, y2 = arc_points[i + 1]
+            arc_segment = self.canvas.create_line(
+                x1, y1, x2, y2,
+                fill=self.line_color,
+                width=2,
+                tags=("measurement", tag) if tag else "measurement"
+            )
+            arc_segments.append(arc_segment)
+        return arc_segments
+
+    def arc_points(self, center, start, end, radius=None):
+        """Return the canvas points of the arc of the smaller angle at center between start and end."""
         start_x = start[0] - center[0]
         start_y = center[1] - start[1]  # Invert Y
         end_x = end[0] - center[0]
@@ -603,7 +4580,7 @@ class MetrologyApp:
 
         num_segments = 200
         angles = np.linspace(start_angle, end_angle, num_segments)
-        arc_points = [
+        return [
             (
                 int(center[0] + radius * np.cos(angle)),
                 int(center[1] - radius * np.sin(angle))
@@ -611,21 +4588,6 @@ class MetrologyApp:
             for angle in angles
         ]
 
-        arc_segments = []
-        for i in range(len(arc_points) - 1):
-            x1, y1 = arc_points[i]
-            x2, y2 = arc_points[i + 1]
-            arc_segment = self.canvas.create_line(
-                x1, y1, x2, y2,
-                fill=self.line_color,
-                width=2,
-                tags="measurement"
-            )
-            arc_segments.append(arc_segment)
-
-        # Save arc segments as a group
-        self.arcs.append(arc_segments)
-
     def scale_and_offset_point(self, point):
         """Scale and offset a point."""
         x = int(point[0] * self.zoom_level + self.offset_x)
@@ -660,9 +4622,7 @@ class MetrologyApp:
         # Save the line data
         line = (p1.tolist(), p2.tolist(), distance_mm)
         self.lines.append(line)
-
-        # Add to history with distance
-        self.add_to_history({"type": "line", "x1": p1[0], "y1": p1[1], "x2": p2[0], "y2": p2[1], "distance_mm": distance_mm})
+        self.add_stats(lines=[line])
 
         # Record for undo functionality
         self.action_stack.append({
@@ -677,15 +4637,106 @@ class MetrologyApp:
         # Redraw the canvas
         self.redraw_measurements()
 
-    def on_mouse_motion(self, event):
-        """Change cursor dynamically based on mode."""
+    def update_cursor(self):
+        """Set the cursor of the current mode."""
         mode_cursor = {
             "calibrate": "plus",
+            "detect": "plus",
+            "fiducial": "plus",
             "line": "cross",
-            "angle": "cross"
+            "angle": "cross",
+            "polygon": "cross",
+            "polyline": "cross"
         }
         self.canvas.config(cursor=mode_cursor.get(self.mode.get(), "arrow"))
 
+    def mode_changed(self):
+        """Change the cursor only when the mode changes, not on every motion event."""
+        self.update_cursor()
+        if self.motion_position is not None:
+            self.update_preview(*self.motion_position)
+
+    def on_mouse_motion(self, event):
+        """Note the cursor position; the loupe and preview follow it once per frame."""
+        self.motion_position = (event.x, event.y)
+        if not self.motion_scheduled:
+            self.motion_scheduled = True
+            self.root.after_idle(self.handle_motion)
+
+    def handle_motion(self):
+        """Update the loupe and preview for the latest cursor position, however many motions arrived."""
+        self.motion_scheduled = False
+        if self.motion_position is None:
+            return
+        x, y = self.motion_position
+        if self.loupe_var.get() and self.image is not None:
+            self.update_loupe(x, y)
+        self.update_preview(x, y)
+
+    def on_mouse_leave(self, event):
+        self.motion_position = None
+        self.hide_loupe()
+        if self.preview_items is not None:
+            self.canvas.itemconfig("preview", state="hidden")
+
+    @instrumented("update_preview", "event")
+    def update_preview(self, x, y):
+        """Rubber-band the measurement being placed from its last point to the cursor at canvas (x, y).
+
+        The preview is a handful of persistent canvas items that are moved with
+        coords and shown or hidden, never created per motion event.
+        """
+        if self.preview_items is None or not self.canvas.find_withtag("preview"):
+            options = {"fill": self.line_color, "width": 2, "dash": (4, 2), "state": "hidden", "tags": "preview"}
+            self.preview_items = {
+                "line": self.canvas.create_line(0, 0, 0, 0, **options),
+                "arm": self.canvas.create_line(0, 0, 0, 0, **options),
+                "arc": self.canvas.create_line(0, 0, 0, 0, fill=self.line_color, width=2, state="hidden", tags="preview"),
+                "box": self.canvas.create_rectangle(0, 0, 0, 0, outline=self.line_color, dash=(4, 2), state="hidden", tags="preview"),
+                "text": self.canvas.create_text(0, 0, text="", fill=self.text_color, font=("Arial", 10), state="hidden", tags="preview"),
+            }
+        items = self.preview_items
+        mode = self.mode.get()
+        if mode == "calibrate":
+            pending = self.calibration_points
+        elif mode in ("detect", "fiducial"):
+            pending = self.roi_points
+        else:
+            pending = self.measurement_points
+        point = [(x - self.offset_x) / self.zoom_level, (y - self.offset_y) / self.zoom_level]
+
+        shown = set()
+        if pending and self.drag is None and self.image is not None:
+            last = self.scale_and_offset_point(pending[-1])
+            if mode in ("detect", "fiducial"):
+                self.canvas.coords(items["box"], *last, x, y)
+                shown.add("box")
+            elif mode == "angle" and len(pending) == 2:
+                first = self.scale_and_offset_point(pending[0])
+                self.canvas.coords(items["arm"], *last, *first)
+                self.canvas.coords(items["line"], *last, x, y)
+                arc_points = self.arc_points(last, first, (x, y), radius=50)
+                self.canvas.coords(items["arc"], np.ravel(arc_points).tolist())
+                self.canvas.coords(items["text"], last[0], last[1] - 20)
+                self.canvas.itemconfig(items["text"], text=f"{angle_at_vertex(pending[0], pending[1], point):.2f}°")
+                shown.update(("arm", "line", "arc", "text"))
+            else:
+                self.canvas.coords(items["line"], *last, x, y)
+                pixel_distance, distance_mm = line_distance(pending[-1], point, self.scale_factor)
+                self.canvas.coords(items["text"], (last[0] + x) / 2, (last[1] + y) / 2 - 10)
+                self.canvas.itemconfig(
+                    items["text"], text=f"{distance_mm:.2f} mm" if distance_mm is not None else f"{pixel_distance:.1f} px"
+                )
+                shown.update(("line", "text"))
+                if mode == "polygon" and len(pending) >= 2:
+                    # Where the polygon would close
+                    self.canvas.coords(items["arm"], x, y, *self.scale_and_offset_point(pending[0]))
+                    shown.add("arm")
+        for name, item in items.items():
+            self.canvas.itemconfig(item, state="normal" if name in shown else "hidden")
+        if shown:
+            self.canvas.tag_raise("preview")
+
 
 if __name__ == "__main__":
     root = Tk()
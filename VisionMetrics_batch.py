@@ -0,0 +1,156 @@
+"""Apply a saved measurement set to a folder of images.
+
+Usage:
+    python VisionMetrics_batch.py template.json "parts/*.png" --output results.csv --annotated-dir annotated
+
+The results table format follows the output extension: .csv, .jsonl or .parquet.
+With --align, each image is registered to the fiducial saved in the
+measurement set and the measurements are moved with the part.
+"""
+import argparse
+import os
+import sys
+import time
+from multiprocessing import Pool, cpu_count
+
+import cv2
+import numpy as np
+
+from VisionMetrics import (
+    EdgeSnapper, MeasurementWriter, annotate_image, build_pyramid, collect_images, decode_pyramid, fiducial_templates,
+    load_font, load_measurement_set, measurement_blocks, register_fiducial, transform_measurements, transform_shapes,
+)
+
+# Per-worker state, set once by init_worker instead of being pickled per task
+_template = None
+_options = None
+_font = None
+
+
+def init_worker(template, options):
+    """Initialise a pool worker with the measurement template."""
+    global _template, _options, _font
+    _template = template
+    _options = options
+    _font = load_font()
+    # One process per core already saturates the machine; OpenCV's own
+    # threads would only compete with the other workers.
+    cv2.setNumThreads(0)
+
+
+def process_image(path):
+    """Decode, measure and optionally export one annotated image.
+
+    Returns (path, measurement blocks, error), with None for the blocks if the image could not be measured.
+    """
+    image = cv2.imread(path)
+    if image is None:
+        return path, None, "could not decode"
+
+    lines, angles, shapes = _template["lines"], _template["angles"], _template["shapes"]
+    if _options["templates"]:
+        lines, angles, shapes, error = align_measurements(build_pyramid(image), lines, angles, shapes)
+        if error:
+            return path, None, error
+    blocks = measurement_blocks(lines, angles, _template["scale_factor"], path, shapes)
+
+    if _options["annotated_dir"]:
+        name = os.path.splitext(os.path.basename(path))[0] + "_measured.png"
+        output_image = annotate_image(image, lines, angles, _template["line_color"], _template["text_color"], _font,
+                                      shapes, _template["scale_factor"])
+        cv2.imwrite(os.path.join(_options["annotated_dir"], name), output_image)
+    return path, blocks, None
+
+
+def align_measurements(pyramid, lines, angles, shapes=()):
+    """Move the template measurements onto this image's fiducial. Returns (lines, angles, shapes, error)."""
+    result = register_fiducial(_options["templates"], _template["fiducial"], pyramid)
+    if result is None:
+        return lines, angles, shapes, "fiducial not found"
+    matrix = result["matrix"]
+    scale_factor = _template["scale_factor"]
+
+    def transform(points):
+        return cv2.transform(np.asarray(points, np.float64).reshape(-1, 1, 2), matrix).reshape(-1, 2)
+
+    lines, angles = transform_measurements(lines, angles, transform, scale_factor)
+    shapes = transform_shapes(shapes, transform)
+    if _options["snap"]:
+        snapper = EdgeSnapper(pyramid)
+
+        def snap(points):
+            snapped = [snapper.snap(point, 1.0) for point in points.tolist()]
+            return np.array([s if s is not None else p for s, p in zip(snapped, points.tolist())])
+
+        lines, angles = transform_measurements(lines, angles, snap, scale_factor)
+        shapes = transform_shapes(shapes, snap)
+    return lines, angles, shapes, None
+
+
+def run_batch(template, image_paths, output_path, annotated_dir=None, workers=None, chunksize=None, templates=None,
+              snap=False):
+    """Process image_paths in a process pool, write one results table and return the elapsed time.
+
+    templates are the fiducial_templates to align every image with, or None to measure in place.
+    """
+    workers = workers or cpu_count()
+    if chunksize is None:
+        # Large enough to amortise IPC, small enough to keep every worker busy at the end
+        chunksize = max(1, len(image_paths) // (workers * 4))
+    if annotated_dir:
+        os.makedirs(annotated_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    with MeasurementWriter(output_path) as writer, \
+            Pool(workers, initializer=init_worker,
+                 initargs=(template, {"annotated_dir": annotated_dir, "templates": templates, "snap": snap})) as pool:
+        for done, (path, blocks, error) in enumerate(pool.imap(process_image, image_paths, chunksize=chunksize), 1):
+            if blocks is None:
+                print(f"\nSkipped {path}: {error}", file=sys.stderr)
+            else:
+                for block in blocks:
+                    writer.write(block)
+            if done % 50 == 0 or done == len(image_paths):
+                elapsed = time.perf_counter() - start
+                print(f"\r{done}/{len(image_paths)} images, {done / elapsed:.1f} images/s", end="", flush=True)
+    print()
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply a Vision Metrics measurement set to a folder of images.")
+    parser.add_argument("measurement_set", help="measurement set saved with 'Save Measurements'")
+    parser.add_argument("images", help="directory or glob pattern of images")
+    parser.add_argument("-o", "--output", default="results.csv", help="results table, .csv, .jsonl or .parquet (default: results.csv)")
+    parser.add_argument("--annotated-dir", help="write annotated images to this directory")
+    parser.add_argument("--scale", type=float, help="calibration in mm/pixel, overrides the measurement set")
+    parser.add_argument("-j", "--workers", type=int, help="worker processes (default: number of cores)")
+    parser.add_argument("--align", metavar="REFERENCE", help="align to the set's fiducial, cut from this reference image")
+    parser.add_argument("--snap", action="store_true", help="snap aligned measurements to nearby edges")
+    args = parser.parse_args(argv)
+
+    template = load_measurement_set(args.measurement_set, scale_factor=args.scale)
+    templates = None
+    if args.align:
+        if template.get("fiducial") is None:
+            print(f"{args.measurement_set} has no fiducial; set one before saving it", file=sys.stderr)
+            return 1
+        reference = decode_pyramid(args.align)
+        if reference is None:
+            print(f"Could not read reference image {args.align}", file=sys.stderr)
+            return 1
+        templates = fiducial_templates(reference, template["fiducial"])
+        del reference
+    image_paths = collect_images(args.images)
+    if not image_paths:
+        print(f"No images found in {args.images}", file=sys.stderr)
+        return 1
+
+    elapsed = run_batch(template, image_paths, args.output, args.annotated_dir, args.workers, templates=templates,
+                        snap=args.snap)
+    print(f"Processed {len(image_paths)} images in {elapsed:.2f} s ({len(image_paths) / elapsed:.1f} images/s) -> {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""Reproducible benchmarks for the startup, render, overlay and export paths of Vision Metrics.
+
+Usage:
+    xvfb-run -a python VisionMetrics_bench.py --save baseline.json
+    xvfb-run -a python VisionMetrics_bench.py --compare baseline.json --threshold 10
+
+Synthetic images and measurement sets are generated from a fixed seed, so runs
+on the same machine are comparable. Tk needs a display; on headless machines
+run under a virtual X server such as xvfb-run.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from tkinter import Tk, TclError
+
+import cv2
+import numpy as np
+
+from VisionMetrics import MetrologyApp
+
+DEFAULT_SIZES = "1,12,50,200"  # Megapixels
+DEFAULT_ITEMS = "10,100,1000,10000,100000"
+ZOOM_LEVELS = (0.1, 0.25, 1.0, 4.0)
+SEED = 1234
+
+# Run in a fresh interpreter: time until the window is drawn, then until the deferred imports are done
+STARTUP_SCRIPT = """
+import json, time
+start = time.perf_counter()
+from tkinter import Tk
+import VisionMetrics
+root = Tk()
+app = VisionMetrics.MetrologyApp(root)
+root.update()
+window = time.perf_counter() - start
+for alias in VisionMetrics.DEFERRED_MODULES:
+    module = getattr(VisionMetrics, alias)
+    if isinstance(module, VisionMetrics.DeferredModule):
+        module.load()
+ready = time.perf_counter() - start
+root.destroy()
+print(json.dumps({"window": window, "ready": ready}))
+"""
+
+
+def synthetic_image(megapixels, seed=SEED):
+    """Return a 4:3 BGR test image of about megapixels with texture and sharp features."""
+    width = int(np.sqrt(megapixels * 1e6 * 4 / 3))
+    height = int(width * 3 / 4)
+    rng = np.random.default_rng(seed)
+    # Upsampling a small noise image gives smooth texture without generating 200M random values
+    small = rng.integers(0, 256, (max(2, height // 64), max(2, width // 64), 3), dtype=np.uint8)
+    image = cv2.resize(small, (width, height), interpolation=cv2.INTER_LINEAR)
+    for _ in range(200):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        cv2.circle(image, center, int(rng.integers(5, max(6, width // 40))), (255, 255, 255), -1)
+    return image
+
+
+def synthetic_measurements(count, width, height, angle_fraction, seed=SEED):
+    """Return (lines, angles) with count items in total, in the tuples MetrologyApp keeps."""
+    rng = np.random.default_rng(seed + count)
+    n_angles = int(count * angle_fraction)
+    points = rng.uniform((0, 0), (width, height), size=(count - n_angles, 2, 2))
+    lines = [(start.tolist(), end.tolist(), float(np.linalg.norm(end - start)) * 0.01) for start, end in points]
+    vertices = rng.uniform((0, 0), (width, height), size=(n_angles, 3, 2))
+    angles = [(p1.tolist(), p2.tolist(), p3.tolist(), 45.0) for p1, p2, p3 in vertices]
+    return lines, angles
+
+
+def time_call(func, repeat, setup=None):
+    """Run func repeat times and return its median and minimum wall time in ms."""
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return {"median_ms": statistics.median(samples) * 1000, "min_ms": min(samples) * 1000, "repeat": repeat}
+
+
+def time_startup(repeat):
+    """Start the app repeat times in fresh interpreters and return timings until the window shows and until it is ready."""
+    samples = {"window": [], "ready": []}
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout
+        for name, seconds in json.loads(output.splitlines()[-1]).items():
+            samples[name].append(seconds)
+    return {
+        name: {"median_ms": statistics.median(values) * 1000, "min_ms": min(values) * 1000, "repeat": repeat}
+        for name, values in samples.items()
+    }
+
+
+def run_benchmarks(app, root, sizes, item_counts, repeat, angle_fraction, workdir):
+    """Time every benchmarked path and return {name: timing}."""
+    results = {}
+
+    def report(name, timing):
+        results[name] = timing
+        print(f"{name:<52}{timing['median_ms']:>12.2f} ms  (min {timing['min_ms']:.2f})", flush=True)
+
+    for name, timing in time_startup(repeat).items():
+        report(f"startup[{name}]", timing)
+
+    def display():
+        app.display_image()
+        root.update_idletasks()
+
+    for megapixels in sizes:
+        image = synthetic_image(megapixels)
+        path = os.path.join(workdir, f"bench_{megapixels}mp.png")
+        cv2.imwrite(path, image)
+        del image
+        app.lines, app.angles = [], []
+
+        report(f"load_image[{megapixels}MP]", time_call(lambda: app.open_image(path), repeat))
+        height, width = app.image.shape[:2]
+        canvas_width, canvas_height = app.canvas.winfo_width(), app.canvas.winfo_height()
+        for zoom in ZOOM_LEVELS:
+            def centre_view(zoom=zoom):
+                app.zoom_level = zoom
+                app.offset_x = canvas_width / 2 - width * zoom / 2
+                app.offset_y = canvas_height / 2 - height * zoom / 2
+            report(f"display_image[{megapixels}MP,zoom={zoom}]", time_call(display, repeat, centre_view))
+
+        lines, angles = synthetic_measurements(100, width, height, angle_fraction)
+        app.lines, app.angles = lines, angles
+        save_path = os.path.join(workdir, "bench_saved.png")
+        report(f"save_image[{megapixels}MP,100 items]", time_call(lambda: app.write_annotated_image(save_path), repeat))
+
+    # Overlay cost does not depend on the image size, only on the item count
+    app.zoom_level, app.offset_x, app.offset_y = 0.1, 0, 0
+    height, width = app.image.shape[:2]
+    for count in item_counts:
+        app.lines, app.angles = synthetic_measurements(count, width, height, angle_fraction)
+
+        def redraw():
+            app.redraw_measurements()
+            root.update_idletasks()
+        report(f"redraw_measurements[{count} items]", time_call(redraw, repeat))
+
+    app.lines, app.angles = [], []
+    app.canvas.delete("measurement")
+    report("draw_arc_with_segments[x100]", time_call(
+        lambda: [app.draw_arc_with_segments((400, 400), (500, 400), (400, 300), radius=50) for _ in range(100)],
+        repeat, setup=lambda: (app.canvas.delete("measurement"), app.arcs.clear())
+    ))
+    return results
+
+
+def compare_results(results, baseline, threshold, min_ms):
+    """Print the change against baseline and return the names that got more than threshold% slower."""
+    regressions = []
+    print(f"\n{'benchmark':<52}{'baseline':>12}{'current':>12}{'change':>9}")
+    for name, timing in results.items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            continue
+        change = timing["median_ms"] / base["median_ms"] - 1 if base["median_ms"] else 0.0
+        # Ignore sub-millisecond jitter on very fast paths
+        slower = change * 100 > threshold and timing["median_ms"] - base["median_ms"] > min_ms
+        print(f"{name:<52}{base['median_ms']:>10.2f}ms{timing['median_ms']:>10.2f}ms{change:>+8.0%}{'  REGRESSION' if slower else ''}")
+        if slower:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Vision Metrics startup, render, overlay and export paths.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"image sizes in megapixels (default: {DEFAULT_SIZES})")
+    parser.add_argument("--items", default=DEFAULT_ITEMS, help=f"measurement set sizes (default: {DEFAULT_ITEMS})")
+    parser.add_argument("--angle-fraction", type=float, default=0.01, help="share of angles in measurement sets (default: 0.01)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per benchmark, the median is reported (default: 5)")
+    parser.add_argument("--save", help="write the results to this JSON baseline")
+    parser.add_argument("--compare", help="compare against this JSON baseline")
+    parser.add_argument("--threshold", type=float, default=10.0, help="fail when a path is more than this %% slower (default: 10)")
+    parser.add_argument("--min-ms", type=float, default=0.5, help="ignore slowdowns smaller than this many ms (default: 0.5)")
+    args = parser.parse_args(argv)
+
+    sizes = [float(size) if "." in size else int(size) for size in args.sizes.split(",")]
+    item_counts = [int(count) for count in args.items.split(",")]
+
+    try:
+        root = Tk()
+    except TclError as e:
+        print(f"Tk needs a display ({e}). Run under a virtual X server, e.g. xvfb-run -a python {sys.argv[0]}", file=sys.stderr)
+        return 2
+    app = MetrologyApp(root)
+    root.update()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results = run_benchmarks(app, root, sizes, item_counts, args.repeat, args.angle_fraction, workdir)
+    root.destroy()
+
+    output = {
+        "meta": {
+            "python": platform.python_version(), "platform": platform.platform(), "machine": platform.machine(),
+            "opencv": cv2.__version__, "numpy": np.__version__, "cpu_count": os.cpu_count(), "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(output, f, indent=2)
+        print(f"\nSaved results to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.threshold, args.min_ms)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) more than {args.threshold:g}% slower than {args.compare}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
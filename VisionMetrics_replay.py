@@ -0,0 +1,140 @@
+"""Replay a recorded input session against MetrologyApp and measure interaction latency.
+
+Record a session in the app with "Record Input", then:
+    xvfb-run -a python VisionMetrics_replay.py session.json --output latency.json
+
+Each event is fed through the canvas bindings with event_generate, and its
+latency runs from when it was due until the resulting frame has been drawn
+(all idle-time redraws flushed). Events are replayed at their recorded pace
+unless --fast is given, so slow frames delay the events behind them exactly
+as they would for the operator.
+"""
+import argparse
+import json
+import sys
+import time
+from tkinter import Tk, TclError
+
+import numpy as np
+
+import VisionMetrics
+from VisionMetrics import INPUT_SESSION_VERSION, MetrologyApp
+
+
+class _QuietMessagebox:
+    """Stands in for tkinter.messagebox so modal dialogs don't stall the replay."""
+
+    def __getattr__(self, name):
+        def show(title=None, message=None, **kwargs):
+            print(f"[{name}] {title}: {message}", file=sys.stderr)
+            return True
+        return show
+
+
+def replay(app, root, events, speed=1.0):
+    """Replay events and return {sequence: [latency seconds, ...]}. speed=None replays as fast as possible."""
+    latencies = {}
+    start = time.perf_counter()
+    for i, (t, sequence, x, y, delta, state) in enumerate(events):
+        due = start + t / speed if speed else time.perf_counter()
+        now = time.perf_counter()
+        while now < due:
+            time.sleep(min(due - now, 0.001))
+            now = time.perf_counter()
+
+        # Tk compresses motion events that queue up behind a slow frame; do the same
+        if speed and sequence == "<Motion>" and i + 1 < len(events):
+            next_t, next_sequence, *_, next_state = events[i + 1]
+            if next_sequence == "<Motion>" and next_state == state and start + next_t / speed <= now:
+                continue
+
+        options = {"x": x, "y": y, "state": state, "when": "now"}
+        if sequence == "<MouseWheel>":
+            options["delta"] = delta
+        app.canvas.event_generate(sequence, **options)
+        root.update_idletasks()
+        latencies.setdefault(sequence, []).append(time.perf_counter() - due)
+    return latencies
+
+
+def summarize(latencies):
+    """Return latency percentiles in ms per event sequence and over all events."""
+    groups = dict(latencies)
+    groups["all"] = [value for values in latencies.values() for value in values]
+    summary = {}
+    for sequence, values in groups.items():
+        if not values:
+            continue
+        ms = np.array(values) * 1000
+        summary[sequence] = {
+            "count": len(ms),
+            "p50_ms": float(np.percentile(ms, 50)),
+            "p95_ms": float(np.percentile(ms, 95)),
+            "p99_ms": float(np.percentile(ms, 99)),
+            "max_ms": float(ms.max()),
+        }
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a Vision Metrics input session and report latency.")
+    parser.add_argument("session", help="session saved with 'Record Input'")
+    parser.add_argument("--image", help="image to replay against (default: the one recorded)")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed factor (default: 1.0)")
+    parser.add_argument("--fast", action="store_true", help="replay back to back, ignoring the recorded timing")
+    parser.add_argument("--output", help="write the latency summary to this JSON file")
+    parser.add_argument("--trace", help="also record a Chrome trace of the replay to this file")
+    args = parser.parse_args(argv)
+
+    with open(args.session) as f:
+        session = json.load(f)
+    if session.get("version", 1) > INPUT_SESSION_VERSION:
+        print(f"Unsupported session version: {session['version']}", file=sys.stderr)
+        return 1
+    image_path = args.image or session["image"]
+    if not image_path:
+        print("The session has no image, pass one with --image", file=sys.stderr)
+        return 1
+
+    try:
+        root = Tk()
+    except TclError as e:
+        print(f"Tk needs a display ({e}). Run under a virtual X server, e.g. xvfb-run -a python {sys.argv[0]}", file=sys.stderr)
+        return 2
+    VisionMetrics.messagebox = _QuietMessagebox()
+    app = MetrologyApp(root)
+    root.update()
+    app.open_image(image_path)
+    if app.image is None:
+        return 1
+    view = session["view"]
+    app.zoom_level, app.offset_x, app.offset_y = view["zoom"], view["offset_x"], view["offset_y"]
+    app.mode.set(session["mode"])
+    app.display_image()
+    root.update()
+    canvas_size = [app.canvas.winfo_width(), app.canvas.winfo_height()]
+    if canvas_size != session["canvas"]:
+        print(f"Canvas is {canvas_size[0]}x{canvas_size[1]}, the session was recorded at "
+              f"{session['canvas'][0]}x{session['canvas'][1]}; frame costs may differ", file=sys.stderr)
+
+    if args.trace:
+        app.perf.start_trace()
+    latencies = replay(app, root, session["events"], None if args.fast else args.speed)
+    if args.trace:
+        app.perf.stop_trace()
+        app.perf.write_trace(args.trace)
+    root.destroy()
+
+    summary = summarize(latencies)
+    print(f"{'event':<20}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for sequence, stats in summary.items():
+        print(f"{sequence:<20}{stats['count']:>7}{stats['p50_ms']:>8.1f}ms{stats['p95_ms']:>8.1f}ms"
+              f"{stats['p99_ms']:>8.1f}ms{stats['max_ms']:>8.1f}ms")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"session": args.session, "image": image_path, "latency": summary}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
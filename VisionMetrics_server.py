@@ -0,0 +1,58 @@
+"""Serve an image and its measurements to browsers for review, without the Tk app.
+
+Usage:
+    python VisionMetrics_server.py part.png --measurements template.json --host 0.0.0.0
+
+Reviewers open the printed URL and pan and zoom the image with the
+measurements drawn on top. Tiles are cut from one decode of the image and
+cached in memory, so any number of reviewers can share it. The server only
+listens on this machine unless --host opens it to the LAN.
+"""
+import argparse
+import os
+import sys
+
+from VisionMetrics import TILE_SERVER_PORT, TileServer, WorkerPool, decode_pyramid, load_measurement_set
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve an image and its measurements to browsers for review.")
+    parser.add_argument("image", help="image to serve")
+    parser.add_argument("-m", "--measurements", help="measurement set saved with 'Save Measurements' to draw on top")
+    parser.add_argument("--scale", type=float, help="calibration in mm/pixel, overrides the measurement set")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on, 0.0.0.0 for the LAN (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=TILE_SERVER_PORT, help=f"port to listen on (default: {TILE_SERVER_PORT})")
+    parser.add_argument("-j", "--workers", type=int, help="tile encoding threads (default: number of cores)")
+    args = parser.parse_args(argv)
+
+    pyramid = decode_pyramid(args.image)
+    if pyramid is None:
+        print(f"Could not read image {args.image}", file=sys.stderr)
+        return 1
+    template = None
+    if args.measurements:
+        try:
+            template = load_measurement_set(args.measurements, scale_factor=args.scale)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Could not load measurement set {args.measurements}: {e}", file=sys.stderr)
+            return 1
+    try:
+        server = TileServer(WorkerPool(args.workers), args.host, args.port)
+    except OSError as e:
+        print(f"Could not listen on {args.host}:{args.port}: {e}", file=sys.stderr)
+        return 1
+    server.set_image(pyramid, os.path.basename(args.image))
+    if template is not None:
+        server.set_measurements(template["lines"], template["angles"], template["shapes"], template["scale_factor"],
+                                template.get("line_color", "blue"), template.get("text_color", "yellow"))
+
+    print(f"Serving {args.image} at {server.url}, press Ctrl+C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+import cv2
+import numpy as np
+import pytest
+
+from VisionMetrics import build_pyramid, fiducial_templates, register_fiducial
+
+BOX = (900, 700, 1200, 1000)  # 300 px fiducial near the centre of the reference
+
+
+def synthetic_part(seed=7, size=(1800, 2400)):
+    """Return a BGR image with smooth texture and sharp shapes that ORB and template matching can lock onto."""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, (size[0] // 32, size[1] // 32), dtype=np.uint8)
+    image = cv2.resize(small, size[::-1], interpolation=cv2.INTER_CUBIC)
+    for _ in range(400):
+        x, y = int(rng.integers(0, size[1])), int(rng.integers(0, size[0]))
+        w, h = int(rng.integers(5, 40)), int(rng.integers(5, 40))
+        cv2.rectangle(image, (x, y), (x + w, y + h), int(rng.integers(0, 256)), -1)
+    return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+
+
+def register(reference, moved):
+    return register_fiducial(fiducial_templates(build_pyramid(reference), BOX), BOX, build_pyramid(moved))
+
+
+def frame_points(shape):
+    height, width = shape[:2]
+    xs, ys = np.meshgrid(np.linspace(0, width - 1, 7), np.linspace(0, height - 1, 7))
+    return np.column_stack([xs.ravel(), ys.ravel(), np.ones(xs.size)])
+
+
+def test_translation_is_reproduced_across_the_frame():
+    reference = synthetic_part()
+    shift = np.array([[1.0, 0.0, 37.4], [0.0, 1.0, -21.7]])
+    moved = cv2.warpAffine(reference, shift, reference.shape[1::-1], flags=cv2.INTER_CUBIC)
+    result = register(reference, moved)
+    assert result is not None
+    points = frame_points(reference.shape)
+    error = np.hypot(*(points @ result["matrix"].T - points @ shift.T).T)
+    assert error.max() < 0.15
+
+
+@pytest.mark.parametrize("degrees", [-3.0, -1.0, 0.3, 2.0])
+def test_rotation_is_applied_when_significant(degrees):
+    reference = synthetic_part()
+    centre = ((BOX[0] + BOX[2]) / 2, (BOX[1] + BOX[3]) / 2)
+    motion = cv2.getRotationMatrix2D(centre, degrees, 1.0)
+    motion[:, 2] += (12.3, 8.6)
+    moved = cv2.warpAffine(reference, motion, reference.shape[1::-1], flags=cv2.INTER_CUBIC)
+    result = register(reference, moved)
+    assert result is not None and result["inliers"] > 0
+    points = frame_points(reference.shape)
+    error = np.hypot(*(points @ result["matrix"].T - points @ motion.T).T)
+    assert error.max() < 1.0
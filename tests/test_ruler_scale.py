@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from VisionMetrics import detect_ruler_scale
+
+
+def synthetic_ruler(period, length=1200, height=60, missing=(), seed=0):
+    """Return a BGR image of dark Gaussian ticks every period pixels on a light background, with some noise."""
+    x = np.arange(length)[None, :]
+    image = np.full((height, length), 200.0)
+    for number in range(int(length / period) + 1):
+        if number not in missing:
+            image -= 150 * np.exp(-0.5 * ((x - 20 - number * period) / 1.2) ** 2)
+    image += np.random.default_rng(seed).normal(0, 3, image.shape)
+    return np.dstack([np.clip(image, 0, 255).astype(np.uint8)] * 3)
+
+
+@pytest.mark.parametrize("period", [8.6, 10.0, 12.7, 17.35, 25.3, 31.4, 40.0])
+@pytest.mark.parametrize("missing", [(), (7, 20)])
+def test_non_integer_tick_spacing(period, missing):
+    result = detect_ruler_scale(synthetic_ruler(period, missing=missing), (5, 30), (1190, 30), tick_mm=1.0)
+    assert result is not None
+    assert result["scale"] * period == pytest.approx(1.0, abs=1e-3)
+    assert result["residual_mm"] < 0.01
+
+
+def test_flat_profile_has_no_ruler():
+    image = np.full((60, 400, 3), 128, np.uint8)
+    assert detect_ruler_scale(image, (5, 30), (390, 30), tick_mm=1.0) is None